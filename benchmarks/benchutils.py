@@ -0,0 +1,55 @@
+"""Helpers shared by the benchmarks and the soak test."""
+import os
+import json
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+res_path = os.path.join(here, '..', 'tests', 'res')
+
+
+def percentile(values, q):
+    """Returns the `q` quantile (between 0 and 1) of the values with the
+    nearest rank method or 0 if there are no values.
+    """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def load_reports(ext=True):
+    """Returns a list of ``(dsym_paths, binary_images, backtraces)`` for
+    the fixture reports and, if `ext` is enabled, the crashprobe reports
+    in ``tests/res/ext`` when present.
+    """
+    rv = []
+    for filename, bundle in ('crash-report.json', 'Crash-Tester.app.dSYM'), \
+            ('swift-crash-report.json', 'Swift-Tester.app.dSYM'):
+        with open(os.path.join(res_path, filename)) as f:
+            report = json.load(f)
+        rv.append(([os.path.join(res_path, bundle)],
+                   report['binary_images'],
+                   [thread['backtrace']['contents']
+                    for thread in report['crash']['threads']
+                    if thread.get('backtrace')]))
+    if not ext:
+        return rv
+
+    ext_path = os.path.join(res_path, 'ext')
+    for dirpath, dirnames, filenames in sorted(os.walk(ext_path)):
+        dsyms_folder = os.path.join(os.path.dirname(dirpath), 'dSYMs')
+        if not os.path.isdir(dsyms_folder):
+            continue
+        dsym_paths = [os.path.join(dsyms_folder, x)
+                      for x in sorted(os.listdir(dsyms_folder))
+                      if x.endswith('.dSYM')]
+        for filename in sorted(filenames):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(dirpath, filename)) as f:
+                report = json.load(f)
+            rv.append((dsym_paths, report['debug_meta']['images'],
+                       [exc['stacktrace']['frames'][::-1]
+                        for exc in report['exception']['values']
+                        if exc.get('stacktrace')]))
+    return rv
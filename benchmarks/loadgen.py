@@ -0,0 +1,349 @@
+"""Generates synthetic crash reports from dSYMs and replays them against
+the symbolizer to measure how symbolication scales.
+
+Reports are built from the variants and the function symbols of the
+given dSYM bundles (the bundled fixtures by default) and written in the
+format understood by `symsynd.batch`::
+
+    $ python benchmarks/loadgen.py generate -n 1000 -o reports.jsonl
+
+Replaying sends the reports at one or more target rates to a pool of
+threads or processes and prints throughput and latency percentiles for
+every rate.  Latencies are measured from the time a report was scheduled
+so that a saturated symbolizer shows up as queueing delay::
+
+    $ python benchmarks/loadgen.py replay reports.jsonl -r 50,100,200 -w 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import bisect
+import argparse
+import threading
+import multiprocessing
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from symsynd.libdebug import DebugInfo, get_cpu_name, \
+    get_cpu_type_tuple
+from symsynd.symbolizer import Symbolizer
+from symsynd.report import ReportSymbolizer
+from symsynd.slim import iter_slices, iter_symbols, get_cpu_type
+
+from benchutils import res_path, percentile
+
+
+DEFAULT_DSYM_PATHS = [
+    os.path.join(res_path, 'Crash-Tester.app.dSYM'),
+    os.path.join(res_path, 'Swift-Tester.app.dSYM'),
+]
+
+N_STAB = 0xe0
+N_TYPE = 0x0e
+N_SECT = 0x0e
+
+
+def read_function_addrs(path):
+    """Returns a dictionary of CPU name to the sorted start addresses of
+    the functions in the symbol table of a Mach-O file.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    rv = {}
+    for offset, size in iter_slices(data):
+        macho = data[offset:offset + size]
+        addrs = set()
+        for n_type, n_sect, n_value in iter_symbols(macho):
+            # The first section is __TEXT,__text
+            if not n_type & N_STAB and n_type & N_TYPE == N_SECT \
+               and n_sect == 1:
+                addrs.add(n_value)
+        rv[get_cpu_name(*get_cpu_type(macho))] = sorted(addrs)
+    return rv
+
+
+class Image(object):
+    """An image that can appear in a generated report."""
+
+    def __init__(self, name, uuid, cpu_name, vmaddr, vmsize, functions):
+        self.name = name
+        self.uuid = uuid
+        self.cpu_name = cpu_name
+        self.vmaddr = vmaddr
+        self.vmsize = vmsize
+        self.functions = functions
+
+
+def load_images(dsym_paths):
+    """Returns all variants of the debug files in the given dSYM bundles
+    that have functions in their symbol table.
+    """
+    rv = []
+    for dsym_path in dsym_paths:
+        dwarf_base = os.path.join(dsym_path, 'Contents', 'Resources', 'DWARF')
+        for fn in sorted(os.listdir(dwarf_base)):
+            path = os.path.join(dwarf_base, fn)
+            functions = read_function_addrs(path)
+            di = DebugInfo.open_path(path)
+            try:
+                variants = di.get_variants()
+            finally:
+                di.close()
+            for variant in variants:
+                addrs = [x for x in functions.get(variant.cpu_name, ())
+                         if variant.vmaddr <= x <
+                         variant.vmaddr + variant.vmsize]
+                if addrs:
+                    rv.append(Image(fn, str(variant.uuid), variant.cpu_name,
+                                    variant.vmaddr, variant.vmsize, addrs))
+    return rv
+
+
+def make_system_image(rng, cpu_name, idx):
+    """Makes an image without debug information like the system libraries
+    in real reports.
+    """
+    vmsize = rng.randrange(0x10, 0x400) * 0x1000
+    functions = sorted(rng.sample(range(0, vmsize, 16), 256))
+    uuid = '%08x-0000-4000-8000-%012x' % (rng.getrandbits(32),
+                                          rng.getrandbits(48))
+    return Image('/usr/lib/system/libsynthetic%d.dylib' % idx, uuid,
+                 cpu_name, 0, vmsize, functions)
+
+
+class ReportGenerator(object):
+    """Generates reports from a list of images.
+
+    `threads` and `depth` control the number of backtraces and frames
+    per report, `recursion` is the probability that a frame recurses a
+    few times and `system_images` the number of images without debug
+    information per report.  Functions are picked with a Zipf
+    distribution with exponent `skew` so that a higher skew concentrates
+    the frames on fewer addresses.
+    """
+
+    def __init__(self, images, threads=8, depth=20, recursion=0.02,
+                 system_images=5, skew=1.0, seed=None):
+        self.rng = random.Random(seed)
+        self.images = {}
+        for image in images:
+            self.images.setdefault(image.cpu_name, []).append(image)
+        self.threads = threads
+        self.depth = depth
+        self.recursion = recursion
+        self.system_images = system_images
+        self.skew = skew
+        self._weights = {}
+
+    def _pick_function(self, image):
+        weights = self._weights.get(len(image.functions))
+        if weights is None:
+            weights = []
+            total = 0.0
+            for rank in range(len(image.functions)):
+                total += 1.0 / (rank + 1) ** self.skew
+                weights.append(total)
+            self._weights[len(image.functions)] = weights
+        idx = bisect.bisect_left(weights, self.rng.random() * weights[-1])
+        return image.functions[min(idx, len(image.functions) - 1)]
+
+    def _make_frame(self, image, image_addr):
+        func = self._pick_function(image)
+        offset = 4 + self.rng.randrange(0, 64, 2)
+        end = image.vmaddr + image.vmsize
+        addr = min(func + offset, end - 1)
+        return {'instruction_addr': image_addr + addr - image.vmaddr}
+
+    def generate(self):
+        """Returns a new report."""
+        rng = self.rng
+        cpu_name = rng.choice(sorted(self.images))
+        cpu_type, cpu_subtype = get_cpu_type_tuple(cpu_name)
+        images = list(self.images[cpu_name]) + [
+            make_system_image(rng, cpu_name, idx)
+            for idx in range(self.system_images)]
+
+        loaded = []
+        addr = rng.randrange(0x10, 0x100) * 0x100000
+        for image in images:
+            loaded.append((image, addr))
+            addr += image.vmsize + rng.randrange(1, 16) * 0x1000
+
+        binary_images = [{
+            'image_addr': image_addr,
+            'image_size': image.vmsize,
+            'image_vmaddr': image.vmaddr,
+            'cpu_type': cpu_type,
+            'cpu_subtype': cpu_subtype,
+            'uuid': image.uuid.upper(),
+            'name': image.name,
+        } for image, image_addr in loaded]
+
+        backtraces = []
+        for _ in range(self.threads):
+            backtrace = []
+            while len(backtrace) < self.depth:
+                frame = self._make_frame(*rng.choice(loaded))
+                repeat = 1
+                if rng.random() < self.recursion:
+                    repeat = rng.randrange(2, 10)
+                backtrace.extend(dict(frame) for _ in range(repeat))
+            backtraces.append(backtrace[:self.depth])
+
+        return {
+            'binary_images': binary_images,
+            'backtraces': backtraces,
+        }
+
+
+_worker_symbolizer = None
+_worker_dsym_paths = None
+
+
+def _init_worker(dsym_paths):
+    global _worker_symbolizer, _worker_dsym_paths
+    _worker_symbolizer = Symbolizer()
+    _worker_dsym_paths = dsym_paths
+
+
+def _process_report(args):
+    report, scheduled = args
+    delay = scheduled - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    rep = ReportSymbolizer(_worker_symbolizer, _worker_dsym_paths,
+                           report['binary_images'])
+    rep.symbolize_backtraces(report['backtraces'])
+    return time.time() - scheduled
+
+
+def replay(reports, dsym_paths, rate, workers=4, processes=False):
+    """Replays reports at a target rate in reports per second and returns
+    a dictionary with the achieved throughput and latency percentiles.
+    """
+    start = time.time() + 0.1
+    jobs = [(report, start + idx / float(rate))
+            for idx, report in enumerate(reports)]
+
+    if processes:
+        pool = multiprocessing.Pool(workers, _init_worker, (dsym_paths,))
+        try:
+            latencies = pool.map(_process_report, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(dsym_paths)
+        queue = Queue()
+        latencies = []
+        lock = threading.Lock()
+
+        def run():
+            while 1:
+                job = queue.get()
+                if job is None:
+                    break
+                latency = _process_report(job)
+                with lock:
+                    latencies.append(latency)
+
+        threads = [threading.Thread(target=run) for _ in range(workers)]
+        for t in threads:
+            t.start()
+        for job in jobs:
+            queue.put(job)
+        for t in threads:
+            queue.put(None)
+        for t in threads:
+            t.join()
+        _worker_symbolizer.close()
+
+    duration = time.time() - start
+    return {
+        'rate': rate,
+        'throughput': len(reports) / duration,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'p999': percentile(latencies, 0.999),
+        'max': max(latencies or [0.0]),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Generates and replays '
+                                     'synthetic crash reports.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    gen = subparsers.add_parser('generate', help='Generates reports.')
+    gen.add_argument('-d', '--dsym-path', dest='dsym_paths',
+                     action='append', help='A dSYM bundle to build reports '
+                     'from.  Defaults to the test fixtures.')
+    gen.add_argument('-n', '--count', type=int, default=1000)
+    gen.add_argument('--threads', type=int, default=8)
+    gen.add_argument('--depth', type=int, default=20)
+    gen.add_argument('--recursion', type=float, default=0.02)
+    gen.add_argument('--system-images', type=int, default=5)
+    gen.add_argument('--skew', type=float, default=1.0)
+    gen.add_argument('--seed', type=int, default=0)
+    gen.add_argument('-o', '--output', default='-')
+
+    rep = subparsers.add_parser('replay', help='Replays reports.')
+    rep.add_argument('input')
+    rep.add_argument('-d', '--dsym-path', dest='dsym_paths',
+                     action='append')
+    rep.add_argument('-r', '--rates', default='50,100,200',
+                     help='Comma separated target rates in reports per '
+                     'second.')
+    rep.add_argument('-w', '--workers', type=int, default=4)
+    rep.add_argument('-p', '--processes', action='store_true',
+                     help='Use processes instead of threads.')
+    rep.add_argument('-o', '--output',
+                     help='A file to write the results to as JSON.')
+    args = parser.parse_args(args)
+
+    dsym_paths = args.dsym_paths or DEFAULT_DSYM_PATHS
+
+    if args.command == 'generate':
+        generator = ReportGenerator(
+            load_images(dsym_paths), threads=args.threads, depth=args.depth,
+            recursion=args.recursion, system_images=args.system_images,
+            skew=args.skew, seed=args.seed)
+        out = args.output == '-' and sys.stdout or open(args.output, 'w')
+        try:
+            for _ in range(args.count):
+                out.write(json.dumps(generator.generate()) + '\n')
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    elif args.command == 'replay':
+        with open(args.input) as f:
+            reports = [json.loads(line) for line in f if line.strip()]
+        results = []
+        for rate in [float(x) for x in args.rates.split(',')]:
+            result = replay(reports, dsym_paths, rate, args.workers,
+                            args.processes)
+            results.append(result)
+            sys.stdout.write(
+                'rate=%(rate)g/s throughput=%(throughput).1f/s '
+                'p50=%(p50).4fs p90=%(p90).4fs p99=%(p99).4fs '
+                'p999=%(p999).4fs max=%(max).4fs\n' % result)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
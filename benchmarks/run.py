@@ -0,0 +1,232 @@
+"""Benchmarks for symsynd.  This measures module loads, single frame
+latency, report throughput, demangling and image lookup against the
+fixtures in ``tests/res`` and writes the results as JSON::
+
+    $ python benchmarks/run.py -o results.json
+
+If a baseline is given the results are compared against it and the
+process exits with a non zero status if a metric regressed by more than
+the threshold::
+
+    $ python benchmarks/run.py --baseline benchmarks/baseline.json
+
+The crashprobe reports in ``tests/res/ext`` are included when present.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from symsynd.symbolizer import Symbolizer
+from symsynd.report import ReportSymbolizer
+from symsynd.images import find_debug_images
+from symsynd.demangle import demangle_symbol
+
+from benchutils import res_path, load_reports, percentile
+
+
+# Whether larger values of a metric are better.  All other metrics are
+# durations or sizes where smaller is better.
+HIGHER_IS_BETTER = frozenset([
+    'report.frames_per_sec',
+    'demangle.ops_per_sec',
+])
+
+CRASH_TESTER = os.path.join(
+    res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources', 'DWARF',
+    'Crash-Tester')
+CRASH_TESTER_FRAME = {
+    'dsym_path': CRASH_TESTER,
+    'image_vmaddr': 16384,
+    'image_addr': 749568,
+    'cpu_name': 'armv7',
+}
+CRASH_TESTER_ADDRS = [782745, 801763, 794881]
+
+
+def timeit(func, repeat):
+    rv = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        rv.append(time.time() - start)
+    return rv
+
+
+def get_peak_rss():
+    if resource is None:
+        return None
+    rv = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform != 'darwin':
+        rv *= 1024
+    return rv
+
+
+def bench_module_load(repeat):
+    def cold():
+        with Symbolizer() as symbolizer:
+            symbolizer.symbolize(instruction_addr=CRASH_TESTER_ADDRS[0],
+                                 **CRASH_TESTER_FRAME)
+
+    cold_times = timeit(cold, repeat)
+    with Symbolizer() as symbolizer:
+        symbolizer.symbolize(instruction_addr=CRASH_TESTER_ADDRS[0],
+                             **CRASH_TESTER_FRAME)
+        warm_times = timeit(lambda: symbolizer.symbolize(
+            instruction_addr=CRASH_TESTER_ADDRS[1], **CRASH_TESTER_FRAME),
+            repeat)
+    return {
+        'module_load.cold': percentile(cold_times, 0.5),
+        'module_load.warm': percentile(warm_times, 0.5),
+    }
+
+
+def bench_single_frame(repeat):
+    times = []
+    with Symbolizer() as symbolizer:
+        for addr in CRASH_TESTER_ADDRS:
+            symbolizer.symbolize(instruction_addr=addr, **CRASH_TESTER_FRAME)
+        for _ in range(repeat):
+            for addr in CRASH_TESTER_ADDRS:
+                start = time.time()
+                symbolizer.symbolize(instruction_addr=addr,
+                                     symbolize_inlined=True,
+                                     **CRASH_TESTER_FRAME)
+                times.append(time.time() - start)
+    return {
+        'single_frame.p50': percentile(times, 0.5),
+        'single_frame.p99': percentile(times, 0.99),
+    }
+
+
+def bench_reports(reports, repeat):
+    frames = 0
+    symbols = []
+    with Symbolizer() as symbolizer:
+        start = time.time()
+        for _ in range(repeat):
+            for dsym_paths, binary_images, backtraces in reports:
+                rep = ReportSymbolizer(symbolizer, dsym_paths, binary_images)
+                for bt in rep.symbolize_backtraces(backtraces):
+                    frames += len(bt)
+                    symbols.extend(frame.get('symbol_name') for frame in bt)
+        duration = time.time() - start
+    return {
+        'report.frames_per_sec': frames / duration,
+    }, [x for x in symbols if x]
+
+
+def bench_demangle(symbols, repeat):
+    if not symbols:
+        return {}
+    start = time.time()
+    for _ in range(repeat):
+        for symbol in symbols:
+            demangle_symbol(symbol)
+    return {
+        'demangle.ops_per_sec': len(symbols) * repeat /
+        (time.time() - start),
+    }
+
+
+def bench_find_debug_images(reports, repeat):
+    times = timeit(lambda: [find_debug_images(dsym_paths, binary_images)
+                            for dsym_paths, binary_images, _ in reports],
+                   repeat)
+    return {
+        'find_debug_images': percentile(times, 0.5),
+    }
+
+
+def run(repeat):
+    reports = load_reports()
+    results = {}
+    results.update(bench_module_load(repeat))
+    results.update(bench_single_frame(repeat))
+    report_results, symbols = bench_reports(reports, repeat)
+    results.update(report_results)
+    results.update(bench_demangle(symbols, repeat))
+    results.update(bench_find_debug_images(reports, repeat))
+    gc.collect()
+    results['peak_rss'] = get_peak_rss()
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'reports': len(reports),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compares results to a baseline and returns a list of
+    ``(metric, baseline, value, change, regressed)`` tuples where change
+    is the relative change with positive values being improvements.
+    """
+    rv = []
+    for key, old in sorted(baseline['results'].items()):
+        new = results['results'].get(key)
+        if not old or new is None:
+            continue
+        if key in HIGHER_IS_BETTER:
+            change = (new - old) / float(old)
+        else:
+            change = (old - new) / float(old)
+        rv.append((key, old, new, change, change < -threshold))
+    return rv
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Runs the symsynd '
+                                     'benchmarks.')
+    parser.add_argument('-o', '--output',
+                        help='The file to write the results to.')
+    parser.add_argument('-b', '--baseline',
+                        help='A previous result file to compare against.')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='The relative change that counts as a '
+                        'regression.  Defaults to 0.1.')
+    parser.add_argument('-n', '--repeat', type=int, default=20,
+                        help='How often to repeat each benchmark.')
+    args = parser.parse_args(args)
+
+    results = run(args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressed = False
+    for key, old, new, change, is_regression in compare(
+            results, baseline, args.threshold):
+        sys.stderr.write('%-24s %12.6g %12.6g %+7.1f%%%s\n' % (
+            key, old, new, change * 100,
+            is_regression and '  REGRESSION' or ''))
+        regressed = regressed or is_regression
+    return regressed and 1 or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,15 +27,23 @@ typedef struct {
     int cpusubtype;
 } debug_cpu_type_t;
 
+typedef struct {
+    uint64_t open_ns;
+    uint64_t comp_dir_ns;
+    uint64_t comp_dir_count;
+} debug_timing_t;
+
 debug_info_t *debug_info_open_path(
     const char *path, debug_error_t *err_out);
 void debug_info_free(debug_info_t *di);
 const char *debug_info_get_compilation_dir(
     debug_info_t *di, const char *cpu_name, const char *filename,
     debug_error_t *err_out);
+debug_timing_t debug_info_get_timing(
+    const debug_info_t *di, debug_error_t *err_out);
 debug_variant_t *debug_info_get_variants(
     const debug_info_t *di, int *variants_count, debug_error_t *err_out);
-void debug_free_variants(debug_variant_t *variants);
+void debug_free_variants(debug_variant_t *variants, int variants_count);
 void debug_buffer_free(void *buf);
 debug_str_slice_t debug_get_cpu_name(int cputype, int cpusubtype,
     debug_error_t *err_out);
@@ -3,6 +3,7 @@
 //! This exposes some of the functionality of the crate as a C ABI.
 use std::mem;
 use std::ptr;
+use std::slice;
 use std::panic;
 use std::path::Path;
 use std::ffi::{CStr, OsStr};
@@ -10,7 +11,7 @@ use std::os::unix::ffi::OsStrExt;
 use std::os::raw::{c_int, c_char};
 use mach_object::{get_arch_name_from_types, get_arch_from_flag};
 
-use read::DebugInfo;
+use read::{DebugInfo, Timing};
 use error::{Error, Result};
 
 use uuid::Uuid;
@@ -145,6 +146,14 @@ export!(
     }
 );
 
+export!(
+    /// Returns the time spent in the phases of working with the file.
+    fn debug_info_get_timing(di: *const DebugInfo) -> Result<Timing>
+    {
+        Ok((*di).get_timing())
+    }
+);
+
 export!(
     /// Gets the variants in the debug symbol file
     fn debug_info_get_variants(di: *const DebugInfo,
@@ -165,10 +174,11 @@ export!(
 );
 
 export!(
-    /// Free allocated variants
-    fn debug_free_variants(variants: *mut CVariant) {
+    /// Free variants returned by `debug_info_get_variants`.
+    fn debug_free_variants(variants: *mut CVariant, variants_count: c_int) {
         if !variants.is_null() {
-            Box::from_raw(variants);
+            Box::from_raw(slice::from_raw_parts_mut(
+                variants, variants_count as usize) as *mut [CVariant]);
         }
     }
 );
@@ -2,6 +2,8 @@ use std::io;
 use std::fs;
 use std::ops::Deref;
 use std::path::Path;
+use std::cell::Cell;
+use std::time::{Duration, Instant};
 use std::ffi::{CStr, OsStr};
 use std::os::unix::ffi::OsStrExt;
 
@@ -36,10 +38,27 @@ fn cstr_as_path(s: &CStr) -> &Path {
     Path::new(OsStr::from_bytes(s.to_bytes()))
 }
 
+fn duration_ns(d: Duration) -> u64 {
+    d.as_secs() * 1_000_000_000 + d.subsec_nanos() as u64
+}
+
+/// Time spent in the phases of working with a debug file.
+#[derive(Debug, Clone, Copy, Default)]
+#[repr(C)]
+pub struct Timing {
+    /// Nanoseconds spent opening, mapping and parsing the object file.
+    pub open_ns: u64,
+    /// Nanoseconds spent scanning compilation units for compilation dirs.
+    pub comp_dir_ns: u64,
+    /// The number of compilation dir lookups.
+    pub comp_dir_count: u64,
+}
+
 /// Convenient access to a subset of debug info relevant for symsynd
 pub struct DebugInfo<'a> {
     backing: Backing<'a>,
     ofile: OFile,
+    timing: Cell<Timing>,
 }
 
 pub struct Variant<'a> {
@@ -54,9 +73,14 @@ pub struct Variant<'a> {
 impl<'a> DebugInfo<'a> {
     /// Opens a macho DWARF file from a path.
     pub fn open_path<P: AsRef<Path>>(p: P) -> Result<DebugInfo<'a>> {
+        let start = Instant::now();
         let f = fs::File::open(p)?;
         let mmap = memmap::Mmap::open(&f, memmap::Protection::Read)?;
-        DebugInfo::from_backing(Backing::Mmap(mmap))
+        let rv = DebugInfo::from_backing(Backing::Mmap(mmap))?;
+        let mut timing = rv.timing.get();
+        timing.open_ns = duration_ns(start.elapsed());
+        rv.timing.set(timing);
+        Ok(rv)
     }
 
     /// Opens a macho DWARF file from a vector.
@@ -77,6 +101,7 @@ impl<'a> DebugInfo<'a> {
         Ok(DebugInfo {
             backing: backing,
             ofile: ofile,
+            timing: Cell::new(Timing::default()),
         })
     }
 
@@ -132,6 +157,11 @@ impl<'a> DebugInfo<'a> {
         Err(Error::NoSuchSection)
     }
 
+    /// Returns the time spent in the phases of working with the file.
+    pub fn get_timing(&self) -> Timing {
+        self.timing.get()
+    }
+
     /// Returns all the UUIDs and the architectures in the debug file.
     pub fn get_variants(&'a self) -> Result<Vec<Variant<'a>>> {
         fn extract_variants<'a>(rv: &mut Vec<Variant<'a>>, file: &'a OFile) {
@@ -205,6 +235,18 @@ impl<'a> DebugInfo<'a> {
     /// Like `get_compilation_dir` but returns a `CStr`.
     pub fn get_compilation_dir_cstr(&'a self, cpu_name: &str, filename: &Path)
         -> Result<&'a CStr>
+    {
+        let start = Instant::now();
+        let rv = self.find_compilation_dir(cpu_name, filename);
+        let mut timing = self.timing.get();
+        timing.comp_dir_ns += duration_ns(start.elapsed());
+        timing.comp_dir_count += 1;
+        self.timing.set(timing);
+        rv
+    }
+
+    fn find_compilation_dir(&'a self, cpu_name: &str, filename: &Path)
+        -> Result<&'a CStr>
     {
         let info_slice = self.get_section(cpu_name, "__DWARF", "__debug_info")?;
         let abbrev_slice = self.get_section(cpu_name, "__DWARF", "__debug_abbrev")?;
@@ -28,9 +28,16 @@
 #include "llvm/Support/Signals.h"
 #include "llvm/Support/Error.h"
 #include "llvm/Support/raw_ostream.h"
+#include <chrono>
 #include <cstdio>
 #include <cstring>
+#include <map>
 #include <string>
+#if defined(__APPLE__)
+#include <malloc/malloc.h>
+#else
+#include <malloc.h>
+#endif
 
 #include "llvm-symbolizer.h"
 
@@ -52,11 +59,100 @@ static int lib_initialized;
 struct lib_shared_state {
     llvm_shutdown_obj *shutdown_obj;
 };
+struct llvm_module_state {
+    llvm_module_timing_t timing;
+    long long heap_bytes;
+};
 struct llvm_symbolizer_s {
     LLVMSymbolizer *symbolizer;
+    int timing_enabled;
+    std::map<std::string, llvm_module_state> modules;
 };
 static struct lib_shared_state *shared_state;
 
+static unsigned long long
+now_ns(void)
+{
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+
+/* Returns the bytes allocated on the heap by this process or -1 if the
+   allocator cannot tell. */
+static long long
+heap_in_use(void)
+{
+#if defined(__GLIBC__) && (__GLIBC__ > 2 || __GLIBC_MINOR__ >= 33)
+    return (long long)mallinfo2().uordblks;
+#elif defined(__GLIBC__)
+    return (long long)(unsigned int)mallinfo().uordblks;
+#elif defined(__APPLE__)
+    malloc_statistics_t stats;
+    malloc_zone_statistics(0, &stats);
+    return (long long)stats.size_in_use;
+#else
+    return -1;
+#endif
+}
+
+static void
+load_module(llvm_symbolizer_t *self, const char *module)
+{
+    auto res_or_err = self->symbolizer->symbolizeCode(module, 0);
+    if (!res_or_err) {
+        consumeError(res_or_err.takeError());
+    }
+}
+
+/* If timing is enabled the first request for a module loads it with a
+   separate lookup so that the time and heap spent opening and mapping the
+   object and creating the DWARF context can be attributed to the module
+   and kept apart from the lookups.  The heap is sampled for the whole
+   process, so allocations of other threads during the load are included
+   and the number is approximate.  Returns the timing record of the module
+   if timing is enabled or null. */
+static llvm_module_timing_t *
+begin_timing(llvm_symbolizer_t *self, const char *module)
+{
+    if (!self->timing_enabled) {
+        return 0;
+    }
+    auto it = self->modules.find(module);
+    if (it == self->modules.end()) {
+        llvm_module_state state;
+        memset(&state, 0, sizeof(state));
+        long long heap_before = heap_in_use();
+        unsigned long long start = now_ns();
+        load_module(self, module);
+        state.timing.load_ns = now_ns() - start;
+        long long heap_after = heap_in_use();
+        if (heap_before < 0 || heap_after < 0) {
+            state.heap_bytes = -1;
+        } else if (heap_after > heap_before) {
+            state.heap_bytes = heap_after - heap_before;
+        }
+        it = self->modules.insert(std::make_pair(module, state)).first;
+    }
+    return &it->second.timing;
+}
+
+static void
+end_timing(llvm_module_timing_t *timing, unsigned long long start)
+{
+    if (!timing) {
+        return;
+    }
+    unsigned long long duration = now_ns() - start;
+    if (!timing->lookup_count) {
+        timing->first_lookup_ns = duration;
+    }
+    if (duration > timing->max_lookup_ns) {
+        timing->max_lookup_ns = duration;
+    }
+    timing->lookup_ns += duration;
+    timing->lookup_count++;
+}
+
 void
 llvm_symbolizer_lib_init(void)
 {
@@ -87,7 +183,7 @@ llvm_symbolizer_new(void)
     if (!lib_initialized) {
         return 0;
     }
-    llvm_symbolizer_t *rv = (llvm_symbolizer_t *)malloc(sizeof(llvm_symbolizer_t));
+    llvm_symbolizer_t *rv = new llvm_symbolizer_t();
 
     LLVMSymbolizer::Options opts(
         FunctionNameKind::LinkageName, /* print functions */
@@ -109,7 +205,49 @@ llvm_symbolizer_free(llvm_symbolizer_t *sym)
         return;
     }
     delete sym->symbolizer;
-    free(sym);
+    delete sym;
+}
+
+void
+llvm_symbolizer_set_timing(llvm_symbolizer_t *self, int enabled)
+{
+    self->timing_enabled = enabled;
+}
+
+int
+llvm_symbolizer_get_module_timing(
+    llvm_symbolizer_t *self,
+    const char *module,
+    llvm_module_timing_t *timing_out)
+{
+    auto it = self->modules.find(module);
+    if (it == self->modules.end()) {
+        return 0;
+    }
+    *timing_out = it->second.timing;
+    return 1;
+}
+
+void
+llvm_symbolizer_preload(llvm_symbolizer_t *self, const char *module)
+{
+    if (!begin_timing(self, module)) {
+        load_module(self, module);
+    }
+}
+
+int
+llvm_symbolizer_get_module_heap_size(
+    llvm_symbolizer_t *self,
+    const char *module,
+    long long *heap_bytes_out)
+{
+    auto it = self->modules.find(module);
+    if (it == self->modules.end()) {
+        return 0;
+    }
+    *heap_bytes_out = it->second.heap_bytes;
+    return 1;
 }
 
 llvm_symbol_t *
@@ -122,8 +260,12 @@ llvm_symbolizer_symbolize(
     llvm_symbol_t *rv = (llvm_symbol_t *)malloc(sizeof(llvm_symbol_t));
     memset(rv, 0, sizeof(llvm_symbol_t));
 
+    llvm_module_timing_t *timing = begin_timing(self, module);
+    unsigned long long start = timing ? now_ns() : 0;
+
     if (is_data) {
         auto res_or_err = self->symbolizer->symbolizeData(module, offset);
+        end_timing(timing, start);
         if (sym_failed(res_or_err, rv)) {
             return rv;
         }
@@ -131,6 +273,7 @@ llvm_symbolizer_symbolize(
         rv->name = strdup(res.Name.c_str());
     } else {
         auto res_or_err = self->symbolizer->symbolizeCode(module, offset);
+        end_timing(timing, start);
         if (sym_failed(res_or_err, rv)) {
             return rv;
         }
@@ -155,7 +298,10 @@ llvm_symbolizer_symbolize_inlined(
     // try to symbolicate or fail
     llvm_symbol_t *tmp = (llvm_symbol_t *)malloc(sizeof(llvm_symbol_t));
     memset(tmp, 0, sizeof(llvm_symbol_t));
+    llvm_module_timing_t *timing = begin_timing(self, module);
+    unsigned long long start = timing ? now_ns() : 0;
     auto res_or_err = self->symbolizer->symbolizeInlinedCode(module, offset);
+    end_timing(timing, start);
     if (sym_failed(res_or_err, tmp)) {
         return tmp;
     }
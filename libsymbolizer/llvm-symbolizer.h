@@ -22,6 +22,14 @@ typedef struct llvm_symbol_s {
     char *error;
 } llvm_symbol_t;
 
+typedef struct llvm_module_timing_s {
+    unsigned long long load_ns;
+    unsigned long long first_lookup_ns;
+    unsigned long long lookup_ns;
+    unsigned long long max_lookup_ns;
+    unsigned long long lookup_count;
+} llvm_module_timing_t;
+
 void llvm_symbolizer_lib_init(void);
 void llvm_symbolizer_lib_cleanup(void);
 
@@ -39,6 +47,17 @@ llvm_symbol_t *llvm_symbolizer_symbolize_inlined(
     llvm_symbol_t ***sym_out,
     size_t *sym_count_out);
 
+void llvm_symbolizer_preload(llvm_symbolizer_t *sym, const char *module);
+void llvm_symbolizer_set_timing(llvm_symbolizer_t *sym, int enabled);
+int llvm_symbolizer_get_module_timing(
+    llvm_symbolizer_t *sym,
+    const char *module,
+    llvm_module_timing_t *timing_out);
+int llvm_symbolizer_get_module_heap_size(
+    llvm_symbolizer_t *sym,
+    const char *module,
+    long long *heap_bytes_out);
+
 void llvm_symbol_free(llvm_symbol_t *sym);
 void llvm_bulk_symbol_free(llvm_symbol_t **syms, size_t count);
 
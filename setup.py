@@ -97,6 +97,13 @@ setup(
     install_requires=[
         'cffi>=1.0.0',
     ],
+    entry_points={
+        'console_scripts': [
+            'symsynd-batch = symsynd.batch:main',
+            'symsynd-server = symsynd.server:main',
+            'symsynd-slim = symsynd.slim:main',
+        ],
+    },
     setup_requires=[
         'cffi>=1.0.0'
     ],
@@ -1,37 +1,168 @@
+"""Soak test for symsynd.  This symbolizes the fixture reports in a loop,
+regularly closes and recreates the symbolizer and samples the memory use
+of the process.  After a warmup the growth of the memory is fitted with a
+linear regression and the run fails if it grows faster than the budget::
+
+    $ python soaktest.py --duration 600 --max-slope 64
+
+The budget is given in kilobytes per thousand reports.
+"""
 import os
 import gc
+import sys
 import json
-from symsynd.driver import Driver
+import time
+import ctypes
+import ctypes.util
+import argparse
+
+from symsynd.symbolizer import Symbolizer
 from symsynd.report import ReportSymbolizer
+from symsynd.cache import LRUCache
 
 
 here = os.path.abspath(os.path.dirname(__file__))
-res_path = os.path.join(here, 'tests', 'res')
+sys.path.insert(0, os.path.join(here, 'benchmarks'))
+
+from benchutils import load_reports
+
+
+def get_rss():
+    """Returns the resident set size in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        import resource
+        rv = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return sys.platform == 'darwin' and rv or rv * 1024
+
+
+def _make_heap_probe():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+    except OSError:
+        return None
+
+    if hasattr(libc, 'mallinfo2'):
+        field = ctypes.c_size_t
+        func = libc.mallinfo2
+    elif hasattr(libc, 'mallinfo'):
+        field = ctypes.c_int
+        func = libc.mallinfo
+    else:
+        return None
+
+    class MallInfo(ctypes.Structure):
+        _fields_ = [(name, field) for name in (
+            'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks',
+            'fsmblks', 'uordblks', 'fordblks', 'keepcost')]
+
+    func.restype = MallInfo
+
+    def probe():
+        info = func()
+        return info.uordblks + info.hblkhd
+    return probe
+
+
+get_native_heap = _make_heap_probe()
+
+
+def fit_slope(samples):
+    """Returns the slope of a least squares fit of ``(x, y)`` samples."""
+    n = float(len(samples))
+    mean_x = sum(x for x, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    var = sum((x - mean_x) ** 2 for x, _ in samples)
+    if not var:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in samples) / var
+
+
+def soak(reports, duration, cycle, sample_every, cache_size):
+    samples = []
+    processed = 0
+    start = time.time()
+    symbolizer = None
+
+    while time.time() - start < duration:
+        if symbolizer is None or processed % cycle == 0:
+            if symbolizer is not None:
+                symbolizer.close()
+            cache = cache_size and LRUCache(max_entries=cache_size) or None
+            symbolizer = Symbolizer(cache=cache)
+
+        dsym_paths, binary_images, backtraces = \
+            reports[processed % len(reports)]
+        rep = ReportSymbolizer(symbolizer, dsym_paths, binary_images)
+        rep.symbolize_backtraces(backtraces)
+        processed += 1
 
+        if processed % sample_every == 0:
+            gc.collect()
+            sample = {
+                'reports': processed,
+                'elapsed': time.time() - start,
+                'rss': get_rss(),
+                'native_heap': get_native_heap and get_native_heap(),
+                'images': symbolizer.stats()['images'],
+            }
+            samples.append(sample)
+            sys.stderr.write('%(reports)8d reports  rss=%(rss)d  '
+                             'heap=%(native_heap)s\n' % sample)
 
-with open(os.path.join(res_path, 'crash-report.json')) as f:
-    report = json.load(f)
-driver = Driver()
+    if symbolizer is not None:
+        symbolizer.close()
+    return samples
 
 
-def iterate():
-    bt = None
-    dsym_path = os.path.join(res_path, 'Crash-Tester.app.dSYM')
-    rep = ReportSymbolizer(driver, [dsym_path],
-                           report['binary_images'])
-    for thread in report['crash']['threads']:
-        if thread['crashed']:
-            assert bt is None
-            bt = rep.symbolize_backtrace(thread['backtrace']['contents'])
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Runs the symsynd soak '
+                                     'test.')
+    parser.add_argument('--duration', type=float, default=300,
+                        help='How long to run in seconds.')
+    parser.add_argument('--cycle', type=int, default=1000,
+                        help='After how many reports the symbolizer is '
+                        'closed and recreated.')
+    parser.add_argument('--sample-every', type=int, default=100,
+                        help='After how many reports memory is sampled.')
+    parser.add_argument('--warmup', type=float, default=0.2,
+                        help='The fraction of samples ignored for the '
+                        'fit.')
+    parser.add_argument('--cache-size', type=int, default=1000,
+                        help='The size of the result cache or 0 to '
+                        'disable it.')
+    parser.add_argument('--max-slope', type=float, default=64,
+                        help='The allowed memory growth in kilobytes per '
+                        'thousand reports.')
+    parser.add_argument('-o', '--output',
+                        help='A file to write the samples to as JSON.')
+    args = parser.parse_args(args)
 
-    assert bt is not None
+    samples = soak(load_reports(ext=False), args.duration, args.cycle,
+                   args.sample_every, args.cache_size)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(samples, f, indent=2)
 
+    samples = samples[int(len(samples) * args.warmup):]
+    if len(samples) < 2:
+        sys.stderr.write('Not enough samples, run longer.\n')
+        return 2
 
-def main():
-    while 1:
-        iterate()
-        gc.collect()
+    failed = False
+    for key in 'rss', 'native_heap':
+        if samples[0][key] is None:
+            continue
+        slope = fit_slope([(x['reports'], x[key]) for x in samples]) \
+            * 1000 / 1024.0
+        ok = slope <= args.max_slope
+        sys.stderr.write('%s growth: %.2f KB per 1000 reports (%s)\n' % (
+            key, slope, ok and 'ok' or 'over budget'))
+        failed = failed or not ok
+    return failed and 1 or 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
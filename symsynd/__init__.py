@@ -1,45 +1,66 @@
-from symsynd.libdebug import DebugInfo, get_cpu_name, get_cpu_type_tuple, \
-    is_valid_cpu_name
-from symsynd.demangle import demangle_symbol, demangle_swift_symbol, \
-    demangle_cpp_symbol
-from symsynd.symbolizer import Symbolizer
-from symsynd.images import find_debug_images, ImageLookup
-from symsynd.heuristics import find_best_instruction
-from symsynd.utils import parse_addr
-from symsynd.exceptions import SymbolicationError, DebugInfoError, \
-    DwarfLookupError, NoSuchArch, NoSuchSection, NoSuchAttribute
-
-
-__all__ = [
-    # libdebug
-    'DebugInfo',
-    'get_cpu_name',
-    'get_cpu_type_tuple',
-    'is_valid_cpu_name',
-
-    # demangle
-    'demangle_symbol',
-    'demangle_swift_symbol',
-    'demangle_cpp_symbol',
-
-    # images
-    'find_debug_images',
-    'ImageLookup',
-
-    # symbolizer
-    'Symbolizer',
-
-    # heuristics
-    'find_best_instruction',
-
-    # utils
-    'parse_addr',
-
-    # exceptions
-    'SymbolicationError',
-    'DebugInfoError',
-    'DwarfLookupError',
-    'NoSuchArch',
-    'NoSuchSection',
-    'NoSuchAttribute',
-]
+import sys
+from types import ModuleType
+from collections import OrderedDict
+
+
+# The public names are imported lazily from their modules on first access
+# so that importing the package does not load the native libraries until
+# they are actually needed.
+all_by_module = OrderedDict([
+    ('symsynd.libdebug', ['DebugInfo', 'get_cpu_name', 'get_cpu_type_tuple',
+                          'is_valid_cpu_name']),
+    ('symsynd.demangle', ['demangle_symbol', 'demangle_swift_symbol',
+                          'demangle_cpp_symbol']),
+    ('symsynd.images', ['find_debug_images', 'ImageLookup', 'FileProber']),
+    ('symsynd.symbolizer', ['Symbolizer']),
+    ('symsynd.heuristics', ['find_best_instruction',
+                            'find_best_instructions']),
+    ('symsynd.report', ['ReportSymbolizer']),
+    ('symsynd.utils', ['parse_addr', 'parse_addrs']),
+    ('symsynd.cache', ['LRUCache', 'TTLCache', 'SqliteCache', 'TieredCache']),
+    ('symsynd.exceptions', ['SymbolicationError', 'DebugInfoError',
+                            'DeadlineExceeded', 'DwarfLookupError',
+                            'NoSuchArch', 'NoSuchSection', 'NoSuchAttribute']),
+])
+
+object_origins = {}
+for module_name, items in all_by_module.items():
+    for item in items:
+        object_origins[item] = module_name
+
+
+class module(ModuleType):
+    """Automatically import objects from the modules."""
+
+    def __getattr__(self, name):
+        if name in object_origins:
+            module = __import__(object_origins[name], None, None, [name])
+            for extra_name in all_by_module[module.__name__]:
+                setattr(self, extra_name, getattr(module, extra_name))
+            return getattr(module, name)
+        raise AttributeError('module %r has no attribute %r' % (
+            self.__name__, name))
+
+    def __dir__(self):
+        result = list(new_module.__all__)
+        result.extend(('__file__', '__doc__', '__all__', '__path__',
+                       '__package__', '__name__'))
+        return result
+
+
+# keep a reference to this module so that it's not garbage collected
+old_module = sys.modules['symsynd']
+
+# setup the new module and patch it into the dict of loaded modules
+new_module = sys.modules['symsynd'] = module('symsynd')
+new_module.__dict__.update({
+    '__file__': __file__,
+    '__package__': 'symsynd',
+    '__path__': __path__,
+    '__doc__': __doc__,
+    '__spec__': globals().get('__spec__'),
+    '__loader__': globals().get('__loader__'),
+    '__all__': [item for items in all_by_module.values() for item in items],
+    'all_by_module': all_by_module,
+    'object_origins': object_origins,
+})
@@ -0,0 +1,197 @@
+"""Asyncio support for symsynd.  This module is only available on Python 3
+and is not imported by the package by default.
+"""
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from symsynd.symbolizer import Symbolizer
+from symsynd.utils import parse_addr
+from symsynd.exceptions import DeadlineExceeded
+
+
+def _merge_deadlines(a, b):
+    if a is None or b is None:
+        return None
+    return max(a, b)
+
+
+def _copy_error(error):
+    try:
+        rv = error.__class__(*error.args)
+    except Exception:
+        return error
+    rv.__cause__ = error
+    return rv
+
+
+async def _wait_for(future, deadline):
+    try:
+        if deadline is None:
+            return await asyncio.shield(future)
+        return await asyncio.wait_for(asyncio.shield(future),
+                                      max(deadline - time.time(), 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded('Deadline exceeded')
+    except Exception as e:
+        # Like the symbolizer every caller gets its own error.
+        raise _copy_error(e)
+
+
+class AsyncSymbolizer(object):
+    """An asyncio frontend to the symbolizer.  All lookups are executed on
+    a managed executor so that the event loop is never blocked by LLVM.
+
+    Identical requests that are in flight at the same time share a single
+    lookup and all requests for the same module that are issued within the
+    same iteration of the event loop are dispatched to the executor as a
+    single batch.  Results handed out for coalesced requests are shared
+    between all callers and must not be modified, errors are copied for
+    every caller.  Batches for different modules are symbolized
+    concurrently on up to `max_workers` threads (by default the default
+    of `concurrent.futures.ThreadPoolExecutor`).
+
+    Lookups accept a `deadline` like `Symbolizer.symbolize`.  A batch is
+    symbolized with the latest deadline of its requests and every caller
+    stops waiting once its own deadline passed.
+
+    If no symbolizer is passed a new one is created and owned by this
+    object.
+    """
+
+    def __init__(self, symbolizer=None, loop=None, max_workers=None):
+        self._owns_symbolizer = symbolizer is None
+        if symbolizer is None:
+            symbolizer = Symbolizer()
+        self.symbolizer = symbolizer
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._inflight = {}
+        self._pending = {}
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        """Shuts down the executor and closes the symbolizer if it is
+        owned by this object.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        if self._owns_symbolizer:
+            self.symbolizer.close()
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def symbolize(self, dsym_path, image_vmaddr, image_addr,
+                  instruction_addr, cpu_name,
+                  symbolize_inlined=False, deadline=None):
+        """Like `Symbolizer.symbolize` but returns an awaitable that
+        resolves to the result.  Cancelling the awaitable does not cancel
+        the lookup for other callers waiting for the same frame.  If a
+        `deadline` is given the awaitable raises `DeadlineExceeded` once
+        it passed.
+        """
+        if self._closed:
+            raise RuntimeError('Symbolizer is closed')
+        loop = self._get_loop()
+
+        image_vmaddr = parse_addr(image_vmaddr)
+        image_addr = parse_addr(image_addr)
+        instruction_addr = parse_addr(instruction_addr)
+        key = (dsym_path, cpu_name, image_vmaddr,
+               instruction_addr - image_addr, bool(symbolize_inlined))
+
+        # Requests are shared while they are pending.  Once dispatched
+        # they are only shared with callers that do not need a later
+        # deadline than the one the lookup runs with.
+        entry = self._inflight.get(key)
+        if entry is not None:
+            if not entry[2]:
+                entry[1] = _merge_deadlines(entry[1], deadline)
+            elif entry[1] is not None and \
+                    _merge_deadlines(entry[1], deadline) != entry[1]:
+                entry = None
+        if entry is None:
+            # future, deadline, dispatched
+            entry = [loop.create_future(), deadline, False]
+            self._inflight[key] = entry
+            module_key = (dsym_path, cpu_name)
+            pending = self._pending.get(module_key)
+            if pending is None:
+                pending = self._pending[module_key] = []
+                if len(self._pending) == 1:
+                    loop.call_soon(self._flush)
+            pending.append((key, entry, (
+                dsym_path, image_vmaddr, image_addr, instruction_addr,
+                cpu_name, symbolize_inlined)))
+
+        return loop.create_task(_wait_for(entry[0], deadline))
+
+    def _flush(self):
+        loop = self._get_loop()
+        pending = self._pending
+        self._pending = {}
+        for requests in pending.values():
+            deadline = requests[0][1][1]
+            for _, entry, _ in requests:
+                entry[2] = True
+                deadline = _merge_deadlines(deadline, entry[1])
+            job = loop.run_in_executor(self._executor,
+                                       self._symbolize_batch,
+                                       [x[2] for x in requests], deadline)
+            job.add_done_callback(
+                lambda job, requests=requests:
+                self._resolve_batch(job, requests))
+
+    def _symbolize_batch(self, args, deadline=None):
+        frames = [{
+            'dsym_path': dsym_path,
+            'image_vmaddr': image_vmaddr,
+            'image_addr': image_addr,
+            'instruction_addr': instruction_addr,
+            'cpu_name': cpu_name,
+        } for (dsym_path, image_vmaddr, image_addr, instruction_addr,
+               cpu_name, _) in args]
+        # Inlined and plain lookups for the same module end up in the
+        # same batch so they are split up here.
+        rv = [None] * len(args)
+        for symbolize_inlined in False, True:
+            indexes = [idx for idx, arg in enumerate(args)
+                       if bool(arg[5]) == symbolize_inlined]
+            if not indexes:
+                continue
+            results = self.symbolizer.symbolize_frames(
+                [frames[idx] for idx in indexes],
+                symbolize_inlined=symbolize_inlined, deadline=deadline)
+            for idx, result in zip(indexes, results):
+                rv[idx] = result
+        return rv
+
+    def _resolve_batch(self, job, requests):
+        if job.cancelled():
+            results = [asyncio.CancelledError() for _ in requests]
+        elif job.exception() is not None:
+            results = [_copy_error(job.exception()) for _ in requests]
+        else:
+            results = job.result()
+
+        for (key, entry, _), result in zip(requests, results):
+            if self._inflight.get(key) is entry:
+                del self._inflight[key]
+            future = entry[0]
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,147 @@
+"""Symbolizes streams of crash reports.  Each report is a JSON object with
+the following keys:
+
+``binary_images``
+    the list of loaded images as accepted by `find_debug_images`.
+``backtraces``
+    a list of backtraces (for instance one per thread), each being a list
+    of frames with at least an ``instruction_addr``.
+``metas``
+    optionally a list with the meta information of each backtrace as
+    accepted by `find_best_instruction`.
+
+The result for each report is the same object with the backtraces
+replaced by the symbolized ones.  This can also be invoked from the
+command line to process a file with one report per line::
+
+    $ python -m symsynd.batch -d path/to/dsyms reports.jsonl
+"""
+import sys
+import json
+import time
+import argparse
+from itertools import islice
+
+from symsynd.report import ReportSymbolizer
+from symsynd.images import FileProber
+
+
+def symbolize_reports(symbolizer, dsym_paths, reports, window=100,
+                      index_dir=None, prober=None, index=None,
+                      timeout=None):
+    """Symbolizes an iterable of reports and yields the results in input
+    order.  At most `window` reports are held in memory at once.  The
+    frames of all reports in a window are symbolized together so that all
+    frames that need the same debug file are resolved in one go, each
+    distinct address is only looked up once and every debug file is
+    loaded once per window.
+
+    `index_dir`, `prober` and `index` are passed to `find_debug_images`.
+    If a `timeout` is given every window may take that many seconds.
+    Frames that are not symbolized in time are returned marked as
+    described in `ReportSymbolizer`.
+    """
+    reports = iter(reports)
+    while 1:
+        chunk = list(islice(reports, window))
+        if not chunk:
+            break
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        for report in _symbolize_chunk(symbolizer, dsym_paths, chunk,
+                                       index_dir, prober, index, deadline):
+            yield report
+
+
+def _symbolize_chunk(symbolizer, dsym_paths, reports, index_dir, prober,
+                     index, deadline=None):
+    lookups = []
+    pending = []
+    for report in reports:
+        rep = ReportSymbolizer(symbolizer, dsym_paths,
+                               report.get('binary_images') or (),
+                               index_dir=index_dir, prober=prober,
+                               index=index)
+        backtraces = report.get('backtraces') or []
+        report_lookups, lookup_frames = rep._prepare_lookups(
+            backtraces, report.get('metas'))
+        pending.append((rep, backtraces, lookup_frames,
+                        len(lookups), len(report_lookups)))
+        lookups.extend(report_lookups)
+
+    kwargs = {}
+    if deadline is not None:
+        kwargs['deadline'] = deadline
+    results = symbolizer.symbolize_frames(lookups, symbolize_inlined=True,
+                                          **kwargs)
+    demangled = {}
+
+    for report, (rep, backtraces, lookup_frames, offset, count) in \
+            zip(reports, pending):
+        rv = dict(report)
+        rv['backtraces'] = rep._apply_results(
+            backtraces, lookup_frames, results[offset:offset + count],
+            demangled)
+        yield rv
+
+
+def main(args=None):
+    """Command line entry point."""
+    from symsynd.symbolizer import Symbolizer
+
+    parser = argparse.ArgumentParser(
+        prog='symsynd-batch',
+        description='Symbolizes crash reports with one JSON report '
+        'per line.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='The file to read reports from.  Defaults to '
+                        'stdin.')
+    parser.add_argument('-o', '--output', default='-',
+                        help='The file to write results to.  Defaults to '
+                        'stdout.')
+    parser.add_argument('-d', '--dsym-path', dest='dsym_paths',
+                        action='append', default=[],
+                        help='A folder or dSYM bundle to look for debug '
+                        'files in.  Can be provided multiple times.')
+    parser.add_argument('-w', '--window', type=int, default=100,
+                        help='The number of reports to symbolize '
+                        'together.')
+    parser.add_argument('--index-dir',
+                        help='A folder to keep the index of dSYM bundle '
+                        'contents in.')
+    parser.add_argument('-j', '--concurrency', type=int, default=1,
+                        help='The number of debug files to look for '
+                        'concurrently.')
+    parser.add_argument('-t', '--timeout', type=float,
+                        help='The number of seconds each window may take.  '
+                        'Frames not symbolized in time are marked.')
+    args = parser.parse_args(args)
+
+    infile = args.input == '-' and sys.stdin or open(args.input)
+    outfile = args.output == '-' and sys.stdout or open(args.output, 'w')
+
+    prober = None
+    if args.concurrency > 1:
+        prober = FileProber(concurrency=args.concurrency)
+
+    reports = (json.loads(line) for line in infile if line.strip())
+    try:
+        with Symbolizer() as symbolizer:
+            for report in symbolize_reports(symbolizer, args.dsym_paths,
+                                            reports, window=args.window,
+                                            index_dir=args.index_dir,
+                                            prober=prober,
+                                            timeout=args.timeout):
+                outfile.write(json.dumps(report) + '\n')
+    finally:
+        if prober is not None:
+            prober.close()
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,475 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+from threading import Lock
+from collections import OrderedDict
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+_missing = object()
+
+
+def _json_default(obj):
+    # Lazy frames behave like dictionaries but are not dictionaries.
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+class LRUCache(object):
+    """A thread safe least recently used cache.  The cache can be bounded
+    by the number of entries and by the total size of the entries as
+    reported by the caller.  If neither limit is given the cache grows
+    without bounds.
+
+    If `on_remove` is given it is called with the key and value of every
+    entry that is evicted, replaced, discarded or cleared once the lock of
+    the cache was released.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, on_remove=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_remove = on_remove
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._lock = Lock()
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    @property
+    def hit_rate(self):
+        """The ratio of lookups that were served from the cache."""
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+
+    def get(self, key, default=None):
+        """Looks up a value and marks it as recently used."""
+        item = self.get_item(key)
+        if item is None:
+            return default
+        return item[0]
+
+    def get_item(self, key, default=None):
+        """Like `get` but returns a tuple of the value and its size."""
+        with self._lock:
+            item = self._items.pop(key, _missing)
+            if item is _missing:
+                self.misses += 1
+                return default
+            self._items[key] = item
+            self.hits += 1
+            return item
+
+    def set(self, key, value, size=0):
+        """Stores a value in the cache.  `size` is the number of bytes
+        the value accounts for with regards to `max_bytes`.
+        """
+        removed = []
+        with self._lock:
+            old = self._items.pop(key, _missing)
+            if old is not _missing:
+                self.total_bytes -= old[1]
+                removed.append((key, old[0]))
+            self._items[key] = (value, size)
+            self.total_bytes += size
+            self._prune(removed)
+        self._notify(removed)
+
+    def discard(self, key):
+        """Removes a value from the cache if it exists."""
+        removed = []
+        with self._lock:
+            old = self._items.pop(key, _missing)
+            if old is not _missing:
+                self.total_bytes -= old[1]
+                removed.append((key, old[0]))
+        self._notify(removed)
+
+    def items(self):
+        """Returns a list of the keys and values from the least to the most
+        recently used ones without marking them as used.
+        """
+        with self._lock:
+            return [(key, item[0]) for key, item in self._items.items()]
+
+    def clear(self):
+        """Removes all values and resets the counters."""
+        with self._lock:
+            removed = [(key, item[0]) for key, item in self._items.items()]
+            self._items.clear()
+            self.total_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+        self._notify(removed)
+
+    def _prune(self, removed):
+        while self._items and (
+            (self.max_entries is not None and
+             len(self._items) > self.max_entries) or
+            (self.max_bytes is not None and
+             self.total_bytes > self.max_bytes)
+        ):
+            key, (value, size) = self._items.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            removed.append((key, value))
+
+    def _notify(self, removed):
+        if self.on_remove is not None:
+            for key, value in removed:
+                self.on_remove(key, value)
+
+    def get_stats(self):
+        """Returns a dictionary with the current counters."""
+        return {
+            'entries': len(self._items),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class TTLCache(object):
+    """A thread safe cache where every entry expires after a time to live
+    in seconds.  If `max_entries` is given the oldest entries are dropped
+    first when the cache runs full.  Expired entries are dropped as they
+    reach the front of the cache and in a sweep over all entries once
+    every `ttl` seconds.
+    """
+
+    def __init__(self, ttl, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._items = OrderedDict()
+        self._next_sweep = time.time() + ttl
+
+    def __len__(self):
+        return len(self._items)
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    @property
+    def hit_rate(self):
+        """The ratio of lookups that were served from the cache."""
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+
+    def get(self, key, default=None):
+        """Looks up a value that has not expired yet."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if item[1] > time.time():
+                    self.hits += 1
+                    return item[0]
+                del self._items[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, size=0, ttl=None):
+        """Stores a value.  Optionally a different time to live than the
+        default of the cache can be provided.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (value, now + ttl)
+            self._prune(now)
+
+    def discard(self, key):
+        """Removes a value from the cache if it exists."""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        """Removes all values and resets the counters."""
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def _prune(self, now):
+        # Entries are kept in insertion order, so unless their time to live
+        # differs the expired ones are at the front.
+        while self._items:
+            key = next(iter(self._items))
+            if self._items[key][1] > now:
+                break
+            del self._items[key]
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.ttl
+            for key, (_, expires) in list(self._items.items()):
+                if expires <= now:
+                    del self._items[key]
+        if self.max_entries is not None:
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def get_stats(self):
+        """Returns a dictionary with the current counters."""
+        return {
+            'entries': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class SqliteCache(object):
+    """A persistent cache for symbolication results that is backed by a
+    SQLite database.  The database can be shared by all processes on a
+    host, each of which can read and write concurrently.  Values must be
+    JSON serializable.
+
+    Keys are tuples in the form ``(image, cpu_name, addr, inlined)`` as
+    created by the symbolizer.  Entries older than `max_age` seconds are
+    ignored and removed when pruning and `max_bytes` bounds the total
+    size of the stored values.  Pruning happens automatically every
+    `prune_interval` writes of a process or explicitly with `prune`.
+    """
+
+    def __init__(self, path, max_age=None, max_bytes=None,
+                 prune_interval=1000, timeout=30.0):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._get_connection()
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    @property
+    def hit_rate(self):
+        """The ratio of lookups that were served from the cache."""
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+
+    def _get_connection(self):
+        # Connections can neither be shared between threads nor survive
+        # a fork so we keep one per thread and process.
+        con = getattr(self._local, 'con', None)
+        if con is not None and self._local.pid == os.getpid():
+            return con
+        con = sqlite3.connect(self.path, timeout=self.timeout,
+                              isolation_level=None)
+        con.execute('pragma journal_mode=wal')
+        con.execute('pragma synchronous=normal')
+        con.execute('''
+            create table if not exists frames (
+                image text not null,
+                cpu_name text not null,
+                addr integer not null,
+                inlined integer not null,
+                value text not null,
+                size integer not null,
+                created real not null,
+                primary key (image, cpu_name, addr, inlined)
+            )
+        ''')
+        con.execute('''
+            create index if not exists frames_created on frames (created)
+        ''')
+        self._local.con = con
+        self._local.pid = os.getpid()
+        return con
+
+    def get(self, key, default=None):
+        """Looks up a value."""
+        item = self.get_item(key)
+        if item is None:
+            return default
+        return item[0]
+
+    def get_item(self, key, default=None):
+        """Like `get` but returns a tuple of the value and its size."""
+        image, cpu_name, addr, inlined = key
+        query = (
+            'select value, size from frames where image = ? and '
+            'cpu_name = ? and addr = ? and inlined = ?'
+        )
+        args = [image, cpu_name, addr, inlined and 1 or 0]
+        if self.max_age is not None:
+            query += ' and created >= ?'
+            args.append(time.time() - self.max_age)
+        row = self._get_connection().execute(query, args).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, size=0):
+        """Stores a value in the cache.  The size is computed from the
+        serialized value so the `size` parameter is ignored.
+        """
+        image, cpu_name, addr, inlined = key
+        value = json.dumps(value, default=_json_default)
+        self._get_connection().execute(
+            'insert or replace into frames (image, cpu_name, addr, inlined, '
+            'value, size, created) values (?, ?, ?, ?, ?, ?, ?)',
+            (image, cpu_name, addr, inlined and 1 or 0, value, len(value),
+             time.time()))
+        self._writes += 1
+        if self.prune_interval and self._writes % self.prune_interval == 0:
+            self.prune()
+
+    def discard(self, key):
+        """Removes a value from the cache if it exists."""
+        image, cpu_name, addr, inlined = key
+        self._get_connection().execute(
+            'delete from frames where image = ? and cpu_name = ? '
+            'and addr = ? and inlined = ?',
+            (image, cpu_name, addr, inlined and 1 or 0))
+
+    def clear(self):
+        """Removes all values and resets the counters."""
+        self._get_connection().execute('delete from frames')
+        self.hits = self.misses = 0
+
+    def prune(self):
+        """Removes expired entries and the oldest entries until the cache
+        fits into `max_bytes`.
+        """
+        con = self._get_connection()
+        if self.max_age is not None:
+            con.execute('delete from frames where created < ?',
+                        (time.time() - self.max_age,))
+        if self.max_bytes is not None:
+            total = con.execute(
+                'select coalesce(sum(size), 0) from frames').fetchone()[0]
+            excess = total - self.max_bytes
+            if excess > 0:
+                cutoff = None
+                rows = con.execute(
+                    'select created, size from frames order by created')
+                for created, size in rows:
+                    excess -= size
+                    if excess <= 0:
+                        cutoff = created
+                        break
+                rows.close()
+                if cutoff is not None:
+                    con.execute('delete from frames where created <= ?',
+                                (cutoff,))
+
+    def get_stats(self):
+        """Returns a dictionary with the current counters."""
+        entries, total = self._get_connection().execute(
+            'select count(*), coalesce(sum(size), 0) from frames').fetchone()
+        return {
+            'entries': entries,
+            'bytes': total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class TieredCache(object):
+    """Combines multiple caches, usually a fast in-memory cache in front
+    of a persistent one.  Lookups go through the caches in order and
+    values found in a later cache are copied into the earlier ones with
+    the size the later cache knows them by (zero for caches without a
+    `get_item` method).
+    """
+
+    def __init__(self, caches):
+        self.caches = list(caches)
+        self.hits = 0
+        self.misses = 0
+
+    def _after_fork(self):
+        for cache in self.caches:
+            if hasattr(cache, '_after_fork'):
+                cache._after_fork()
+
+    @property
+    def hit_rate(self):
+        """The ratio of lookups that were served from any cache."""
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+
+    def get(self, key, default=None):
+        """Looks up a value in all caches."""
+        item = self.get_item(key)
+        if item is None:
+            return default
+        return item[0]
+
+    def get_item(self, key, default=None):
+        """Like `get` but returns a tuple of the value and its size."""
+        for idx, cache in enumerate(self.caches):
+            if hasattr(cache, 'get_item'):
+                item = cache.get_item(key)
+            else:
+                rv = cache.get(key, _missing)
+                item = rv is not _missing and (rv, 0) or None
+            if item is not None:
+                for earlier in self.caches[:idx]:
+                    earlier.set(key, item[0], item[1])
+                self.hits += 1
+                return item
+        self.misses += 1
+        return default
+
+    def set(self, key, value, size=0):
+        """Stores a value in all caches."""
+        for cache in self.caches:
+            cache.set(key, value, size)
+
+    def discard(self, key):
+        """Removes a value from all caches."""
+        for cache in self.caches:
+            cache.discard(key)
+
+    def clear(self):
+        """Clears all caches and resets the counters."""
+        for cache in self.caches:
+            cache.clear()
+        self.hits = self.misses = 0
+
+    def get_stats(self):
+        """Returns a dictionary with the counters of all caches."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'caches': [x.get_stats() for x in self.caches],
+        }
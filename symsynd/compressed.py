@@ -0,0 +1,343 @@
+"""Support for compressed debug files.  Debug files can be stored gzip or
+zstd compressed (the latter requires the `zstandard` package) and are
+decompressed on first use.  Because both LLVM and libdebug open debug
+files by path, the decompressed images are written to files in a memory
+backed folder (``/dev/shm``) and kept in a cache that is bounded by the
+total size of the decompressed images.  Without ``/dev/shm`` a warning is
+logged and the temporary folder is used instead.
+
+Every process writes its copies into its own ``symsynd-<pid>-<random>``
+folder which is removed when the process exits.  The process holds a
+lock on a file in the folder for as long as it lives, so folders whose
+lock is free belong to processes that died without cleaning up (for
+instance because they were killed) and are removed the next time a
+process creates its folder in the same place.  Unlike process IDs the
+locks also work for processes in other PID namespaces.
+"""
+import os
+import zlib
+import fcntl
+import errno
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+import itertools
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from symsynd.exceptions import DebugInfoError
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+logger = logging.getLogger(__name__)
+
+_chunk_size = 1024 * 1024
+_lock_name = '.lock'
+
+# directory -> (pid, path of the process folder, fd of the lock file)
+_process_dirs = {}
+_dirs_lock = threading.Lock()
+_counter = itertools.count(1)
+_warned_dirs = set()
+
+
+def get_compression(path):
+    """Returns ``'gzip'`` or ``'zstd'`` if a file is compressed or `None`
+    otherwise.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic[:2] == GZIP_MAGIC:
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+
+
+def strip_compressed_suffix(filename):
+    """Removes the suffix of a compressed file from a filename."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def _decompress_gzip(src, dst):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while 1:
+        chunk = src.read(_chunk_size)
+        if not chunk:
+            break
+        dst.write(decompressor.decompress(chunk))
+    dst.write(decompressor.flush())
+
+
+def _decompress_zstd(src, dst):
+    if zstandard is None:
+        raise DebugInfoError('zstd compressed debug files require the '
+                             'zstandard package')
+    zstandard.ZstdDecompressor().copy_stream(src, dst)
+
+
+def _get_default_dir():
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    rv = tempfile.gettempdir()
+    if rv not in _warned_dirs:
+        _warned_dirs.add(rv)
+        logger.warning('/dev/shm is not available, decompressed debug '
+                       'files are written to %s instead', rv)
+    return rv
+
+
+def _remove_stale(directory):
+    """Removes the folders of processes that are gone."""
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return
+    for fn in filenames:
+        if not fn.startswith('symsynd-'):
+            continue
+        full_fn = os.path.join(directory, fn)
+        try:
+            fd = os.open(os.path.join(full_fn, _lock_name), os.O_RDWR)
+        except OSError:
+            # Not a process folder or one that is being created.
+            continue
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                # The owner is alive.
+                continue
+            shutil.rmtree(full_fn, ignore_errors=True)
+        finally:
+            os.close(fd)
+
+
+def _create_process_dir(directory):
+    path = tempfile.mkdtemp(prefix='symsynd-%d-' % os.getpid(),
+                            dir=directory)
+    # The lock is taken before the lock file gets its name so that other
+    # processes never see it unlocked.
+    tmp_fn = os.path.join(path, _lock_name + '.tmp')
+    fd = os.open(tmp_fn, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.rename(tmp_fn, os.path.join(path, _lock_name))
+    except Exception:
+        os.close(fd)
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    return path, fd
+
+
+def _get_process_dir(directory):
+    """Returns the folder of the current process within a folder and
+    creates it if necessary.
+    """
+    pid = os.getpid()
+    with _dirs_lock:
+        rv = _process_dirs.get(directory)
+        if rv is not None and rv[0] == pid:
+            if os.path.isdir(rv[1]):
+                return rv[1]
+            os.close(rv[2])
+        _remove_stale(directory)
+        # The lock files inherited from a parent process stay open so
+        # that the folder of the parent is kept while children use it.
+        path, fd = _create_process_dir(directory)
+        _process_dirs[directory] = (pid, path, fd)
+        return path
+
+
+def _is_owned(fn):
+    pid = os.getpid()
+    dirname = os.path.dirname(fn)
+    for owner, path, _ in list(_process_dirs.values()):
+        if owner == pid and path == dirname:
+            return True
+    return False
+
+
+def cleanup():
+    """Removes the folders with the decompressed copies of the current
+    process.  This runs automatically when the interpreter exits but has
+    to be invoked explicitly before leaving with `os._exit`.
+    """
+    pid = os.getpid()
+    with _dirs_lock:
+        for directory, (owner, path, fd) in list(_process_dirs.items()):
+            if owner == pid:
+                shutil.rmtree(path, ignore_errors=True)
+                os.close(fd)
+                del _process_dirs[directory]
+
+
+def _after_fork():
+    global _dirs_lock
+    _dirs_lock = threading.Lock()
+
+
+atexit.register(cleanup)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class DecompressedCache(object):
+    """Keeps decompressed copies of compressed debug files.  At most
+    `max_bytes` of decompressed images are kept, the least recently used
+    ones are removed first.  The copies are written to a folder of the
+    process in `directory` which defaults to ``/dev/shm`` or the temporary
+    folder.
+
+    Symbolizers `acquire` the copies they load and `release` them when
+    they are closed.  Copies that are in use are never removed because
+    their memory stays mapped until the symbolizer is closed anyway, so
+    they count towards `max_bytes` but are only removed once released.
+    """
+
+    def __init__(self, max_bytes=2 * 1024 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory or _get_default_dir()
+        self.total_bytes = 0
+        # key -> [filename, size, references]
+        self._items = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def get_path(self, path):
+        """Returns the path of the decompressed copy of a compressed
+        file.  Files that are not compressed are returned unchanged.  The
+        copy can be removed at any time, use `acquire` to keep it.
+        """
+        return self._get_path(path, False)
+
+    def acquire(self, path):
+        """Like `get_path` but keeps the copy until it is passed to
+        `release` as often as it was acquired.
+        """
+        return self._get_path(path, True)
+
+    def release(self, fn):
+        """Releases a copy returned by `acquire`."""
+        with self._lock:
+            key = self._keys.get(fn)
+            if key is None:
+                return
+            item = self._items[key]
+            item[2] = max(item[2] - 1, 0)
+            self._prune()
+
+    def _get_path(self, path, acquire):
+        st = os.stat(path)
+        key = (path, st.st_mtime, st.st_size)
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                if os.path.isfile(item[0]):
+                    self._items[key] = item
+                    if acquire:
+                        item[2] += 1
+                    return item[0]
+                # The copy was removed behind our back, so forget it and
+                # decompress the file again.
+                del self._keys[item[0]]
+                self.total_bytes -= item[1]
+
+        compression = get_compression(path)
+        if compression is None:
+            return path
+
+        fn = os.path.join(_get_process_dir(self.directory), '%d-%s' % (
+            next(_counter), strip_compressed_suffix(os.path.basename(path))))
+        try:
+            with open(path, 'rb') as src:
+                with open(fn, 'wb') as dst:
+                    if compression == 'gzip':
+                        _decompress_gzip(src, dst)
+                    else:
+                        _decompress_zstd(src, dst)
+        except (zlib.error, EnvironmentError) as e:
+            _unlink(fn)
+            raise DebugInfoError('Could not decompress %s: %s' % (path, e))
+        except Exception:
+            _unlink(fn)
+            raise
+        size = os.path.getsize(fn)
+
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                # Another thread decompressed the same file
+                _unlink(fn)
+            else:
+                item = [fn, size, 0]
+                self._keys[fn] = key
+                self.total_bytes += size
+            self._items[key] = item
+            if acquire:
+                item[2] += 1
+            self._prune()
+            return item[0]
+
+    def _remove(self, key):
+        fn, size, _ = self._items.pop(key)
+        del self._keys[fn]
+        self.total_bytes -= size
+        # Copies inherited from a parent process belong to the parent.
+        if _is_owned(fn):
+            _unlink(fn)
+
+    def _prune(self):
+        if self.max_bytes is None or self.total_bytes <= self.max_bytes:
+            return
+        # The most recently used copy is kept so that it can be returned.
+        for key in list(self._items)[:-1]:
+            if self._items[key][2] == 0:
+                self._remove(key)
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def clear(self):
+        """Removes all decompressed copies that are not in use."""
+        with self._lock:
+            for key, item in list(self._items.items()):
+                if item[2] == 0:
+                    self._remove(key)
+
+    def get_stats(self):
+        """Returns a dictionary with the number and total size of the
+        decompressed copies and the size of the ones in use.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self.total_bytes,
+                'in_use_bytes': sum(x[1] for x in self._items.values()
+                                    if x[2]),
+            }
+
+
+def _unlink(fn):
+    try:
+        os.unlink(fn)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -1,5 +1,6 @@
 from symsynd._demangler import ffi, lib
 from symsynd._compat import text_type
+from symsynd import metrics
 
 
 def _make_buffer():
@@ -27,9 +28,10 @@ def demangle_cpp_symbol(symbol, simplified=False):
 def demangle_symbol(symbol, simplified=False):
     if symbol is None:
         return None
-    buffer = _make_buffer()
-    for func in lib.demangle_swift, lib.demangle_cpp:
-        rv = _demangle(func, symbol, buffer, simplified)
-        if rv is not None:
-            return rv
-    return symbol
+    with metrics.timed('demangle'):
+        buffer = _make_buffer()
+        for func in lib.demangle_swift, lib.demangle_cpp:
+            rv = _demangle(func, symbol, buffer, simplified)
+            if rv is not None:
+                return rv
+        return symbol
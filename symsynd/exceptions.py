@@ -18,6 +18,10 @@ class DebugInfoError(SymbolicationError):
     pass
 
 
+class DeadlineExceeded(SymbolicationError):
+    pass
+
+
 class DwarfLookupError(DebugInfoError):
     pass
 
@@ -1,4 +1,9 @@
-from symsynd.utils import parse_addr
+from symsynd.utils import parse_addr, parse_addrs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 SIGILL = 4
@@ -73,3 +78,65 @@ def find_best_instruction(addr, cpu_name, meta=None):
     # hits if we look at the end of an instruction in the DWARF file than
     # the beginning.
     return round_to_instruction_end(rv, cpu_name)
+
+
+_arch_info_cache = {}
+
+
+def get_arch_info(cpu_name):
+    """Returns a tuple in the form ``(mask, size, end)`` for the
+    instructions of a CPU: the alignment mask, the size of an instruction
+    and the offset of the last byte of an instruction.
+    """
+    rv = _arch_info_cache.get(cpu_name)
+    if rv is None:
+        if cpu_name.startswith('arm64'):
+            rv = (-4, 4, 3)
+        elif cpu_name.startswith('arm'):
+            rv = (-2, 2, 1)
+        else:
+            rv = (-1, 1, 0)
+        _arch_info_cache[cpu_name] = rv
+    return rv
+
+
+def find_best_instructions(addrs, cpu_name, meta=None, frame_numbers=None):
+    """Like `find_best_instruction` but works on a list of addresses that
+    share the same CPU, for instance an entire backtrace, and returns a
+    list of adjusted addresses.  `frame_numbers` are the frame numbers of
+    the addresses and default to their position in the list.  If numpy
+    is available the adjustment is applied in a single vectorized
+    operation.
+    """
+    addrs = parse_addrs(addrs)
+    if not addrs:
+        return []
+    mask, size, end = get_arch_info(cpu_name)
+
+    # The crashing frame (if it's in this list) is handled like in the
+    # single instruction version.  All others are return addresses.
+    crashing_idx = None
+    if meta:
+        if frame_numbers is None:
+            crashing_idx = 0
+        else:
+            for idx, frame_number in enumerate(frame_numbers):
+                if frame_number == 0:
+                    crashing_idx = idx
+                    break
+    crashing_addr = None
+    if crashing_idx is not None:
+        crashing_addr = find_best_instruction(
+            addrs[crashing_idx], cpu_name, dict(meta, frame_number=0))
+
+    if numpy is not None and len(addrs) > 1 and min(addrs) >= size:
+        arr = numpy.array(addrs, dtype=numpy.uint64)
+        arr &= numpy.uint64(mask & 0xffffffffffffffff)
+        arr -= numpy.uint64(size - end)
+        rv = arr.tolist()
+    else:
+        rv = [(addr & mask) - size + end for addr in addrs]
+
+    if crashing_idx is not None:
+        rv[crashing_idx] = crashing_addr
+    return rv
@@ -1,11 +1,25 @@
 import os
+import json
 import bisect
+import hashlib
+import tempfile
+from uuid import UUID
+from threading import Lock
+from multiprocessing.pool import ThreadPool
 
 from symsynd.libdebug import get_cpu_name, DebugInfo
 from symsynd.exceptions import DebugInfoError
-from symsynd.utils import timedsection, parse_addr
+from symsynd.utils import parse_addr
+from symsynd import metrics
+from symsynd.cache import TTLCache
+from symsynd.compressed import COMPRESSED_SUFFIXES, strip_compressed_suffix
 from symsynd._compat import string_types, itervalues
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def get_image_cpu_name(image):
     cpu_name = image.get('cpu_name')
@@ -14,29 +28,282 @@ def get_image_cpu_name(image):
     return get_cpu_name(image['cpu_type'], image['cpu_subtype'])
 
 
-def find_debug_images(dsym_paths, binary_images):
+_bundle_indexes = {}
+_debug_file_suffixes = ('',) + COMPRESSED_SUFFIXES
+
+
+def _get_index_filename(index_dir, dwarf_base):
+    key = hashlib.sha1(os.path.abspath(dwarf_base).encode('utf-8'))
+    return os.path.join(index_dir, 'bundle-%s.json' % key.hexdigest())
+
+
+def _load_bundle_index(dwarf_base, index_dir):
+    rv = _bundle_indexes.get(dwarf_base)
+    if rv is not None or index_dir is None:
+        return rv
+    try:
+        with open(_get_index_filename(index_dir, dwarf_base)) as f:
+            rv = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(rv, dict):
+        return None
+    _bundle_indexes[dwarf_base] = rv
+    return rv
+
+
+def _save_bundle_index(dwarf_base, index_dir, index):
+    _bundle_indexes[dwarf_base] = index
+    if index_dir is None:
+        return
+    filename = _get_index_filename(index_dir, dwarf_base)
+    try:
+        fd, tmp_filename = tempfile.mkstemp(dir=index_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.rename(tmp_filename, filename)
+    except (IOError, OSError):
+        pass
+
+
+def get_bundle_uuids(dwarf_base, index_dir=None):
+    """Returns a dictionary of all UUIDs in the debug files of a folder
+    (usually the ``Contents/Resources/DWARF`` folder of a dSYM bundle)
+    to the paths of the debug files.
+
+    Opening debug files is slow, so the result is kept in an index that
+    is validated by the modification time and size of each file so that
+    only new or changed files are opened again.  The index is stored in
+    memory and, if `index_dir` is provided, in that folder so that it can
+    be shared between processes.
+    """
+    index = _load_bundle_index(dwarf_base, index_dir) or {}
+    new_index = {}
+    changed = False
+
+    for fn in os.listdir(dwarf_base):
+        full_fn = os.path.join(dwarf_base, fn)
+        try:
+            st = os.stat(full_fn)
+        except OSError:
+            continue
+        entry = index.get(fn)
+        if entry is None or entry['mtime'] != st.st_mtime or \
+           entry['size'] != st.st_size:
+            uuids = []
+            metrics.incr('debug_info.open')
+            try:
+                with metrics.timed('debug_info.open'):
+                    di = DebugInfo.open_path(full_fn)
+            except DebugInfoError:
+                pass
+            else:
+                try:
+                    uuids = [str(x.uuid) for x in di.get_variants()]
+                finally:
+                    di.close()
+            entry = {'mtime': st.st_mtime, 'size': st.st_size,
+                     'uuids': uuids}
+            changed = True
+        new_index[fn] = entry
+
+    if changed or len(new_index) != len(index):
+        _save_bundle_index(dwarf_base, index_dir, new_index)
+
+    rv = {}
+    for fn, entry in sorted(new_index.items()):
+        for uuid in entry['uuids']:
+            rv.setdefault(uuid, os.path.join(dwarf_base, fn))
+    return rv
+
+
+def _get_uuid_name(filename):
+    """Returns the UUID a debug file is named by or `None`."""
+    uuid = strip_compressed_suffix(filename)
+    try:
+        if str(UUID(uuid)) == uuid:
+            return uuid
+    except ValueError:
+        pass
+
+
+def get_uuid_files(dsym_path):
+    """Returns a dictionary of the UUIDs of the debug files in a folder
+    that are named by their UUID (optionally compressed) to their paths.
+    Uncompressed files win over compressed ones.
+    """
+    rv = {}
+    # Uncompressed files sort before compressed ones.
+    for fn in sorted(os.listdir(dsym_path)):
+        uuid = _get_uuid_name(fn)
+        if uuid is None or uuid in rv:
+            continue
+        full_fn = os.path.join(dsym_path, fn)
+        if os.path.isfile(full_fn):
+            rv[uuid] = full_fn
+    return rv
+
+
+class FileProber(object):
+    """Checks for the existence of many files concurrently which helps on
+    file systems where every `stat` call is slow, like network mounts.
+    At most `concurrency` checks are in flight at once.  Found files are
+    remembered for `positive_ttl` seconds and missing files for
+    `negative_ttl` seconds.
+
+    A prober is meant to be long lived and passed to `find_debug_images`
+    for every report.
+    """
+
+    def __init__(self, concurrency=8, positive_ttl=300, negative_ttl=30,
+                 max_entries=100000):
+        self.concurrency = concurrency
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(positive_ttl, max_entries=max_entries)
+        self._pool = None
+        self._lock = Lock()
+
+    def close(self):
+        """Stops the worker threads."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def _after_fork(self):
+        # Worker threads do not survive a fork.
+        self._lock = Lock()
+        self._pool = None
+        self.cache._after_fork()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.concurrency)
+            return self._pool
+
+    def isfile(self, path):
+        """Like `os.path.isfile` but cached."""
+        return self.probe([path])[0]
+
+    def probe(self, paths):
+        """Returns a list of booleans indicating for each path if it
+        refers to a file.
+        """
+        rv = [self.cache.get(path) for path in paths]
+        missing = [idx for idx, value in enumerate(rv) if value is None]
+        if not missing:
+            return rv
+
+        if len(missing) == 1 or self.concurrency <= 1:
+            results = [os.path.isfile(paths[idx]) for idx in missing]
+        else:
+            results = self._get_pool().map(
+                os.path.isfile, [paths[idx] for idx in missing])
+
+        for idx, result in zip(missing, results):
+            self.cache.set(paths[idx], result, ttl=result and
+                           self.positive_ttl or self.negative_ttl)
+            rv[idx] = result
+        return rv
+
+
+def find_debug_images(dsym_paths, binary_images, index_dir=None,
+                      prober=None, index=None, negative_cache=None,
+                      compressed=True):
     """Given a list of paths and a list of binary images this returns a
     dictionary of image addresses to the locations on the file system for
     all found images.
+
+    Images in dSYM bundles are found through an index of the bundle
+    contents (see `get_bundle_uuids`) which is persisted in `index_dir`
+    if provided.  Files named by UUID may also be gzip or zstd compressed
+    and carry a ``.gz`` or ``.zst`` suffix.  Those are only looked for
+    if no uncompressed file exists in any of the paths, and not at all if
+    `compressed` is disabled.  If a `FileProber` is given the files named
+    by UUID are checked concurrently through it.
+
+    Alternatively an `index` mapping UUIDs to paths can be provided, for
+    instance one created by `symsynd.prefork.build_index`.  Images are
+    looked up in the index first and the ones it does not know are looked
+    for on the file system as usual since they might have been added
+    later.  A `symsynd.watcher.DebugFileIndex` is kept up to date and
+    marked `complete`, so with it the file system is not touched at all.
+    It is expected to watch the given `dsym_paths`.
+
+    If a `negative_cache` (for instance a `symsynd.cache.TTLCache`) is
+    given, UUIDs that could not be found are remembered in it and not
+    looked for again until the entries expire.
     """
+    with metrics.timed('find_debug_images'):
+        return _find_debug_images(dsym_paths, binary_images, index_dir,
+                                  prober, index, negative_cache, compressed)
+
+
+def _find_uuid_files(dsym_paths, uuids, suffix, prober=None):
+    """Returns a dictionary of the UUIDs that have a file named by them
+    with the given suffix in one of the paths to the first such file.
+    """
+    rv = {}
+    if prober is not None:
+        candidates = [(uuid, os.path.join(dsym_path, uuid + suffix))
+                      for uuid in uuids for dsym_path in dsym_paths]
+        found = prober.probe([fn for _, fn in candidates])
+        # The candidates are ordered by search path for every UUID so
+        # the first path still wins.
+        for (uuid, fn), is_file in zip(candidates, found):
+            if is_file:
+                rv.setdefault(uuid, fn)
+    else:
+        for uuid in uuids:
+            for dsym_path in dsym_paths:
+                fn = os.path.join(dsym_path, uuid + suffix)
+                if os.path.isfile(fn):
+                    rv[uuid] = fn
+                    break
+    return rv
+
+
+def _find_debug_images(dsym_paths, binary_images, index_dir, prober, index,
+                       negative_cache=None, compressed=True):
     images_to_load = set()
 
-    with timedsection('iterimages0'):
+    with metrics.timed('find_debug_images.iterimages'):
         for image in binary_images:
             if get_image_cpu_name(image) is not None:
                 images_to_load.add(image['uuid'].lower())
 
+    negative_prefix = ('missing_image', tuple(dsym_paths))
+    if negative_cache is not None:
+        for uuid in list(images_to_load):
+            if negative_cache.get(negative_prefix + (uuid,)):
+                images_to_load.discard(uuid)
+
     images = {}
 
-    # Step one: load images that are named by their UUID
-    with timedsection('loadimages-fast'):
-        for uuid in list(images_to_load):
-            for dsym_path in dsym_paths:
-                fn = os.path.join(dsym_path, uuid)
-                if os.path.isfile(fn):
+    if index is not None:
+        with metrics.timed('find_debug_images.loadimages.index'):
+            for uuid in list(images_to_load):
+                fn = index.get(uuid)
+                if fn is not None:
                     images[uuid] = fn
                     images_to_load.discard(uuid)
-                    break
+            if getattr(index, 'complete', False):
+                images_to_load.clear()
+
+    # Step one: load images that are named by their UUID.  The suffixes
+    # of compressed files are only tried for the images that are still
+    # missing so that uncompressed files cost a single check per path.
+    with metrics.timed('find_debug_images.loadimages.fast'):
+        for suffix in compressed and _debug_file_suffixes or ('',):
+            if not images_to_load:
+                break
+            found = _find_uuid_files(dsym_paths, images_to_load, suffix,
+                                     prober)
+            images.update(found)
+            images_to_load.difference_update(found)
 
     # Otherwise fall back to loading images from the dsym bundle.  Because
     # this loading strategy is pretty slow we do't actually want to use it
@@ -48,30 +315,26 @@ def find_debug_images(dsym_paths, binary_images):
             if os.path.isdir(os.path.join(dsym_path, 'Contents')):
                 slow_paths.append(dsym_path)
 
-        with timedsection('loadimages-slow'):
+        with metrics.timed('find_debug_images.loadimages.slow'):
             for dsym_path in slow_paths:
                 dwarf_base = os.path.join(dsym_path, 'Contents',
                                           'Resources', 'DWARF')
                 if os.path.isdir(dwarf_base):
-                    for fn in os.listdir(dwarf_base):
-                        # Looks like a UUID we loaded, skip it
-                        if fn in images:
-                            continue
-                        full_fn = os.path.join(dwarf_base, fn)
-                        try:
-                            di = DebugInfo.open_path(full_fn)
-                        except DebugInfoError:
-                            continue
-                        for variant in di.get_variants():
-                            uuid = str(variant.uuid)
-                            if uuid in images_to_load:
-                                images[uuid] = full_fn
-                                images_to_load.discard(uuid)
+                    uuids = get_bundle_uuids(dwarf_base, index_dir)
+                    for uuid in list(images_to_load):
+                        full_fn = uuids.get(uuid)
+                        if full_fn is not None:
+                            images[uuid] = full_fn
+                            images_to_load.discard(uuid)
+
+    if negative_cache is not None:
+        for uuid in images_to_load:
+            negative_cache.set(negative_prefix + (uuid,), True)
 
     rv = {}
 
     # Now resolve all the images.
-    with timedsection('resolveimages'):
+    with metrics.timed('find_debug_images.resolveimages'):
         for image in binary_images:
             cpu_name = get_image_cpu_name(image)
             if cpu_name is None:
@@ -85,16 +348,22 @@ def find_debug_images(dsym_paths, binary_images):
 
 
 class ImageLookup(object):
-    """Helper object to locate images."""
+    """Helper object to locate images.  Images are looked up in an
+    interval table built from their `image_addr` and `image_size`.  If an
+    image does not specify a size it is assumed to extend up to the next
+    image.
+    """
 
     def __init__(self, images):
-        self._image_addresses = []
         self.images = {}
         for img in images:
-            img_addr = parse_addr(img['image_addr'])
-            self._image_addresses.append(img_addr)
-            self.images[img_addr] = img
-        self._image_addresses.sort()
+            self.images[parse_addr(img['image_addr'])] = img
+        self._image_addresses = sorted(self.images)
+        self._image_ends = []
+        for img_addr in self._image_addresses:
+            size = parse_addr(self.images[img_addr].get('image_size'))
+            self._image_ends.append(size and img_addr + size or None)
+        self._arrays = None
 
     def iter_images(self):
         return itervalues(self.images)
@@ -106,10 +375,43 @@ class ImageLookup(object):
         for img in self.iter_images():
             yield img['uuid']
 
+    def _find_image(self, addr):
+        idx = bisect.bisect_right(self._image_addresses, addr) - 1
+        if idx >= 0:
+            end = self._image_ends[idx]
+            if end is None or addr < end:
+                return self.images[self._image_addresses[idx]]
+
     def find_image(self, addr):
         """Given an instruction address this locates the image this address
         is contained in.
         """
-        idx = bisect.bisect_left(self._image_addresses, parse_addr(addr))
-        if idx > 0:
-            return self.images[self._image_addresses[idx - 1]]
+        return self._find_image(parse_addr(addr))
+
+    def find_images(self, addrs):
+        """Like `find_image` but locates the images for a list of
+        addresses at once.  If numpy is available the lookup is performed
+        as a single vectorized operation.  A list with one image (or
+        `None`) per address is returned.
+        """
+        addrs = [parse_addr(x) for x in addrs]
+        if numpy is None or not addrs or not self._image_addresses:
+            return [self._find_image(x) for x in addrs]
+
+        if self._arrays is None:
+            self._arrays = (
+                numpy.array(self._image_addresses, dtype=numpy.uint64),
+                numpy.array([x or 0 for x in self._image_ends],
+                            dtype=numpy.uint64),
+                numpy.array([x is None for x in self._image_ends],
+                            dtype=bool),
+            )
+        starts, ends, unbounded = self._arrays
+        addr_arr = numpy.array(addrs, dtype=numpy.uint64)
+        indexes = numpy.searchsorted(starts, addr_arr, side='right') - 1
+        found = (indexes >= 0) & (unbounded[indexes] |
+                                  (addr_arr < ends[indexes]))
+
+        images = self.images
+        return [images[x] if ok else None for x, ok in zip(
+            starts[indexes].tolist(), found.tolist())]
@@ -76,6 +76,7 @@ class DebugInfo(object):
     def _from_ptr(ptr):
         rv = object.__new__(DebugInfo)
         rv._ptr = ptr
+        rv._no_dwarf = set()
         return rv
 
     @staticmethod
@@ -91,6 +92,10 @@ class DebugInfo(object):
     def get_compilation_dir(self, cpu_name, path):
         ptr = self._get_ptr()
 
+        # Variants without the DWARF sections will never have one, so
+        # do not look again.
+        if cpu_name in self._no_dwarf:
+            return None
         try:
             rv = rustcall(_lib.debug_info_get_compilation_dir,
                           ptr, to_bytes(cpu_name), to_bytes(path))
@@ -98,14 +103,30 @@ class DebugInfo(object):
             if isinstance(path, text_type):
                 rv = rv.decode('utf-8')
             return rv
+        except (exceptions.NoSuchArch, exceptions.NoSuchSection):
+            self._no_dwarf.add(cpu_name)
         except exceptions.DwarfLookupError:
             pass
 
+    def get_timing(self):
+        """Returns the time in seconds spent opening the file and looking
+        up compilation directories.
+        """
+        timing = rustcall(_lib.debug_info_get_timing, self._get_ptr())
+        return {
+            'open': timing.open_ns / 1e9,
+            'comp_dir': timing.comp_dir_ns / 1e9,
+            'comp_dir_count': timing.comp_dir_count,
+        }
+
     def get_variants(self):
         ptr = self._get_ptr()
         count = _ffi.new('int *')
         arr = rustcall(_lib.debug_info_get_variants, ptr, count)
-        return [Variant(arr[x]) for x in range(count[0])]
+        try:
+            return [Variant(arr[x]) for x in range(count[0])]
+        finally:
+            _lib.debug_free_variants(arr, count[0])
 
     def get_variant(self, uuid_or_cpu_name):
         if isinstance(uuid_or_cpu_name, uuid.UUID):
@@ -1,11 +1,18 @@
 import os
 import posixpath
-from threading import Lock
+from threading import Lock, RLock
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 from symsynd.exceptions import SymbolicationError
 from symsynd.libdebug import DebugInfo
 from symsynd._symbolizer import ffi
 from symsynd._compat import to_bytes, itervalues
+from symsynd.cache import LRUCache
+from symsynd import metrics
 
 
 lib = ffi.dlopen(os.path.join(os.path.dirname(__file__), '_libsymbolizer.so'))
@@ -15,6 +22,15 @@ _lib_lock = Lock()
 _initialized = False
 
 
+def _after_fork():
+    global _lib_lock
+    _lib_lock = Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
 def _init_lib():
     global _initialized
     if _initialized:
@@ -35,21 +51,189 @@ def _symstr(ptr):
     return val.decode('utf-8', 'replace')
 
 
+_missing = object()
+_max_filenames = 100000
+_max_paths = 50000
+_frame_keys = ('symbol', 'filename', 'abs_path', 'lineno', 'colno')
+
+
+def _rawstr(ptr):
+    if ptr == ffi.NULL:
+        return None
+    val = ffi.string(ptr)
+    if val == b'<invalid>':
+        return None
+    return val
+
+
+class Frame(object):
+    """A symbolication result that behaves like a read-only dictionary
+    with the `symbol`, `filename`, `abs_path`, `lineno` and `colno` keys.
+    Strings are only decoded and the `filename` relative to the
+    compilation directory is only looked up when accessed.  Frames compare
+    equal to dictionaries with the same items and `dict(frame)` creates a
+    plain copy.  As they are read-only frames can be shared.
+    """
+    __slots__ = ('_symbol', '_abs_path', '_filename', 'lineno', 'colno',
+                 '_source', '_cpu_name')
+
+    def __init__(self, symbolizer, dsym_path, cpu_name, symbol, abs_path,
+                 lineno, colno):
+        # The symbolizer and path to look up the filename with.  They are
+        # kept together so that `_rebind` replaces both at once.
+        self._source = (symbolizer, dsym_path)
+        self._cpu_name = cpu_name
+        self._symbol = symbol
+        self._abs_path = abs_path
+        self._filename = _missing
+        self.lineno = lineno
+        self.colno = colno
+
+    @property
+    def symbol(self):
+        rv = self._symbol
+        if isinstance(rv, bytes):
+            rv = self._symbol = rv.decode('utf-8', 'replace')
+        return rv
+
+    @property
+    def abs_path(self):
+        rv = self._abs_path
+        if isinstance(rv, bytes):
+            rv = rv.decode('utf-8', 'replace')
+            source = self._source
+            if source is not None:
+                rv = source[0]._intern_path(rv)
+            self._abs_path = rv
+        return rv
+
+    @property
+    def filename(self):
+        rv = self._filename
+        if rv is _missing:
+            source = self._source
+            if source is None:
+                return self._filename
+            rv = source[0]._get_filename(source[1], self._cpu_name,
+                                         self.abs_path)
+            if rv is _missing:
+                # The symbolizer is closed.  The frame might still be
+                # rebound to another one.
+                return None
+            self._filename = rv
+            # The reference is only needed to look up the filename.
+            self._source = None
+        return rv
+
+    def _is_orphaned(self):
+        """Checks if the filename still has to be looked up but the
+        symbolizer of the frame was closed.
+        """
+        source = self._source
+        return source is not None and source[0].closed
+
+    def _rebind(self, symbolizer, dsym_path):
+        """Looks up the filename with another symbolizer and path of a
+        debug file with the same UUID.
+        """
+        if self._source is not None:
+            self._source = (symbolizer, dsym_path)
+
+    def __getitem__(self, key):
+        if key not in _frame_keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in _frame_keys:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in _frame_keys
+
+    def __iter__(self):
+        return iter(_frame_keys)
+
+    def __len__(self):
+        return len(_frame_keys)
+
+    def keys(self):
+        return list(_frame_keys)
+
+    def values(self):
+        return [getattr(self, key) for key in _frame_keys]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in _frame_keys]
+
+    def to_dict(self):
+        """Returns the frame as a plain dictionary."""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Frame, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        rv = self.__eq__(other)
+        if rv is NotImplemented:
+            return rv
+        return not rv
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<Frame %r (%s:%s)>' % (self.symbol, self.abs_path,
+                                      self.lineno)
+
+
+Mapping.register(Frame)
+
+
 class Symbolizer(object):
+    """Low level access to the LLVM symbolizer.  If `lazy_frames` is
+    enabled the results are `Frame` objects instead of dictionaries.
 
-    def __init__(self):
+    All native calls are serialized by a lock of the symbolizer so that
+    lazy frames can resolve their filenames from any thread and never
+    race with `close`.
+    """
+
+    def __init__(self, timing=False, lazy_frames=False):
         _init_lib()
+        self._lock = RLock()
         self._ptr = lib.llvm_symbolizer_new()
         self._debug_infos = {}
+        # The (dsym_path, cpu_name) of the modules requested from LLVM.
+        self._loaded = set()
+        self._filenames = LRUCache(max_entries=_max_filenames)
+        self._paths = {}
+        self.lazy_frames = lazy_frames
+        if timing:
+            lib.llvm_symbolizer_set_timing(self._ptr, 1)
 
     def close(self):
-        if self._ptr is not None:
-            lib.llvm_symbolizer_free(self._ptr)
-            self._ptr = None
-        if self._debug_infos:
-            for di in itervalues(self._debug_infos):
-                di.close()
-            self._debug_infos.clear()
+        with self._lock:
+            if self._ptr is not None:
+                lib.llvm_symbolizer_free(self._ptr)
+                self._ptr = None
+            if self._debug_infos:
+                for di in itervalues(self._debug_infos):
+                    di.close()
+                self._debug_infos.clear()
+            self._loaded.clear()
+            self._filenames.clear()
+            self._paths.clear()
+
+    def _after_fork(self):
+        self._lock = RLock()
+        self._filenames._after_fork()
+
+    @property
+    def closed(self):
+        return self._ptr is None
 
     def __enter__(self):
         return self
@@ -64,37 +248,149 @@ class Symbolizer(object):
             pass
 
     def get_debug_info(self, dsym_path):
-        rv = self._debug_infos.get(dsym_path)
+        with self._lock:
+            rv = self._debug_infos.get(dsym_path)
+            if rv is None:
+                if self._ptr is None:
+                    raise RuntimeError('Symbolizer closed')
+                metrics.incr('debug_info.open')
+                with metrics.timed('debug_info.open'):
+                    rv = DebugInfo.open_path(dsym_path)
+                self._debug_infos[dsym_path] = rv
+            return rv
+
+    def preload(self, dsym_path, cpu_name):
+        """Loads a module and the debug info of a file ahead of the first
+        lookup.
+        """
+        with self._lock:
+            if self._ptr is None:
+                raise RuntimeError('Symbolizer closed')
+            self.get_debug_info(dsym_path)
+            self._loaded.add((dsym_path, cpu_name))
+            lib.llvm_symbolizer_preload(
+                self._ptr, to_bytes(dsym_path + ':' + cpu_name))
+
+    def get_loaded_modules(self):
+        """Returns a sorted list of the ``(dsym_path, cpu_name)`` of the
+        modules that were preloaded or looked up.
+        """
+        with self._lock:
+            return sorted(self._loaded)
+
+    def get_module_timing(self, dsym_path, cpu_name):
+        """Returns the time in seconds spent loading a module and looking
+        up addresses in it or `None` if the module was not used since
+        timing was enabled.  The first lookup is reported separately as it
+        includes parsing the line tables of the compilation unit.
+        """
+        timing = ffi.new('llvm_module_timing_t *')
+        with self._lock:
+            if self._ptr is None:
+                raise RuntimeError('Symbolizer closed')
+            if not lib.llvm_symbolizer_get_module_timing(
+                    self._ptr, to_bytes(dsym_path + ':' + cpu_name), timing):
+                return None
+            di = self._debug_infos.get(dsym_path)
+            debug_timing = di is not None and di.get_timing() or None
+
+        rv = {
+            'load': timing.load_ns / 1e9,
+            'first_lookup': timing.first_lookup_ns / 1e9,
+            'lookup': timing.lookup_ns / 1e9,
+            'max_lookup': timing.max_lookup_ns / 1e9,
+            'lookup_count': timing.lookup_count,
+        }
+        if debug_timing is not None:
+            rv['open'] = debug_timing['open']
+            rv['comp_dir'] = debug_timing['comp_dir']
+            rv['comp_dir_count'] = debug_timing['comp_dir_count']
+        return rv
+
+    def get_module_heap_size(self, dsym_path, cpu_name):
+        """Returns the number of heap bytes allocated while loading a
+        module or `None` if the module was not loaded since timing was
+        enabled or the allocator does not provide the information.  This
+        is only approximate: it is measured for the whole process, so
+        allocations of other threads during the load are included, and it
+        does not include line tables parsed on demand.
+        """
+        heap_bytes = ffi.new('long long *')
+        with self._lock:
+            if self._ptr is None:
+                raise RuntimeError('Symbolizer closed')
+            if not lib.llvm_symbolizer_get_module_heap_size(
+                    self._ptr, to_bytes(dsym_path + ':' + cpu_name),
+                    heap_bytes) or heap_bytes[0] < 0:
+                return None
+        return heap_bytes[0]
+
+    def _intern_path(self, path):
+        rv = self._paths.get(path)
         if rv is None:
-            rv = DebugInfo.open_path(dsym_path)
-            self._debug_infos[dsym_path] = rv
+            # Interning only saves memory, starting over is harmless.
+            if len(self._paths) >= _max_paths:
+                self._paths.clear()
+            rv = self._paths.setdefault(path, path)
         return rv
 
+    def _get_filename(self, dsym_path, cpu_name, abs_path):
+        """Returns the path of a file relative to its compilation dir.
+        The compilation dir lookup scans the debug info so the results
+        are remembered.  If the symbolizer is closed the filename cannot
+        be looked up and `_missing` is returned.
+        """
+        if not abs_path:
+            return None
+        key = (dsym_path, cpu_name, abs_path)
+        rv = self._filenames.get(key, _missing)
+        if rv is not _missing:
+            return rv
+        with self._lock:
+            if self._ptr is None:
+                return _missing
+            rv = None
+            di = self.get_debug_info(dsym_path)
+            comp_dir = di.get_compilation_dir(cpu_name, abs_path)
+            if comp_dir and abs_path.startswith(comp_dir):
+                rv = self._intern_path(posixpath.relpath(abs_path, comp_dir))
+            self._filenames.set(key, rv)
+            return rv
+
     def _make_frame(self, dsym_path, cpu_name, struct):
+        if self.lazy_frames:
+            symbol = _rawstr(struct.name)
+            if not symbol:
+                return
+            return Frame(self, dsym_path, cpu_name, symbol,
+                         _rawstr(struct.filename), struct.lineno,
+                         struct.column)
+
         symbol = _symstr(struct.name)
         if not symbol:
             return
 
-        filename = None
         abs_path = _symstr(struct.filename)
         if abs_path:
-            di = self.get_debug_info(dsym_path)
-            comp_dir = di.get_compilation_dir(cpu_name, abs_path)
-            if comp_dir and abs_path.startswith(comp_dir):
-                filename = posixpath.relpath(abs_path, comp_dir)
+            abs_path = self._intern_path(abs_path)
 
         return {
             'symbol': symbol,
-            'filename': filename,
+            'filename': self._get_filename(dsym_path, cpu_name, abs_path),
             'abs_path': abs_path,
             'lineno': struct.lineno,
             'colno': struct.column,
         }
 
     def symbolize(self, dsym_path, offset, cpu_name, is_data=False):
+        with self._lock:
+            return self._symbolize(dsym_path, offset, cpu_name, is_data)
+
+    def _symbolize(self, dsym_path, offset, cpu_name, is_data):
         if self._ptr is None:
             raise RuntimeError('Symbolizer closed')
 
+        self._loaded.add((dsym_path, cpu_name))
         rv = lib.llvm_symbolizer_symbolize(
             self._ptr, to_bytes(dsym_path + ':' + cpu_name),
             offset, is_data and 1 or 0)
@@ -107,11 +403,16 @@ class Symbolizer(object):
             lib.llvm_symbol_free(rv)
 
     def symbolize_inlined(self, dsym_path, offset, cpu_name):
+        with self._lock:
+            return self._symbolize_inlined(dsym_path, offset, cpu_name)
+
+    def _symbolize_inlined(self, dsym_path, offset, cpu_name):
         if self._ptr is None:
             raise RuntimeError('Symbolizer closed')
 
         sym_out = ffi.new('llvm_symbol_t ***')
         sym_count_out = ffi.new('size_t *')
+        self._loaded.add((dsym_path, cpu_name))
 
         err = lib.llvm_symbolizer_symbolize_inlined(
             self._ptr, to_bytes(dsym_path + ':' + cpu_name),
@@ -122,7 +423,7 @@ class Symbolizer(object):
                 raise SymbolicationError(_symstr(err.error))
 
             rv = []
-            for count in xrange(sym_count_out[0]):
+            for count in range(sym_count_out[0]):
                 frm = self._make_frame(dsym_path, cpu_name,
                                        sym_out[0][count])
                 if frm:
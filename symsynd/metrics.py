@@ -0,0 +1,248 @@
+"""Lightweight instrumentation for symsynd.  Metrics are disabled by
+default and recording them costs close to nothing in that case.  Once
+enabled, counters and latency histograms are aggregated per key and can
+be retrieved with `get_stats` or pushed to an exporter callback::
+
+    from symsynd import metrics
+
+    def export(stats):
+        for key, section in stats['sections'].items():
+            statsd.timing(key, section['p99'])
+
+    metrics.enable(exporter=export, interval=10)
+
+Setting the ``SYMSYND_ENABLE_TIMERS`` environment variable to ``1``
+enables metrics with an exporter that prints to stdout.
+"""
+import os
+import sys
+import math
+import time
+from threading import Lock
+
+
+# Latencies are recorded in microseconds into logarithmic buckets with 16
+# buckets per power of two which bounds the error of the quantiles to a
+# few percent and keeps the memory per key fixed.
+_sub_buckets = 16
+
+# Durations and export intervals are measured with clocks that do not jump
+# when the system time is changed.  Python 2 only has `time.time`.
+_timer = getattr(time, 'perf_counter', time.time)
+_monotonic = getattr(time, 'monotonic', time.time)
+
+_lock = Lock()
+# Held while exporting so that exports never overlap.
+_export_lock = Lock()
+_enabled = False
+_exporter = None
+_export_interval = None
+_last_export = 0.0
+_sections = {}
+_counters = {}
+
+
+class _Histogram(object):
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        mantissa, exponent = math.frexp(value * 1e6)
+        bucket = exponent * _sub_buckets + \
+            int((mantissa - 0.5) * 2 * _sub_buckets)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        threshold = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                exponent, sub = divmod(bucket, _sub_buckets)
+                upper = math.ldexp(0.5 + (sub + 1) / (2.0 * _sub_buckets),
+                                   exponent) / 1e6
+                return min(upper, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'avg': self.count and self.total / self.count or 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class _Timer(object):
+    __slots__ = ('key', 'start')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = _timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        record(self.key, _timer() - self.start)
+
+
+class _NoopTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+_noop_timer = _NoopTimer()
+
+
+def _after_fork():
+    global _lock, _export_lock
+    _lock = Lock()
+    _export_lock = Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def is_enabled():
+    """Returns `True` if metrics are being recorded."""
+    return _enabled
+
+
+def enable(exporter=None, interval=10.0):
+    """Enables metrics.  If an `exporter` is provided it's invoked with
+    the return value of `get_stats` at most every `interval` seconds
+    while metrics are being recorded, and by `flush`.
+    """
+    global _enabled, _exporter, _export_interval, _last_export
+    with _lock:
+        _exporter = exporter
+        _export_interval = interval
+        _last_export = _monotonic()
+        _enabled = True
+
+
+def disable():
+    """Disables metrics.  Already recorded values are retained."""
+    global _enabled, _exporter
+    with _lock:
+        _enabled = False
+        _exporter = None
+
+
+def reset():
+    """Discards all recorded values."""
+    with _lock:
+        _sections.clear()
+        _counters.clear()
+
+
+def timed(key):
+    """Returns a context manager that records the time spent in the block
+    in the latency histogram for `key`.
+    """
+    if not _enabled:
+        return _noop_timer
+    return _Timer(key)
+
+
+def record(key, duration):
+    """Records a duration in seconds for `key`."""
+    if not _enabled:
+        return
+    with _lock:
+        hist = _sections.get(key)
+        if hist is None:
+            hist = _sections[key] = _Histogram()
+        hist.add(duration)
+    _maybe_export()
+
+
+def incr(key, value=1):
+    """Increments the counter for `key`."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _maybe_export()
+
+
+def get_stats():
+    """Returns a dictionary with all counters and for every timed section
+    the number of samples, the sum, average, p50, p99 and maximum in
+    seconds.
+    """
+    with _lock:
+        return _get_stats()
+
+
+def _get_stats():
+    return {
+        'counters': dict(_counters),
+        'sections': dict((key, hist.to_dict())
+                         for key, hist in _sections.items()),
+    }
+
+
+def flush():
+    """Invokes the exporter with the current values."""
+    global _last_export
+    with _export_lock:
+        with _lock:
+            exporter = _exporter
+            if exporter is None:
+                return
+            _last_export = _monotonic()
+            stats = _get_stats()
+        exporter(stats)
+
+
+def _maybe_export():
+    global _last_export
+    if _exporter is None or _export_interval is None:
+        return
+    now = _monotonic()
+    with _lock:
+        if _last_export >= now - _export_interval:
+            return
+        # Claimed under the lock so that only one thread exports.
+        _last_export = now
+    flush()
+
+
+def print_exporter(stats):
+    """An exporter that prints the values to stdout."""
+    for key, value in sorted(stats['counters'].items()):
+        sys.stdout.write('%s: %d\n' % (key, value))
+    for key, section in sorted(stats['sections'].items()):
+        sys.stdout.write('%s: n=%d p50=%.3fms p99=%.3fms max=%.3fms\n' % (
+            key,
+            section['count'],
+            section['p50'] * 1000,
+            section['p99'] * 1000,
+            section['max'] * 1000,
+        ))
+    sys.stdout.write('\n')
+
+
+if os.environ.get('SYMSYND_ENABLE_TIMERS') == '1':
+    enable(exporter=print_exporter, interval=1.0)
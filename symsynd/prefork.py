@@ -0,0 +1,243 @@
+"""Support for preforking servers.  A parent process loads the hot debug
+files once and then forks workers that share the loaded modules and the
+mapped files copy-on-write instead of loading them again each::
+
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.prefork import Prefork, preload
+
+    symbolizer = Symbolizer()
+    index = preload(symbolizer, ['/srv/dsyms'])
+
+    def work(worker_id):
+        ...  # symbolize with symbolizer and pass index to
+             # find_debug_images
+
+    Prefork(work, workers=16, symbolizer=symbolizer).run()
+
+This requires `os.fork` and as such is not available on Windows.
+"""
+import os
+import sys
+import time
+import errno
+import signal
+
+from symsynd import metrics, libsymbolizer, compressed
+from symsynd.libdebug import DebugInfo
+from symsynd.images import get_bundle_uuids, get_uuid_files
+from symsynd.exceptions import DebugInfoError
+
+
+def build_index(dsym_paths, index_dir=None):
+    """Returns a dictionary of the UUIDs of all debug files in the given
+    paths to their paths.  Like `find_debug_images` this looks at files
+    named by their UUID and all files in dSYM bundles with earlier paths
+    taking precedence.  The result can be passed as `index` to
+    `find_debug_images`.
+    """
+    files = {}
+    bundles = {}
+    for dsym_path in dsym_paths:
+        for uuid, fn in get_uuid_files(dsym_path).items():
+            files.setdefault(uuid, fn)
+        dwarf_base = os.path.join(dsym_path, 'Contents', 'Resources',
+                                  'DWARF')
+        if os.path.isdir(dwarf_base):
+            for uuid, fn in get_bundle_uuids(dwarf_base, index_dir).items():
+                bundles.setdefault(uuid, fn)
+    bundles.update(files)
+    return bundles
+
+
+def preload(symbolizer, dsym_paths, cpu_names=None, index_dir=None):
+    """Indexes all debug files in the given paths and loads them into the
+    symbolizer for all CPUs they contain or only the given `cpu_names`.
+    Returns the index as created by `build_index`.
+    """
+    index = build_index(dsym_paths, index_dir)
+    for path in sorted(set(index.values())):
+        fn = symbolizer.decompressed.acquire(path)
+        try:
+            di = DebugInfo.open_path(fn)
+        except DebugInfoError:
+            continue
+        else:
+            try:
+                cpus = set(x.cpu_name for x in di.get_variants())
+            finally:
+                di.close()
+        finally:
+            symbolizer.decompressed.release(fn)
+        if cpu_names is not None:
+            cpus &= set(cpu_names)
+        for cpu_name in sorted(cpus):
+            symbolizer.preload(path, cpu_name)
+    return index
+
+
+def after_fork(*objects):
+    """Makes the state of symsynd safe to use in a forked child.  This
+    replaces the locks of the module globals and of the given objects
+    (symbolizers, caches, file probers and debug file indexes) which might
+    have been held by another thread at the time of the fork and restarts
+    the watcher thread of a `symsynd.watcher.DebugFileIndex`.  Objects
+    without state to fix, like the index returned by `build_index`, are
+    ignored.  On Python 3.7 and later the module globals are handled
+    automatically.
+    """
+    metrics._after_fork()
+    libsymbolizer._after_fork()
+    compressed._after_fork()
+    for obj in objects:
+        if hasattr(obj, '_after_fork'):
+            obj._after_fork()
+
+
+class Prefork(object):
+    """Forks `workers` processes that each invoke `target` with the index
+    of the worker and then exit.  Everything loaded before `start` is
+    shared with the workers.  The given `symbolizer`, `prober` and `index`
+    are made safe to use in the workers with `after_fork`.
+
+    Workers that fail or are killed while the pool is running are
+    replaced.  A worker that fails within `min_uptime` seconds of being
+    started is replaced after a delay that starts at `backoff` seconds and
+    doubles with every further quick failure up to `max_backoff` seconds.
+    """
+
+    min_uptime = 10.0
+    backoff = 0.1
+    max_backoff = 30.0
+
+    def __init__(self, target, workers=None, symbolizer=None, prober=None,
+                 index=None):
+        if workers is None:
+            workers = _cpu_count()
+        self.target = target
+        self.workers = workers
+        self.symbolizer = symbolizer
+        self.prober = prober
+        self.index = index
+        self.pids = {}
+        self._running = False
+        self._started = {}
+        self._failures = {}
+        self._respawns = {}
+
+    def _spawn(self, worker_id):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = worker_id
+            self._started[worker_id] = time.time()
+            return pid
+
+        rv = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            after_fork(self.symbolizer, self.prober, self.index)
+            self.target(worker_id)
+            rv = 0
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            # os._exit skips the atexit handlers.
+            compressed.cleanup()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(rv)
+
+    def start(self):
+        """Forks the workers."""
+        self._running = True
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+    def stop(self, sig=signal.SIGTERM):
+        """Stops replacing workers and sends a signal to all of them."""
+        self._running = False
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, sig)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def _schedule_respawn(self, worker_id):
+        now = time.time()
+        if now - self._started.get(worker_id, 0) >= self.min_uptime:
+            failures = 0
+        else:
+            failures = self._failures.get(worker_id, 0) + 1
+        self._failures[worker_id] = failures
+        delay = 0
+        if failures:
+            delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+        self._respawns[worker_id] = now + delay
+
+    def _run_respawns(self):
+        """Replaces the failed workers that are due and returns the time
+        until the next one is or `None`.
+        """
+        if not self._running:
+            self._respawns.clear()
+        now = time.time()
+        for worker_id, due in sorted(self._respawns.items()):
+            if due <= now:
+                del self._respawns[worker_id]
+                self._spawn(worker_id)
+        if self._respawns:
+            return max(min(self._respawns.values()) - now, 0)
+
+    def wait(self):
+        """Waits for all workers to exit while replacing the ones that
+        fail as long as the pool is running.
+        """
+        while self.pids or self._respawns:
+            delay = self._run_respawns()
+            try:
+                pid, status = os.waitpid(
+                    -1, delay is not None and os.WNOHANG or 0)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    self.pids.clear()
+                    if delay is not None:
+                        time.sleep(delay)
+                    continue
+                raise
+            if not pid:
+                # Workers are waiting to be replaced, so poll.
+                time.sleep(min(delay, 0.05))
+                continue
+            worker_id = self.pids.pop(pid, None)
+            if worker_id is not None and self._running and status != 0:
+                self._schedule_respawn(worker_id)
+
+    def run(self):
+        """Starts the workers and waits for them until the parent is
+        interrupted or terminated.
+        """
+        def _handle_signal(signum, frame):
+            self.stop()
+
+        old_term = signal.signal(signal.SIGTERM, _handle_signal)
+        old_int = signal.signal(signal.SIGINT, _handle_signal)
+        try:
+            self.start()
+            self.wait()
+        finally:
+            signal.signal(signal.SIGTERM, old_term)
+            signal.signal(signal.SIGINT, old_int)
+
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
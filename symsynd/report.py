@@ -0,0 +1,152 @@
+import logging
+
+from symsynd.images import find_debug_images, ImageLookup, \
+    get_image_cpu_name
+from symsynd.heuristics import find_best_instructions
+from symsynd.demangle import demangle_symbol
+from symsynd.utils import parse_addr
+from symsynd.exceptions import SymbolicationError, DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean a frame cannot be symbolized: a broken or missing debug
+# file or an address that does not fit the image.
+_frame_errors = (SymbolicationError, EnvironmentError, ValueError)
+
+
+class ReportSymbolizer(object):
+    """Symbolizes the backtraces of an entire crash report.  The images
+    of the report are located once when the report symbolizer is created
+    and all backtraces are then symbolized with a single batch lookup on
+    the given symbolizer so frames shared between threads are only
+    resolved once.
+
+    Symbolized frames are copies of the original frames with the
+    `symbol_name`, `filename`, `line` and `column` keys set.  Inlined
+    frames expand into multiple frames and frames that cannot be
+    symbolized are returned unchanged.  Frames that were not symbolized
+    because the deadline passed are copies with `deadline_exceeded` set.
+
+    `index_dir`, `prober` and `index` are passed to `find_debug_images`
+    as is the `negative_cache` of the symbolizer.
+    """
+
+    def __init__(self, symbolizer, dsym_paths, binary_images,
+                 index_dir=None, prober=None, index=None):
+        self.symbolizer = symbolizer
+        self.images = ImageLookup(binary_images)
+        self.image_paths = find_debug_images(
+            dsym_paths, binary_images, index_dir=index_dir, prober=prober,
+            index=index,
+            negative_cache=getattr(symbolizer, 'negative_cache', None))
+
+    def symbolize_backtrace(self, backtrace, meta=None, deadline=None):
+        """Symbolizes a single backtrace.  If `meta` is provided it's used
+        to improve the instruction addresses with
+        `find_best_instructions`.
+        """
+        return self.symbolize_backtraces([backtrace], [meta], deadline)[0]
+
+    def symbolize_backtraces(self, backtraces, metas=None, deadline=None):
+        """Symbolizes a list of backtraces, for instance of all the threads
+        in a crash.  `metas` is an optional list with the meta information
+        for each backtrace.  The `deadline` is passed to
+        `Symbolizer.symbolize_frames`.
+        """
+        lookups, lookup_frames = self._prepare_lookups(backtraces, metas)
+        kwargs = {}
+        if deadline is not None:
+            kwargs['deadline'] = deadline
+        results = self.symbolizer.symbolize_frames(
+            lookups, symbolize_inlined=True, **kwargs)
+        return self._apply_results(backtraces, lookup_frames, results)
+
+    def _prepare_lookups(self, backtraces, metas=None):
+        if metas is None:
+            metas = [None] * len(backtraces)
+
+        lookups = []
+        lookup_frames = []
+        for bt_idx, (backtrace, meta) in enumerate(zip(backtraces, metas)):
+            imgs = self.images.find_images(
+                [frame['instruction_addr'] for frame in backtrace])
+            bt_lookups = []
+            for idx, (frame, img) in enumerate(zip(backtrace, imgs)):
+                lookup = self._make_lookup(frame, img)
+                if lookup is not None:
+                    bt_lookups.append((idx, lookup))
+            if meta is not None:
+                self._apply_heuristics(bt_lookups, meta)
+            for idx, lookup in bt_lookups:
+                lookups.append(lookup)
+                lookup_frames.append((bt_idx, idx))
+        return lookups, lookup_frames
+
+    def _apply_heuristics(self, bt_lookups, meta):
+        by_cpu = {}
+        for idx, lookup in bt_lookups:
+            by_cpu.setdefault(lookup['cpu_name'], []).append((idx, lookup))
+        for cpu_name, items in by_cpu.items():
+            addrs = find_best_instructions(
+                [lookup['instruction_addr'] for _, lookup in items],
+                cpu_name, meta, [idx for idx, _ in items])
+            for (_, lookup), addr in zip(items, addrs):
+                lookup['instruction_addr'] = addr
+
+    def _apply_results(self, backtraces, lookup_frames, results,
+                       demangled=None):
+        results = dict(zip(lookup_frames, results))
+        if demangled is None:
+            demangled = {}
+
+        rv = []
+        for bt_idx, backtrace in enumerate(backtraces):
+            new_backtrace = []
+            for idx, frame in enumerate(backtrace):
+                result = results.get((bt_idx, idx))
+                if isinstance(result, DeadlineExceeded):
+                    new_frame = dict(frame)
+                    new_frame['deadline_exceeded'] = True
+                    new_backtrace.append(new_frame)
+                    continue
+                if isinstance(result, Exception):
+                    if not isinstance(result, _frame_errors):
+                        logger.error('Unexpected error symbolizing frame',
+                                     exc_info=(result.__class__, result,
+                                               getattr(result, '__traceback__',
+                                                       None)))
+                    new_backtrace.append(frame)
+                    continue
+                if not result:
+                    new_backtrace.append(frame)
+                    continue
+                for sym in result:
+                    symbol = sym['symbol']
+                    symbol_name = demangled.get(symbol)
+                    if symbol_name is None:
+                        symbol_name = demangled[symbol] = \
+                            demangle_symbol(symbol)
+                    new_frame = dict(frame)
+                    new_frame['symbol_name'] = symbol_name
+                    new_frame['filename'] = sym['abs_path']
+                    new_frame['line'] = sym['lineno']
+                    new_frame['column'] = sym['colno']
+                    new_backtrace.append(new_frame)
+            rv.append(new_backtrace)
+        return rv
+
+    def _make_lookup(self, frame, img):
+        if img is None:
+            return
+        dsym_path = self.image_paths.get(parse_addr(img['image_addr']))
+        if dsym_path is None:
+            return
+
+        return {
+            'dsym_path': dsym_path,
+            'image_vmaddr': img.get('image_vmaddr'),
+            'image_addr': img['image_addr'],
+            'instruction_addr': frame['instruction_addr'],
+            'cpu_name': get_image_cpu_name(img),
+        }
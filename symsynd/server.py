@@ -0,0 +1,481 @@
+"""A local symbolication daemon.  The server owns warm symbolizers and
+caches and serves requests over a Unix domain socket so that short lived
+processes get warm lookups without loading debug files themselves::
+
+    $ symsynd-server -s /tmp/symsynd.sock -d path/to/dsyms --preload
+
+The server forks one worker per core (see `symsynd.prefork`) which all
+accept connections on the same socket.  Every message is a JSON object
+prefixed with its length as a 32 bit big endian integer.  Requests carry
+an ``id`` and an ``op`` and are answered in order on each connection, so
+clients can pipeline them.  Symbolication requests can carry a
+``timeout`` in seconds after which the remaining frames are left
+unsymbolized (for reports it applies to every window of reports).  The
+supported operations are:
+
+``symbolize_frames``
+    takes ``frames`` and ``symbolize_inlined`` and returns the
+    ``results`` of `Symbolizer.symbolize_frames`.  Errors are returned as
+    objects with an ``error`` and a ``type`` key.
+``symbolize_reports``
+    takes ``reports`` and optionally ``dsym_paths`` (defaulting to the
+    paths of the server) and returns the symbolized ``reports`` as
+    `symsynd.batch.symbolize_reports` does.
+
+Clients can only make the server open debug files within the paths it
+was started with.  Frames with other debug files get an error instead
+and reports with other ``dsym_paths`` are rejected.  The socket is only
+accessible by the user of the server unless another mode is given.
+``stats``
+    returns the ``stats`` of the symbolizer of the worker.
+``ping``
+    returns an empty response.
+
+`Client` implements the protocol with a pool of connections.
+"""
+import os
+import json
+import time
+import errno
+import socket
+import struct
+import argparse
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from symsynd import exceptions
+from symsynd._compat import string_types
+
+
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+_header = struct.Struct('>I')
+
+
+class ProtocolError(Exception):
+    """Raised if a peer sends invalid data."""
+
+
+def _recv_exact(sock, size):
+    buf = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        buf.append(chunk)
+        size -= len(chunk)
+    return b''.join(buf)
+
+
+def read_frame(sock):
+    """Reads a message from a socket.  Returns `None` if the peer closed
+    the connection.
+    """
+    header = _recv_exact(sock, _header.size)
+    if header is None:
+        return None
+    size = _header.unpack(header)[0]
+    if size > MAX_FRAME_SIZE:
+        raise ProtocolError('Frame too large (%d bytes)' % size)
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        raise ProtocolError('Connection closed mid-frame')
+    return json.loads(payload.decode('utf-8'))
+
+
+def encode_frame(obj):
+    """Encodes a message."""
+    payload = json.dumps(obj).encode('utf-8')
+    return _header.pack(len(payload)) + payload
+
+
+def _encode_error(exc):
+    message = getattr(exc, 'message', None)
+    if not message or not isinstance(message, string_types):
+        message = '%s' % (exc,)
+    return {'error': message, 'type': exc.__class__.__name__}
+
+
+def _encode_result(result):
+    if isinstance(result, Exception):
+        return _encode_error(result)
+    return result
+
+
+def _decode_result(result):
+    if isinstance(result, dict) and 'error' in result and 'type' in result:
+        cls = getattr(exceptions, result['type'], None)
+        if not isinstance(cls, type) or \
+           not issubclass(cls, exceptions.SymbolicationError):
+            cls = exceptions.SymbolicationError
+        return cls(result['error'])
+    return result
+
+
+def _remove_stale_socket(path):
+    """Removes the socket of a server that is no longer running.  Raises
+    an error if a server still accepts connections on it.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        if e.errno == errno.ENOENT:
+            return
+        if e.errno != errno.ECONNREFUSED:
+            raise
+    else:
+        raise socket.error(errno.EADDRINUSE,
+                           'A server is already running on %s' % path)
+    finally:
+        sock.close()
+    os.unlink(path)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while 1:
+            try:
+                request = read_frame(self.request)
+            except (ProtocolError, ValueError, socket.error):
+                return
+            if request is None:
+                return
+            response = self.server.dispatch(request)
+            try:
+                self.request.sendall(encode_frame(response))
+            except socket.error:
+                return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves requests on a Unix domain socket at `path` with the given
+    symbolizer.  A socket left behind by a server that is gone is replaced
+    but if another server is still running on `path` an error is raised.
+    The socket is created with the permissions in `socket_mode`.
+    `dsym_paths` are the paths used for reports and the only paths
+    debug files are opened from.  `index_dir`, `prober` and `index` are
+    passed to `find_debug_images`.  Debug files missing from a static
+    `index` (as built by ``--preload``) are still looked for in
+    `dsym_paths` so that new uploads are found.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, path, symbolizer, dsym_paths=(), index_dir=None,
+                 prober=None, index=None, socket_mode=0o600):
+        _remove_stale_socket(path)
+        self.path = path
+        self.socket_mode = socket_mode
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        self.symbolizer = symbolizer
+        self.dsym_paths = list(dsym_paths)
+        self._roots = [os.path.abspath(x) for x in self.dsym_paths]
+        self.index_dir = index_dir
+        self.prober = prober
+        self.index = index
+
+    def server_bind(self):
+        # The socket is created for the user only so that there is no
+        # window in which others could connect before the chmod.
+        old_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.path, self.socket_mode)
+
+    def is_allowed_path(self, path):
+        """Checks if a path is within the paths of the server."""
+        path = os.path.abspath(path)
+        for root in self._roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return True
+        return False
+
+    def _symbolize_frames(self, frames, symbolize_inlined, deadline):
+        rv = [None] * len(frames)
+        allowed = []
+        for idx, frame in enumerate(frames):
+            if self.is_allowed_path(frame['dsym_path']):
+                allowed.append(idx)
+            else:
+                rv[idx] = exceptions.SymbolicationError(
+                    'Debug file outside of the search paths')
+        results = self.symbolizer.symbolize_frames(
+            [frames[idx] for idx in allowed],
+            symbolize_inlined=symbolize_inlined, deadline=deadline)
+        for idx, result in zip(allowed, results):
+            rv[idx] = result
+        return rv
+
+    def dispatch(self, request):
+        """Handles a single request and returns the response."""
+        rv = {'id': None}
+        try:
+            if not isinstance(request, dict):
+                raise ProtocolError('Requests must be objects')
+            rv['id'] = request.get('id')
+            op = request.get('op')
+            if op == 'symbolize_frames':
+                deadline = None
+                if request.get('timeout') is not None:
+                    deadline = time.time() + request['timeout']
+                results = self._symbolize_frames(
+                    request['frames'],
+                    request.get('symbolize_inlined', False), deadline)
+                rv['results'] = [_encode_result(x) for x in results]
+            elif op == 'symbolize_reports':
+                from symsynd.batch import symbolize_reports
+                dsym_paths = request.get('dsym_paths') or self.dsym_paths
+                for path in dsym_paths:
+                    if not self.is_allowed_path(path):
+                        raise ProtocolError('%s is outside of the search '
+                                            'paths' % (path,))
+                rv['reports'] = list(symbolize_reports(
+                    self.symbolizer, dsym_paths,
+                    request['reports'], index_dir=self.index_dir,
+                    prober=self.prober, index=self.index,
+                    timeout=request.get('timeout')))
+            elif op == 'stats':
+                rv['stats'] = self.symbolizer.stats()
+            elif op != 'ping':
+                raise ProtocolError('Unknown operation %r' % (op,))
+        except Exception as e:
+            rv.update(_encode_error(e))
+        return rv
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class RemoteError(Exception):
+    """Raised by the client if the server failed to handle a request."""
+
+    def __init__(self, message, type):
+        Exception.__init__(self, message)
+        self.type = type
+
+
+class Client(object):
+    """A client for the symbolication server.  Connections are pooled and
+    reused, up to `pool_size` of them are kept open.  The client is
+    thread safe.
+    """
+
+    def __init__(self, path, pool_size=4, timeout=None):
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        """Closes all pooled connections."""
+        with self._lock:
+            pool = self._pool
+            self._pool = []
+        for sock in pool:
+            sock.close()
+
+    def _get_connection(self):
+        with self._lock:
+            if self._pool:
+                return self._pool.pop()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _release_connection(self, sock):
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(sock)
+                return
+        sock.close()
+
+    def pipeline(self, requests):
+        """Sends a list of requests as created by `request` on a single
+        connection without waiting for the responses in between and
+        returns the responses in order.  If there is more than one request
+        they are sent from a background thread while the responses are
+        read so that neither side blocks on a full socket buffer.
+        """
+        sock = self._get_connection()
+        try:
+            data = b''.join(encode_frame(x) for x in requests)
+            if len(requests) > 1:
+                responses = self._exchange(sock, data, requests)
+            else:
+                sock.sendall(data)
+                responses = self._read_responses(sock, requests)
+        except Exception:
+            sock.close()
+            raise
+        self._release_connection(sock)
+        return [self._unpack(x) for x in responses]
+
+    def _exchange(self, sock, data, requests):
+        errors = []
+
+        def send():
+            try:
+                sock.sendall(data)
+            except Exception as e:
+                errors.append(e)
+
+        sender = threading.Thread(target=send, name='symsynd-client-send')
+        sender.daemon = True
+        sender.start()
+        try:
+            rv = self._read_responses(sock, requests)
+        except Exception:
+            # Unblocks the sender if the server stopped reading.
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            raise
+        finally:
+            sender.join()
+        if errors:
+            raise errors[0]
+        return rv
+
+    def _read_responses(self, sock, requests):
+        rv = []
+        for request in requests:
+            response = read_frame(sock)
+            if response is None or response.get('id') != request['id']:
+                raise ProtocolError('Unexpected response')
+            rv.append(response)
+        return rv
+
+    def _unpack(self, response):
+        if 'error' in response:
+            raise RemoteError(response['error'], response.get('type'))
+        if 'results' in response:
+            return [_decode_result(x) for x in response['results']]
+        if 'reports' in response:
+            return response['reports']
+        return response.get('stats')
+
+    def request(self, op, **kwargs):
+        """Creates a request for `pipeline`."""
+        with self._lock:
+            self._next_id += 1
+            kwargs['id'] = self._next_id
+        kwargs['op'] = op
+        return kwargs
+
+    def symbolize_frames(self, frames, symbolize_inlined=False,
+                         timeout=None):
+        """Like `Symbolizer.symbolize_frames` but executed by the
+        server.  The server stops symbolizing after `timeout` seconds.
+        """
+        return self.pipeline([self.request(
+            'symbolize_frames', frames=frames,
+            symbolize_inlined=symbolize_inlined, timeout=timeout)])[0]
+
+    def symbolize_reports(self, reports, dsym_paths=None, timeout=None):
+        """Like `symsynd.batch.symbolize_reports` but executed by the
+        server and returning a list.
+        """
+        kwargs = {'reports': list(reports), 'timeout': timeout}
+        if dsym_paths is not None:
+            kwargs['dsym_paths'] = list(dsym_paths)
+        return self.pipeline([self.request('symbolize_reports',
+                                           **kwargs)])[0]
+
+    def stats(self):
+        """Returns the stats of the symbolizer of the worker serving the
+        request.
+        """
+        return self.pipeline([self.request('stats')])[0]
+
+    def ping(self):
+        """Checks that the server is responding."""
+        self.pipeline([self.request('ping')])
+
+
+def main(args=None):
+    """Command line entry point."""
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.cache import LRUCache, TTLCache
+    from symsynd.prefork import Prefork, preload
+
+    parser = argparse.ArgumentParser(
+        prog='symsynd-server',
+        description='Serves symbolication requests on a Unix socket.')
+    parser.add_argument('-s', '--socket', required=True,
+                        help='The path of the socket.')
+    parser.add_argument('-d', '--dsym-path', dest='dsym_paths',
+                        action='append', default=[],
+                        help='A folder or dSYM bundle to look for debug '
+                        'files in.  Can be provided multiple times.')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='The number of worker processes.  Defaults '
+                        'to the number of cores.')
+    parser.add_argument('--preload', action='store_true',
+                        help='Load all debug files before forking the '
+                        'workers.')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                        help='The number of results to cache per worker.')
+    parser.add_argument('--negative-ttl', type=float, default=60,
+                        help='The number of seconds to remember images and '
+                        'addresses that could not be symbolized.  0 '
+                        'disables this.')
+    parser.add_argument('--index-dir',
+                        help='A folder to keep the index of dSYM bundle '
+                        'contents in.')
+    parser.add_argument('--socket-mode', type=lambda x: int(x, 8),
+                        default=0o600,
+                        help='The permissions of the socket in octal.  '
+                        'Defaults to 600 (only the user of the server).')
+    args = parser.parse_args(args)
+
+    symbolizer = Symbolizer(
+        cache=args.cache_size and LRUCache(max_entries=args.cache_size) or
+        None,
+        negative_cache=args.negative_ttl and
+        TTLCache(args.negative_ttl, max_entries=args.cache_size or None) or
+        None)
+    index = None
+    if args.preload:
+        index = preload(symbolizer, args.dsym_paths,
+                        index_dir=args.index_dir)
+
+    server = Server(args.socket, symbolizer, args.dsym_paths,
+                    index_dir=args.index_dir, index=index,
+                    socket_mode=args.socket_mode)
+    try:
+        Prefork(lambda worker_id: server.serve_forever(),
+                workers=args.workers, symbolizer=symbolizer,
+                index=index).run()
+    finally:
+        server.server_close()
+        symbolizer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""Creates slim copies of debug files.  Debug files usually contain
+multiple architectures and DWARF sections the symbolizer never reads
+(accelerator tables, frame information and the like).  This rewrites a
+debug file into one thin Mach-O file per architecture that contains the
+load commands (and as such the UUID and segments), the symbol table and
+only the DWARF sections needed for symbolication.  The files are named by
+their UUID so they can be put into a folder passed to
+`find_debug_images`::
+
+    $ python -m symsynd.slim -o path/to/slim Foo.app.dSYM
+
+Dropped sections keep their headers with a size of zero.
+"""
+import os
+import sys
+import struct
+import argparse
+import uuid as uuid_mod
+
+
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+
+LC_SEGMENT = 0x1
+LC_SYMTAB = 0x2
+LC_DYSYMTAB = 0xb
+LC_UUID = 0x1b
+LC_SEGMENT_64 = 0x19
+LC_CODE_SIGNATURE = 0x1d
+LC_SEGMENT_SPLIT_INFO = 0x1e
+LC_FUNCTION_STARTS = 0x26
+LC_DATA_IN_CODE = 0x29
+LC_DYLIB_CODE_SIGN_DRS = 0x2b
+
+_linkedit_data_commands = frozenset([
+    LC_CODE_SIGNATURE, LC_SEGMENT_SPLIT_INFO, LC_FUNCTION_STARTS,
+    LC_DATA_IN_CODE, LC_DYLIB_CODE_SIGN_DRS,
+])
+
+# Sections of the DWARF segment that are not needed for symbolication.
+DROPPED_SECTIONS = frozenset([
+    '__apple_names',
+    '__apple_namespac',
+    '__apple_types',
+    '__apple_objc',
+    '__debug_pubnames',
+    '__debug_pubtypes',
+    '__debug_frame',
+    '__debug_macinfo',
+    '__debug_inlined',
+    '__debug_loc',
+    '__swift_ast',
+])
+
+_fat_arch = struct.Struct('>iiIII')
+_fat_arch_64 = struct.Struct('>iiQQII')
+_load_command = struct.Struct('<II')
+_symtab_command = struct.Struct('<IIIIII')
+_dysymtab_offsets = ((32, 36), (40, 44), (48, 52), (56, 60), (64, 68),
+                     (72, 76))
+
+
+class _Layout(object):
+
+    def __init__(self, is_64):
+        self.is_64 = is_64
+        if is_64:
+            self.header = struct.Struct('<IiiIIIII')
+            self.segment = struct.Struct('<II16sQQQQiiII')
+            self.section = struct.Struct('<16s16sQQIIIIIIII')
+            self.nlist = struct.Struct('<IBBHQ')
+        else:
+            self.header = struct.Struct('<IiiIIII')
+            self.segment = struct.Struct('<II16sIIIIiiII')
+            self.section = struct.Struct('<16s16sIIIIIIIII')
+            self.nlist = struct.Struct('<IBBHI')
+
+
+def _parse_header(data):
+    magic = struct.unpack_from('<I', data)[0]
+    if magic not in (MH_MAGIC, MH_MAGIC_64):
+        raise ValueError('Not a Mach-O file')
+    layout = _Layout(magic == MH_MAGIC_64)
+    return layout, layout.header.unpack_from(data)
+
+
+def _cstr(value):
+    return value.split(b'\x00', 1)[0].decode('ascii', 'replace')
+
+
+def _align(value, alignment=16):
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+def iter_slices(data):
+    """Yields the offsets and sizes of the Mach-O files in a fat or thin
+    file.
+    """
+    magic = struct.unpack_from('>I', data)[0]
+    if magic in (FAT_MAGIC, FAT_MAGIC_64):
+        fat_arch = magic == FAT_MAGIC_64 and _fat_arch_64 or _fat_arch
+        nfat = struct.unpack_from('>I', data, 4)[0]
+        for idx in range(nfat):
+            offset, size = fat_arch.unpack_from(
+                data, 8 + idx * fat_arch.size)[2:4]
+            yield offset, size
+    else:
+        yield 0, len(data)
+
+
+def get_cpu_type(data):
+    """Returns ``(cputype, cpusubtype)`` of a thin Mach-O file."""
+    header = _parse_header(data)[1]
+    return header[1], header[2]
+
+
+def iter_symbols(data):
+    """Yields ``(n_type, n_sect, n_value)`` for every entry of the symbol
+    table of a thin Mach-O file.
+    """
+    layout, header = _parse_header(data)
+    offset = layout.header.size
+    for _ in range(header[4]):
+        cmd, cmdsize = _load_command.unpack_from(data, offset)
+        if cmd == LC_SYMTAB:
+            symoff, nsyms = _symtab_command.unpack_from(data, offset)[2:4]
+            for idx in range(nsyms):
+                _, n_type, n_sect, _, n_value = layout.nlist.unpack_from(
+                    data, symoff + idx * layout.nlist.size)
+                yield n_type, n_sect, n_value
+        offset += cmdsize
+
+
+def slim_macho(data, dropped_sections=DROPPED_SECTIONS):
+    """Rewrites a thin Mach-O file without the given DWARF sections and
+    returns ``(cputype, cpusubtype, uuid, new_data)``.
+    """
+    layout, header = _parse_header(data)
+    cputype, cpusubtype, ncmds, sizeofcmds = \
+        header[1], header[2], header[4], header[5]
+
+    # Collect the load commands first so that the data can be laid out
+    # after them.
+    commands = []
+    offset = layout.header.size
+    for _ in range(ncmds):
+        cmd, cmdsize = _load_command.unpack_from(data, offset)
+        commands.append((cmd, offset, cmdsize))
+        offset += cmdsize
+
+    out = bytearray(data[:layout.header.size + sizeofcmds])
+    blocks = []
+    image_uuid = None
+
+    def append(chunk):
+        start = _align(len(out))
+        out.extend(b'\x00' * (start - len(out)))
+        out.extend(chunk)
+        return start
+
+    def relocate(old):
+        for start, end, new_start in blocks:
+            if start <= old < end or old == end != start:
+                return new_start + old - start
+
+    def copy_block(start, size):
+        new_start = append(data[start:start + size])
+        blocks.append((start, start + size, new_start))
+        return new_start
+
+    segment_sections = layout.section.size
+    for cmd, offset, cmdsize in commands:
+        if cmd == LC_UUID:
+            image_uuid = uuid_mod.UUID(bytes=bytes(data[offset + 8:
+                                                        offset + 24]))
+        if cmd not in (LC_SEGMENT, LC_SEGMENT_64):
+            continue
+        seg = list(layout.segment.unpack_from(data, offset))
+        segname, fileoff, filesize, nsects = \
+            _cstr(seg[2]), seg[5], seg[6], seg[9]
+        if not filesize:
+            continue
+
+        sect_base = offset + layout.segment.size
+        if segname != '__DWARF':
+            new_fileoff = copy_block(fileoff, filesize)
+            for idx in range(nsects):
+                sect_offset = sect_base + idx * segment_sections
+                sect = list(layout.section.unpack_from(data, sect_offset))
+                if sect[4]:
+                    sect[4] += new_fileoff - fileoff
+                    layout.section.pack_into(out, sect_offset, *sect)
+        else:
+            new_fileoff = _align(len(out))
+            for idx in range(nsects):
+                sect_offset = sect_base + idx * segment_sections
+                sect = list(layout.section.unpack_from(data, sect_offset))
+                size = sect[3]
+                if _cstr(sect[0]) in dropped_sections or not sect[4]:
+                    sect[3] = 0
+                    sect[4] = 0
+                else:
+                    sect[4] = append(data[sect[4]:sect[4] + size])
+                # dSYMs have no relocations
+                sect[6] = sect[7] = 0
+                layout.section.pack_into(out, sect_offset, *sect)
+            filesize = len(out) - new_fileoff
+
+        seg[5] = new_fileoff
+        seg[6] = filesize
+        layout.segment.pack_into(out, offset, *seg)
+
+    # Commands that point into the file, usually into __LINKEDIT.
+    def fix(offset, field, size_field=None):
+        old = struct.unpack_from('<I', data, offset + field)[0]
+        if not old:
+            return
+        new = relocate(old)
+        if new is None:
+            size = size_field is not None and \
+                struct.unpack_from('<I', data, offset + size_field)[0] or 0
+            new = copy_block(old, size)
+        struct.pack_into('<I', out, offset + field, new)
+
+    for cmd, offset, cmdsize in commands:
+        if cmd == LC_SYMTAB:
+            _, _, symoff, nsyms, stroff, strsize = \
+                _symtab_command.unpack_from(data, offset)
+            if relocate(symoff) is None:
+                copy_block(symoff, nsyms * layout.nlist.size)
+            if relocate(stroff) is None:
+                copy_block(stroff, strsize)
+            fix(offset, 8)
+            fix(offset, 16)
+        elif cmd == LC_DYSYMTAB:
+            for field, count_field in _dysymtab_offsets:
+                old = struct.unpack_from('<I', data, offset + field)[0]
+                if old:
+                    new = relocate(old)
+                    struct.pack_into('<I', out, offset + field,
+                                     new or 0)
+                    if new is None:
+                        struct.pack_into('<I', out, offset + count_field, 0)
+        elif cmd in _linkedit_data_commands:
+            fix(offset, 8, 12)
+
+    return cputype, cpusubtype, image_uuid, bytes(out)
+
+
+def slim_debug_file(path, output_dir, cpu_names=None,
+                    dropped_sections=DROPPED_SECTIONS):
+    """Writes a slim copy of every architecture (or only the given
+    `cpu_names`) of a debug file into `output_dir` named by UUID and
+    returns a dictionary of UUIDs to the written paths.
+    """
+    from symsynd.libdebug import get_cpu_name
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    rv = {}
+    for offset, size in iter_slices(data):
+        cputype, cpusubtype, image_uuid, slim = slim_macho(
+            data[offset:offset + size], dropped_sections)
+        if cpu_names is not None and \
+           get_cpu_name(cputype, cpusubtype) not in cpu_names:
+            continue
+        if image_uuid is None:
+            continue
+        fn = os.path.join(output_dir, str(image_uuid))
+        tmp = fn + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(slim)
+        os.rename(tmp, fn)
+        rv[str(image_uuid)] = fn
+    return rv
+
+
+def _iter_debug_files(path):
+    dwarf_base = os.path.join(path, 'Contents', 'Resources', 'DWARF')
+    if os.path.isdir(dwarf_base):
+        for fn in sorted(os.listdir(dwarf_base)):
+            yield os.path.join(dwarf_base, fn)
+    else:
+        yield path
+
+
+def main(args=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        prog='symsynd-slim',
+        description='Writes slim copies of debug files with one file per '
+        'architecture named by UUID.')
+    parser.add_argument('paths', nargs='+',
+                        help='Debug files or dSYM bundles.')
+    parser.add_argument('-o', '--output', required=True,
+                        help='The folder to write the files to.')
+    parser.add_argument('-a', '--arch', dest='cpu_names', action='append',
+                        help='Only write the given architectures.  Can be '
+                        'provided multiple times.')
+    args = parser.parse_args(args)
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    for path in args.paths:
+        for fn in _iter_debug_files(path):
+            before = os.path.getsize(fn)
+            for image_uuid, out in sorted(slim_debug_file(
+                    fn, args.output, args.cpu_names).items()):
+                sys.stdout.write('%s -> %s (%d of %d bytes)\n' % (
+                    fn, out, os.path.getsize(out), before))
+
+
+if __name__ == '__main__':
+    main()
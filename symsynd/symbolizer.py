@@ -1,11 +1,25 @@
 import os
+import time
 import errno
-from threading import RLock
+from threading import RLock, Event, Thread
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from symsynd.libdebug import is_valid_cpu_name
-from symsynd.utils import parse_addr, timedsection
-from symsynd.exceptions import SymbolicationError
-from symsynd.libsymbolizer import Symbolizer as LowLevelSymbolizer
+from symsynd.utils import parse_addr
+from symsynd import metrics
+from symsynd.exceptions import SymbolicationError, DeadlineExceeded
+from symsynd.compressed import DecompressedCache
+from symsynd.libsymbolizer import Symbolizer as LowLevelSymbolizer, Frame
+from symsynd.cache import LRUCache
+
+
+_missing = object()
+_lookup_errors = (SymbolicationError, EnvironmentError, ValueError)
+_loader_threads = 4
 
 
 def normalize_dsym_path(p):
@@ -17,17 +31,183 @@ def normalize_dsym_path(p):
     return p
 
 
+def _get_file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def _copy_result(rv):
+    # Lazy frames are read-only and shared as they are.
+    if isinstance(rv, list):
+        return [x if isinstance(x, Frame) else dict(x) for x in rv]
+    if rv is not None and not isinstance(rv, Frame):
+        return dict(rv)
+    return rv
+
+
+def _estimate_result_size(rv):
+    if rv is None:
+        return 64
+    if isinstance(rv, list):
+        return 64 + sum(_estimate_result_size(x) for x in rv)
+    if isinstance(rv, Frame):
+        # Measured without decoding the strings or looking up the
+        # filename which is at most as long as the absolute path.
+        strings = (rv._symbol, rv._abs_path, rv._abs_path)
+    else:
+        strings = (rv['symbol'], rv['filename'], rv['abs_path'])
+    return 256 + sum(len(x) for x in strings if x)
+
+
+def _deadline_exceeded():
+    return DeadlineExceeded('Deadline exceeded')
+
+
+class _Job(object):
+    __slots__ = ('func', 'args', 'result', 'error', 'done')
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+    def wait(self, deadline):
+        """Waits for the job until the deadline and returns the result
+        or `DeadlineExceeded` if it did not finish in time.
+        """
+        timeout = deadline - time.time()
+        if timeout > 0:
+            self.done.wait(timeout)
+        if not self.done.is_set():
+            return _deadline_exceeded()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _Worker(object):
+    """Loads debug files on background threads so that callers can stop
+    waiting once their deadline passed while the load continues.
+    """
+
+    def __init__(self, threads=_loader_threads):
+        self._queue = queue.Queue()
+        self._threads = []
+        for idx in range(threads):
+            thread = Thread(target=self._run, name='symsynd-loader-%d' % idx)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, func, args):
+        job = _Job(func, args)
+        self._queue.put(job)
+        return job
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while 1:
+            job = self._queue.get()
+            if job is None:
+                break
+            try:
+                job.result = job.func(*job.args)
+            except Exception as e:
+                job.error = e
+            job.done.set()
+
+
 class Symbolizer(object):
     """The main symbolication driver.  This abstracts around a low level
     LLVM based symbolizer that works with DWARF files.  It's recommended to
     explicitly close the driver to ensure memory cleans up timely.
+
+    Optionally a `cache` can be provided (for instance an instance of
+    `symsynd.cache.LRUCache` or the persistent `SqliteCache`) in which
+    case the results are cached by image UUID, CPU name, address and
+    inlining flag.  Cached dictionaries are copied when handed out so they
+    cannot be modified by callers.
+
+    If `timing` is enabled the native code records how much time is spent
+    loading each debug file versus looking up addresses in it which can be
+    retrieved with `get_module_timings`.
+
+    Debug files can be gzip or zstd compressed in which case they are
+    decompressed on first use into `decompressed`, a
+    `symsynd.compressed.DecompressedCache`.  If none is given the
+    symbolizer creates its own which is cleared when it is closed.
+
+    With `lazy_frames` the results are `symsynd.libsymbolizer.Frame`
+    objects which only decode strings when accessed and otherwise behave
+    like read-only dictionaries.  Use ``dict(frame)`` where a real
+    dictionary is required (for instance to serialize it as JSON).
+    Frames are shared between repeated addresses and kept in the cache
+    as they are, only results served from a persistent cache such as
+    `symsynd.cache.SqliteCache` are dictionaries.
+
+    A `negative_cache` (usually a `symsynd.cache.TTLCache`) remembers
+    failures: images that cannot be loaded and addresses that cannot be
+    symbolized.  Until the entries expire a new error of the same class
+    and with the same message is handed out without touching the file
+    system or the debug file.  Use
+    `try_symbolize` to get errors returned instead of raised.
+
+    The paths, UUIDs and vmaddrs of the images of up to `max_images` debug
+    files and CPUs are remembered.  The modification time and size of the
+    file of an image are compared to the ones it was loaded with at most
+    once every `check_interval` seconds and whenever a lookup in it fails
+    so that replaced debug files are loaded again.  In between, repeated
+    lookups and cache hits do not touch the file system.  Once the last
+    image of a debug file is no longer remembered its module is closed.
+
+    All lookups accept a `deadline` (a timestamp as returned by
+    `time.time`).  With a deadline debug files that are not loaded yet
+    are loaded on background threads and the caller stops waiting for
+    them once the deadline passed in which case a `DeadlineExceeded`
+    error is raised or put in place of the result.  The loads continue in
+    the background so that later lookups find them ready.  Every debug
+    file has its own LLVM symbolizer so lookups in loaded files are not
+    blocked by loads of others and happen on the calling thread.  A
+    lookup that already started is not interrupted.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None, timing=False, decompressed=None,
+                 lazy_frames=False, negative_cache=None, max_images=10000,
+                 check_interval=1.0):
         self._lock = RLock()
         self._proc = None
         self._closed = False
-        self._symbolizer = LowLevelSymbolizer()
+        self._timing = timing
+        self._lazy_frames = lazy_frames
+        self._modules = {}
+        self._module_stamps = {}
+        self._warm = set()
+        # (dsym_path, cpu_name) -> [image, stamp, time of the last check]
+        self._images = LRUCache(max_entries=max_images,
+                                on_remove=self._image_removed)
+        # image_path -> {(dsym_path, cpu_name): item of _images}
+        self._image_keys = {}
+        self.check_interval = check_interval
+        self._worker = None
+        self._worker_lock = RLock()
+        self._loading = {}
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self._owns_decompressed = decompressed is None
+        self._held_copies = set()
+        if decompressed is None:
+            decompressed = DecompressedCache()
+        self.decompressed = decompressed
 
     def __enter__(self):
         return self
@@ -37,12 +217,176 @@ class Symbolizer(object):
 
     def close(self):
         if not self._closed:
-            self._symbolizer.close()
+            with self._worker_lock:
+                worker = self._worker
+                self._worker = None
+            if worker is not None:
+                worker.stop()
+            with self._lock:
+                modules = list(self._modules.values())
+                self._modules.clear()
+                self._module_stamps.clear()
+                self._image_keys.clear()
+                self._warm.clear()
+            for module in modules:
+                module.close()
+            for fn in self._held_copies:
+                self.decompressed.release(fn)
+            self._held_copies.clear()
+            if self._owns_decompressed:
+                self.decompressed.clear()
         self._closed = True
 
+    def _after_fork(self):
+        self._lock = RLock()
+        for module in self._modules.values():
+            module._after_fork()
+        self._images._after_fork()
+        # The worker thread does not survive a fork.
+        self._worker = None
+        self._worker_lock = RLock()
+        self._loading = {}
+        for cache in self.cache, self.negative_cache:
+            if hasattr(cache, '_after_fork'):
+                cache._after_fork()
+        self.decompressed._after_fork()
+
+    def preload(self, dsym_path, cpu_name):
+        """Loads a debug file for a CPU ahead of the first lookup so that
+        it does not need to be loaded later, for instance before forking
+        workers with `symsynd.prefork`.
+        """
+        if self._closed:
+            raise RuntimeError('Symbolizer is closed')
+        image = self._get_image(dsym_path, cpu_name)
+        self._warm_module(image[0], cpu_name)
+
+    def _get_module(self, image_path, stamp=None):
+        """Returns the low level symbolizer of a debug file.  Every debug
+        file gets its own so that loading one does not block lookups in
+        the others.  If the `stamp` of the file is given and differs from
+        the one the module was created with it is replaced.
+        """
+        if stamp is not None and \
+           self._module_stamps.get(image_path, stamp) != stamp:
+            self._drop_module(image_path, release=False)
+        with self._lock:
+            if stamp is not None:
+                self._module_stamps[image_path] = stamp
+            rv = self._modules.get(image_path)
+            if rv is None:
+                if self._closed:
+                    raise RuntimeError('Symbolizer is closed')
+                rv = self._modules[image_path] = LowLevelSymbolizer(
+                    timing=self._timing, lazy_frames=self._lazy_frames)
+            return rv
+
+    def get_module_timings(self):
+        """Returns a list with the native timings of every debug file and
+        CPU in use.  Each item is a dictionary with the `dsym_path`,
+        `cpu_name` and the times in seconds spent opening the file
+        (`open`), loading the module into LLVM (`load`), the first lookup
+        (`first_lookup`), all lookups (`lookup`) and the slowest lookup
+        (`max_lookup`) as well as the number of lookups (`lookup_count`).
+        This is only available if the symbolizer was created with `timing`
+        enabled.
+        """
+        if self._closed:
+            raise RuntimeError('Symbolizer is closed')
+        rv = []
+        for image_path, module in self._get_loaded_modules():
+            for cpu_name in self._get_loaded_cpus(image_path, module):
+                try:
+                    timing = module.get_module_timing(image_path, cpu_name)
+                except RuntimeError:
+                    # The module was dropped in the meantime.
+                    break
+                if timing is not None:
+                    timing['dsym_path'] = image_path
+                    timing['cpu_name'] = cpu_name
+                    rv.append(timing)
+        return rv
+
+    def _get_loaded_modules(self):
+        with self._lock:
+            return sorted(self._modules.items())
+
+    def _get_loaded_cpus(self, image_path, module):
+        return [cpu_name for path, cpu_name in module.get_loaded_modules()
+                if path == image_path]
+
+    def stats(self):
+        """Returns a dictionary describing the memory held by the
+        symbolizer.  `modules` lists every debug file that is open with
+        the size of the file mapped by LLVM (`mapped_bytes`, zero until a
+        CPU of it is loaded) and the CPUs that were loaded in `cpus`, each
+        with its `cpu_name`, `uuid` and the approximate heap bytes
+        allocated when LLVM loaded it (`heap_bytes`, only measured with
+        `timing` enabled and `None` otherwise).  `debug_infos` lists the
+        debug files kept open for compilation dir lookups with the bytes
+        they map and `mapped_bytes` is the total of all mappings.
+        `images` is the number of remembered images, `decompressed` the
+        stats of the decompressed copies of compressed debug files and
+        `cache` and `negative_cache` the stats of the caches.
+        """
+        if self._closed:
+            raise RuntimeError('Symbolizer is closed')
+
+        def get_size(path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                return 0
+
+        def get_heap_size(module, image_path, cpu_name):
+            try:
+                return module.get_module_heap_size(image_path, cpu_name)
+            except RuntimeError:
+                return None
+
+        uuids = dict(((image[0], cpu_name), image[1])
+                     for (_, cpu_name), (image, _, _) in self._images.items())
+        modules = []
+        debug_infos = []
+        # The modules are queried without holding the lock so that a
+        # module that is loading does not block the others.
+        for image_path, module in self._get_loaded_modules():
+            cpu_names = self._get_loaded_cpus(image_path, module)
+            modules.append({
+                'dsym_path': image_path,
+                # LLVM maps a file once no matter how many of its CPUs
+                # are loaded.
+                'mapped_bytes': cpu_names and get_size(image_path) or 0,
+                'cpus': [{
+                    'cpu_name': cpu_name,
+                    'uuid': uuids.get((image_path, cpu_name)),
+                    'heap_bytes': get_heap_size(module, image_path,
+                                                cpu_name),
+                } for cpu_name in cpu_names],
+            })
+            debug_infos.extend({
+                'dsym_path': path,
+                'mapped_bytes': get_size(path),
+            } for path in sorted(module._debug_infos))
+        rv = {
+            'modules': modules,
+            'debug_infos': debug_infos,
+            'mapped_bytes': sum(x['mapped_bytes']
+                                for x in modules + debug_infos),
+            'images': len(self._images),
+            'decompressed': self.decompressed.get_stats(),
+            'cache': None,
+            'negative_cache': None,
+        }
+        for key in 'cache', 'negative_cache':
+            cache = getattr(self, key)
+            if cache is not None and hasattr(cache, 'get_stats'):
+                rv[key] = cache.get_stats()
+        return rv
+
     def symbolize(self, dsym_path, image_vmaddr, image_addr,
                   instruction_addr, cpu_name,
-                  symbolize_inlined=False):
+                  symbolize_inlined=False, deadline=None):
         """Symbolizes a single frame based on the information provided.  If
         the symbolication fails a `SymbolicationError` is raised.
 
@@ -60,30 +404,371 @@ class Symbolizer(object):
         Additionally if `symbolize_inlined` is set to `True` then a list of
         frames is returned instead which might contain inlined frames.  In
         that case the return value might be an empty list instead.
+
+        If a `deadline` is given and the lookup does not finish before it
+        a `DeadlineExceeded` error is raised.
+        """
+        rv = self.try_symbolize(dsym_path, image_vmaddr, image_addr,
+                                instruction_addr, cpu_name,
+                                symbolize_inlined, deadline)
+        if isinstance(rv, Exception):
+            raise rv
+        return rv
+
+    def try_symbolize(self, dsym_path, image_vmaddr, image_addr,
+                      instruction_addr, cpu_name, symbolize_inlined=False,
+                      deadline=None):
+        """Like `symbolize` but returns the `SymbolicationError` (or other
+        error) instead of raising it.  Together with a `negative_cache`
+        this makes frames that cannot be symbolized cheap.
         """
         if self._closed:
             raise RuntimeError('Symbolizer is closed')
-        dsym_path = normalize_dsym_path(dsym_path)
+        image = self._try_get_image(dsym_path, cpu_name, deadline)
+        if isinstance(image, Exception):
+            return image
+        try:
+            addr = self._get_debug_addr(image, image_vmaddr, image_addr,
+                                        instruction_addr)
+        except ValueError as e:
+            return e
+        return self._try_symbolize_addr(image, cpu_name, addr,
+                                        symbolize_inlined, deadline)
 
-        image_vmaddr = parse_addr(image_vmaddr)
-        if not image_vmaddr:
-            di = self._symbolizer.get_debug_info(dsym_path)
-            if di is not None:
-                variant = di.get_variant(cpu_name)
-                if variant is not None:
-                    image_vmaddr = variant.vmaddr
+    def symbolize_frames(self, frames, symbolize_inlined=False,
+                         deadline=None):
+        """Symbolizes many frames at once, for instance an entire backtrace
+        or the backtraces of all threads of a crash.  Each frame is a
+        dictionary with the `dsym_path`, `image_vmaddr`, `image_addr`,
+        `instruction_addr` and `cpu_name` keys which have the same meaning
+        as the arguments to `symbolize`.
+
+        The frames are grouped by image, repeated addresses are only looked
+        up once and the lookups per image happen in address order.  The
+        return value is a list with one item per frame in the original
+        order which is the return value `symbolize` would have produced.
+        If a frame cannot be symbolized the `SymbolicationError` (or other
+        error) is put in its place instead of being raised.
+
+        If a `deadline` is given the frames that could not be symbolized
+        before it passed get a `DeadlineExceeded` error instead.
+        """
+        if self._closed:
+            raise RuntimeError('Symbolizer is closed')
+
+        rv = [None] * len(frames)
+        groups = {}
+        images = {}
+        for idx, frame in enumerate(frames):
+            image_key = (frame['dsym_path'], frame['cpu_name'])
+            image = images.get(image_key)
+            if image is None:
+                image = images[image_key] = self._try_get_image(
+                    frame['dsym_path'], frame['cpu_name'], deadline)
+            if isinstance(image, Exception):
+                rv[idx] = image
+                continue
+            try:
+                addr = self._get_debug_addr(
+                    image, frame.get('image_vmaddr'), frame['image_addr'],
+                    frame['instruction_addr'])
+            except ValueError as e:
+                rv[idx] = e
+                continue
+            groups.setdefault((image, frame['cpu_name']), {}) \
+                .setdefault(addr, []).append(idx)
+
+        for (image, cpu_name), addrs in sorted(
+                groups.items(), key=lambda x: (x[0][0][0], x[0][1])):
+            for addr, indexes in sorted(addrs.items()):
+                result = self._try_symbolize_addr(
+                    image, cpu_name, addr, symbolize_inlined, deadline)
+                rv[indexes[0]] = result
+                for idx in indexes[1:]:
+                    if isinstance(result, Exception):
+                        rv[idx] = result
+                    else:
+                        rv[idx] = _copy_result(result)
+
+        return rv
+
+    def _get_debug_addr(self, image, image_vmaddr, image_addr,
+                        instruction_addr):
+        image_vmaddr = parse_addr(image_vmaddr) or image[2]
+        return image_vmaddr + parse_addr(instruction_addr) - \
+            parse_addr(image_addr)
+
+    def _get_negative(self, key):
+        if self.negative_cache is None:
+            return None
+        rv = self.negative_cache.get(key)
+        if rv is not None:
+            metrics.incr('symbolize.negative_hit')
+            # A new error for every hit so that callers never share one.
+            cls, args = rv
+            return cls(*args)
+
+    def _set_negative(self, key, error):
+        if self.negative_cache is not None:
+            # Only the class and arguments are kept so that neither the
+            # traceback nor anything callers attach to the error lives on.
+            self.negative_cache.set(key, (error.__class__, error.args))
+
+    def _get_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                if self._closed:
+                    raise RuntimeError('Symbolizer is closed')
+                self._worker = _Worker()
+            return self._worker
+
+    def _try_symbolize_addr(self, image, cpu_name, addr, symbolize_inlined,
+                            deadline=None):
+        image_path, image_uuid, _ = image
+        cache_key = (image_uuid or image_path, cpu_name, addr,
+                     bool(symbolize_inlined))
+
+        error = self._get_negative(('addr',) + cache_key)
+        if error is not None:
+            return error
+
+        if self.cache is not None:
+            rv = self.cache.get(cache_key, _missing)
+            if rv is not _missing:
+                metrics.incr('symbolize.cache_hit')
+                self._rebind_frames(rv, image_path)
+                return _copy_result(rv)
+
+        if deadline is not None:
+            if (image_path, cpu_name) not in self._warm:
+                rv = self._wait_for_load(
+                    ('module', image_path, cpu_name), self._warm_module,
+                    (image_path, cpu_name), deadline)
+                if isinstance(rv, Exception):
+                    return rv
+            if time.time() >= deadline:
+                metrics.incr('symbolize.deadline_exceeded')
+                return _deadline_exceeded()
+
+        module = self._get_module(image_path)
+        try:
+            with metrics.timed('symbolize'):
+                if symbolize_inlined:
+                    rv = module.symbolize_inlined(image_path, addr, cpu_name)
+                else:
+                    rv = module.symbolize(image_path, addr, cpu_name)
+        except SymbolicationError as e:
+            self._set_warm(image_path, cpu_name)
+            # If the file went away or changed the image is stale rather
+            # than the address unknown, so forget the image instead.
+            if self._is_stale(image_path):
+                self._forget_image(image_path)
+            else:
+                self._set_negative(('addr',) + cache_key, e)
+            return e
+        except RuntimeError:
+            # The debug file was replaced or evicted and its module
+            # closed while the lookup was waiting for it.
+            if self._closed:
+                raise
+            return SymbolicationError('Debug file changed during lookup')
+        self._set_warm(image_path, cpu_name)
+
+        if self.cache is not None:
+            self.cache.set(cache_key, _copy_result(rv),
+                           _estimate_result_size(rv))
+        return rv
+
+    def _rebind_frames(self, rv, image_path):
+        """Cached frames that did not look up their filename yet need the
+        module of a debug file with the same UUID if theirs was closed.
+        """
+        for frame in rv if isinstance(rv, list) else [rv]:
+            if isinstance(frame, Frame) and frame._is_orphaned():
+                frame._rebind(self._get_module(image_path), image_path)
+
+    def _is_stale(self, image_path):
+        """Checks if the file of a debug file or of one of its images
+        went away or changed since it was loaded.
+        """
+        if not os.path.isfile(image_path):
+            return True
+        with self._lock:
+            items = list(self._image_keys.get(image_path, {}).items())
+        for (dsym_path, _), (_, stamp, _) in items:
+            if _get_file_stamp(dsym_path) != stamp:
+                return True
+        return False
+
+    def _forget_image(self, image_path):
+        with self._lock:
+            keys = list(self._image_keys.get(image_path, ()))
+        for key in keys:
+            self._images.discard(key)
+
+    def _add_image(self, key, item):
+        with self._lock:
+            self._image_keys.setdefault(item[0][0], {})[key] = item
+        self._images.set(key, item)
+
+    def _image_removed(self, key, item):
+        """Drops the module of a debug file once its last image was
+        evicted or forgotten.
+        """
+        image_path = item[0][0]
+        with self._lock:
+            items = self._image_keys.get(image_path)
+            # The entry might have been replaced by a newer load.
+            if items is None or items.get(key) is not item:
+                return
+            del items[key]
+            if items:
+                return
+            del self._image_keys[image_path]
+        self._drop_module(image_path, unused_only=True)
+
+    def _drop_module(self, image_path, release=True, unused_only=False):
+        """Closes the module of a debug file that changed or is no longer
+        used so that the file is loaded again on the next lookup.  With
+        `release` the copy of a compressed file is released as well.  With
+        `unused_only` nothing happens if an image of the file was
+        remembered again in the meantime.
+        """
+        with self._lock:
+            if unused_only and image_path in self._image_keys:
+                return
+            module = self._modules.pop(image_path, None)
+            self._module_stamps.pop(image_path, None)
+            self._warm = set(x for x in self._warm if x[0] != image_path)
+            held = release and image_path in self._held_copies
+            if held:
+                self._held_copies.discard(image_path)
+        if module is not None:
+            module.close()
+        if held:
+            self.decompressed.release(image_path)
+
+    def _get_image(self, dsym_path, cpu_name):
+        """Returns the normalized path, the UUID and the vmaddr of an image
+        for a CPU.  The information is remembered as long as the file does
+        not change so that repeated lookups skip the validation.
+        """
+        rv = self._try_get_image(dsym_path, cpu_name)
+        if isinstance(rv, Exception):
+            raise rv
+        return rv
+
+    def _try_get_image(self, dsym_path, cpu_name, deadline=None):
+        item = self._images.get((dsym_path, cpu_name))
+        if item is not None:
+            rv, stamp, checked = item
+            now = time.time()
+            if now - checked < self.check_interval:
+                return rv
+            if _get_file_stamp(dsym_path) == stamp:
+                item[2] = now
+                return rv
+            # The module is closed with the last image of the file or
+            # replaced when the new file is loaded.
+            self._images.discard((dsym_path, cpu_name))
+
+        key = ('image', dsym_path, cpu_name)
+        error = self._get_negative(key)
+        if error is not None:
+            return error
+        if deadline is not None:
+            return self._wait_for_load(
+                ('image', dsym_path, cpu_name), self._warm_image,
+                (dsym_path, cpu_name), deadline)
+        stamp = _get_file_stamp(dsym_path)
+        try:
+            rv = self._load_image(dsym_path, cpu_name)
+        except _lookup_errors as e:
+            self._set_negative(key, e)
+            return e
+        self._add_image((dsym_path, cpu_name), [rv, stamp, time.time()])
+        return rv
+
+    def _wait_for_load(self, key, func, args, deadline):
+        """Runs a load on the loader threads and waits for it until the
+        deadline.  The load is started even if the deadline already passed
+        and continues when the caller stops waiting.  Concurrent waits for
+        the same `key` share the load.
+        """
+        with self._worker_lock:
+            job = self._loading.get(key)
+            if job is None:
+                job = self._loading[key] = self._get_worker().submit(
+                    self._run_load, (key, func, args))
+        rv = job.wait(deadline)
+        if isinstance(rv, DeadlineExceeded):
+            metrics.incr('symbolize.deadline_exceeded')
+        return rv
+
+    def _run_load(self, key, func, args):
+        try:
+            return func(*args)
+        finally:
+            with self._worker_lock:
+                self._loading.pop(key, None)
+
+    def _warm_image(self, dsym_path, cpu_name):
+        rv = self._try_get_image(dsym_path, cpu_name)
+        if not isinstance(rv, Exception):
+            self._warm_module(rv[0], cpu_name)
+        return rv
+
+    def _warm_module(self, image_path, cpu_name):
+        """Loads the LLVM module of an image ahead of the first lookup."""
+        if (image_path, cpu_name) in self._warm:
+            return
+        try:
+            with metrics.timed('preload'):
+                self._get_module(image_path).preload(image_path, cpu_name)
+        except SymbolicationError:
+            # The lookups will report the error.
+            pass
+        self._set_warm(image_path, cpu_name)
+
+    def _set_warm(self, image_path, cpu_name):
+        if (image_path, cpu_name) not in self._warm:
+            with self._lock:
+                self._warm.add((image_path, cpu_name))
+            # If the last image of the file was evicted while the module
+            # was loading nothing else would close it.
+            self._drop_module(image_path, unused_only=True)
+
+    def _acquire_copy(self, path):
+        """Returns the path of the decompressed copy of a debug file and
+        keeps the copy until the symbolizer is closed or the module of the
+        copy is dropped because the debug file changed.
+        """
+        rv = self.decompressed.acquire(path)
+        with self._lock:
+            if rv in self._held_copies:
+                self.decompressed.release(rv)
+            else:
+                self._held_copies.add(rv)
+        return rv
 
-        image_addr = parse_addr(image_addr)
-        instruction_addr = parse_addr(instruction_addr)
+    def _load_image(self, dsym_path, cpu_name):
+        image_path = normalize_dsym_path(dsym_path)
         if not is_valid_cpu_name(cpu_name):
             raise SymbolicationError('"%s" is not a valid cpu name' % cpu_name)
+        with metrics.timed('decompress'):
+            image_path = self._acquire_copy(image_path)
 
-        addr = image_vmaddr + instruction_addr - image_addr
+        image_uuid = None
+        image_vmaddr = 0
+        # LLVM remembers modules by path, so a module that was loaded
+        # before the file was replaced has to go.
+        module = self._get_module(image_path, _get_file_stamp(image_path))
+        with metrics.timed('load_image'):
+            di = module.get_debug_info(image_path)
+            if di is not None:
+                variant = di.get_variant(cpu_name)
+                if variant is not None:
+                    image_uuid = str(variant.uuid)
+                    image_vmaddr = variant.vmaddr
 
-        with self._lock:
-            with timedsection('symbolize'):
-                if symbolize_inlined:
-                    return self._symbolizer.symbolize_inlined(
-                        dsym_path, addr, cpu_name)
-                return self._symbolizer.symbolize(
-                    dsym_path, addr, cpu_name)
+        return (image_path, image_uuid, image_vmaddr)
@@ -0,0 +1,322 @@
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+from symsynd.images import get_bundle_uuids, get_uuid_files, \
+    _get_uuid_name
+from symsynd.compressed import COMPRESSED_SUFFIXES
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_event_header = struct.Struct('iIII')
+_watch_mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+# Seconds between attempts to watch paths that went away again and after
+# an error before rescanning.
+_retry_interval = 1.0
+
+# The folders on the way from a dSYM bundle to its debug files.
+_bundle_dirs = ('Contents', 'Resources', 'DWARF')
+
+# Uncompressed files are preferred, as by `find_debug_images`.
+_suffixes = ('',) + COMPRESSED_SUFFIXES
+
+_libc = None
+
+logger = logging.getLogger(__name__)
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise RuntimeError('inotify is not available on this platform')
+        _libc = libc
+    return _libc
+
+
+def _get_rank(uuid, filename):
+    """Returns the position of the suffix of a debug file named by its
+    UUID in the order of preference.
+    """
+    return _suffixes.index(os.path.basename(filename)[len(uuid):])
+
+
+def _check(rv):
+    if rv < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return rv
+
+
+class DebugFileIndex(object):
+    """A long lived index of the debug files in a list of search paths
+    which can be passed to `find_debug_images` instead of probing the file
+    system for every report.  The paths are watched with inotify (and as
+    such this only works on Linux) and the index is updated in a
+    background thread as debug files are added, replaced or deleted.
+
+    Like `find_debug_images` this finds files named by their UUID (which
+    may be compressed) in all paths as well as all debug files in dSYM
+    bundles.  Bundles are indexed with `get_bundle_uuids` which is given
+    `index_dir`.  The paths have to exist when the index is created but
+    bundles are picked up when they are created later.  If a path is
+    deleted or moved away later its debug files are dropped from the
+    index until the path exists again.  Errors while updating the index
+    are logged and the paths are scanned again.
+    """
+
+    # The index follows the file system, so `find_debug_images` does not
+    # look for the UUIDs it does not know.
+    complete = True
+
+    def __init__(self, dsym_paths, index_dir=None):
+        self.dsym_paths = list(dsym_paths)
+        self.index_dir = index_dir
+        self._files = {}
+        self._bundles = {}
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._start()
+
+    def _start(self):
+        self._lost = set()
+        libc = _get_libc()
+        self._fd = _check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        for dsym_path in self.dsym_paths:
+            self._add_path(dsym_path)
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='symsynd-index')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _after_fork(self):
+        # The thread does not survive the fork and the inotify descriptor
+        # is shared with the parent, so the child starts watching anew.
+        self._lock = threading.Lock()
+        if self._closed:
+            return
+        for fd in self._fd, self._wakeup_r, self._wakeup_w:
+            os.close(fd)
+        self._watches = {}
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        """Stops watching the paths."""
+        if self._closed:
+            return
+        self._closed = True
+        os.write(self._wakeup_w, b'\x00')
+        self._thread.join()
+        for fd in self._fd, self._wakeup_r, self._wakeup_w:
+            os.close(fd)
+
+    def _add_watch(self, path, dsym_path, is_bundle):
+        """Watches a folder of a path.  `is_bundle` is `False` for the
+        path itself, `True` for the DWARF folder of a bundle and `None`
+        for the folders on the way to it.
+        """
+        wd = _check(_get_libc().inotify_add_watch(
+            self._fd, path.encode('utf-8'), _watch_mask))
+        self._watches[wd] = (dsym_path, is_bundle)
+
+    def _add_path(self, dsym_path):
+        self._add_watch(dsym_path, dsym_path, False)
+        self._lost.discard(dsym_path)
+        self._scan_files(dsym_path)
+        self._watch_bundle(dsym_path)
+
+    def _watch_bundle(self, dsym_path):
+        """Watches and scans the DWARF folder of a bundle.  Until it exists
+        the folders on the way to it are watched so that it is noticed
+        once it is created.
+        """
+        path = dsym_path
+        for name in _bundle_dirs:
+            path = os.path.join(path, name)
+            # The parent is watched already, so a folder created after
+            # this check is reported.
+            if not os.path.isdir(path):
+                return
+            self._add_watch(path, dsym_path, name == 'DWARF' or None)
+        self._scan_bundle(dsym_path)
+
+    def _get_dwarf_base(self, dsym_path):
+        return os.path.join(dsym_path, *_bundle_dirs)
+
+    def _scan_files(self, dsym_path):
+        files = get_uuid_files(dsym_path)
+        with self._lock:
+            self._files[dsym_path] = files
+
+    def _scan_bundle(self, dsym_path):
+        dwarf_base = self._get_dwarf_base(dsym_path)
+        try:
+            uuids = get_bundle_uuids(dwarf_base, self.index_dir)
+        except OSError:
+            uuids = {}
+        with self._lock:
+            self._bundles[dsym_path] = uuids
+
+    def _handle_file_event(self, dsym_path, mask, name):
+        uuid = _get_uuid_name(name)
+        if uuid is None:
+            return
+        full_fn = os.path.join(dsym_path, name)
+        with self._lock:
+            files = self._files.setdefault(dsym_path, {})
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                if files.get(uuid) == full_fn:
+                    del files[uuid]
+                    # Fall back to another variant of the file
+                    for suffix in _suffixes:
+                        fn = os.path.join(dsym_path, uuid + suffix)
+                        if os.path.isfile(fn):
+                            files[uuid] = fn
+                            break
+            # Files are only picked up once they were fully written or
+            # moved into place.  Links are complete when created.
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) or \
+                    os.path.islink(full_fn):
+                old = files.get(uuid)
+                if os.path.isfile(full_fn) and (
+                        old is None or _get_rank(uuid, full_fn) <=
+                        _get_rank(uuid, old)):
+                    files[uuid] = full_fn
+
+    def _process_events(self):
+        try:
+            buf = os.read(self._fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+
+        dirty_bundles = set()
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = _event_header.unpack_from(buf, offset)
+            offset += _event_header.size
+            name = buf[offset:offset + length].rstrip(b'\x00') \
+                .decode('utf-8', 'replace')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self._rescan()
+                continue
+
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            dsym_path, is_bundle = watch
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._lose_path(dsym_path)
+                dirty_bundles.discard(dsym_path)
+            elif is_bundle:
+                dirty_bundles.add(dsym_path)
+            elif mask & (IN_CREATE | IN_MOVED_TO) and \
+                    (is_bundle is None or name == _bundle_dirs[0]):
+                # A folder on the way to the DWARF folder showed up.
+                self._watch_bundle(dsym_path)
+            elif name and is_bundle is not None:
+                self._handle_file_event(dsym_path, mask, name)
+
+        for dsym_path in dirty_bundles:
+            self._scan_bundle(dsym_path)
+
+    def _lose_path(self, dsym_path):
+        """Stops watching a path that was deleted or moved away and drops
+        its files until it exists again.
+        """
+        libc = _get_libc()
+        for wd, watch in list(self._watches.items()):
+            if watch[0] == dsym_path:
+                del self._watches[wd]
+                # A moved folder would otherwise still be watched.
+                libc.inotify_rm_watch(self._fd, wd)
+        with self._lock:
+            self._files.pop(dsym_path, None)
+            self._bundles.pop(dsym_path, None)
+        self._lost.add(dsym_path)
+
+    def _restore_paths(self):
+        for dsym_path in list(self._lost):
+            if os.path.isdir(dsym_path):
+                try:
+                    self._add_path(dsym_path)
+                except OSError:
+                    pass
+
+    def _rescan(self):
+        for dsym_path in self.dsym_paths:
+            if dsym_path in self._lost:
+                continue
+            try:
+                self._scan_files(dsym_path)
+                self._watch_bundle(dsym_path)
+            except Exception:
+                logger.exception('Could not scan %s', dsym_path)
+
+    def _run(self):
+        while not self._closed:
+            ready = select.select([self._fd, self._wakeup_r], [], [],
+                                  self._lost and _retry_interval or None)[0]
+            if self._closed:
+                break
+            try:
+                if self._fd in ready:
+                    self._process_events()
+                if self._lost:
+                    self._restore_paths()
+            except Exception:
+                logger.exception('Failed to update the debug file index')
+                # Events might have been lost, so start over from the
+                # file system after a pause.
+                select.select([self._wakeup_r], [], [], _retry_interval)
+                if not self._closed:
+                    self._rescan()
+
+    def get(self, uuid):
+        """Returns the path of the debug file for a UUID or `None`.  As
+        with `find_debug_images` files named by their UUID take precedence
+        over files in bundles, uncompressed files over compressed ones in
+        any path and otherwise earlier paths win.
+        """
+        uuid = uuid.lower()
+        files = [self._files.get(dsym_path, {}).get(uuid)
+                 for dsym_path in self.dsym_paths]
+        files = [x for x in files if x is not None]
+        if files:
+            return min(files, key=lambda x: _get_rank(uuid, x))
+        for dsym_path in self.dsym_paths:
+            rv = self._bundles.get(dsym_path, {}).get(uuid)
+            if rv is not None:
+                return rv
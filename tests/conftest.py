@@ -4,59 +4,12 @@ import time
 import json
 import pytest
 
-from symsynd import find_debug_images, ImageLookup, demangle_symbol, \
-    get_cpu_name, find_best_instruction, parse_addr
+from symsynd.report import ReportSymbolizer
 
 
 diff_report = None
 
 
-class ReportSymbolizer(object):
-
-    def __init__(self, driver, dsym_paths, binary_images):
-        self.driver = driver
-        self.images = ImageLookup(binary_images)
-        self.image_paths = find_debug_images(dsym_paths, binary_images)
-
-    def symbolize_backtrace(self, backtrace, meta=None):
-        def symbolize(frame):
-            instr = frame['instruction_addr']
-            img = self.images.find_image(instr)
-            if img is None:
-                return [frame]
-            dsym_path = self.image_paths.get(parse_addr(img['image_addr']))
-            if dsym_path is None:
-                return [frame]
-
-            cpu_name = get_cpu_name(img['cpu_type'], img['cpu_subtype'])
-            if meta is not None:
-                instr = find_best_instruction(instr, cpu_name, meta)
-
-            rv = self.driver.symbolize(dsym_path, img['image_vmaddr'],
-                                       img['image_addr'],
-                                       instr, cpu_name,
-                                       symbolize_inlined=True)
-            if not rv:
-                return [frame]
-
-            result = []
-            for rv in rv:
-                frame = dict(frame)
-                frame['symbol_name'] = demangle_symbol(rv['symbol'])
-                frame['filename'] = rv['abs_path']
-                frame['line'] = rv['lineno']
-                frame['column'] = rv['colno']
-                result.append(frame)
-            return result
-
-        rv = []
-        for idx, f in enumerate(backtrace):
-            if meta is not None:
-                meta['frame_number'] = idx
-            rv.extend(symbolize(f))
-        return rv
-
-
 class DiffReport(object):
 
     def __init__(self, config):
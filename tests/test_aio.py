@@ -0,0 +1,88 @@
+import os
+import time
+import pytest
+
+asyncio = pytest.importorskip('asyncio')
+
+
+def test_async_symbolize(res_path, driver):
+    from symsynd.aio import AsyncSymbolizer
+
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    args = (dsym_path, 16384, 749568, 782745, 'armv7')
+
+    loop = asyncio.new_event_loop()
+    asym = AsyncSymbolizer(driver, loop=loop)
+    try:
+        futures = [asym.symbolize(*args) for x in range(10)]
+        assert len(asym._inflight) == 1
+        results = loop.run_until_complete(asyncio.gather(*futures))
+    finally:
+        asym.close()
+        loop.close()
+
+    assert not asym._inflight
+    assert results[0] == driver.symbolize(*args)
+    assert all(x is results[0] for x in results)
+    assert results[0]['symbol'] == '-[Crasher throwUncaughtNSException]'
+    assert results[0]['lineno'] == 96
+
+
+def test_async_symbolize_deadline(res_path, driver):
+    from symsynd.aio import AsyncSymbolizer
+    from symsynd.exceptions import DeadlineExceeded
+
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    args = (dsym_path, 16384, 749568, 782745, 'armv7')
+
+    loop = asyncio.new_event_loop()
+    asym = AsyncSymbolizer(driver, loop=loop)
+    try:
+        futures = [asym.symbolize(*args, deadline=time.time() + 60),
+                   asym.symbolize(*args)]
+        assert len(asym._inflight) == 1
+        results = loop.run_until_complete(asyncio.gather(*futures))
+        assert results[0]['symbol'] == '-[Crasher throwUncaughtNSException]'
+        assert results[1] is results[0]
+
+        with pytest.raises(DeadlineExceeded):
+            loop.run_until_complete(asym.symbolize(
+                *args, deadline=time.time() - 1))
+    finally:
+        asym.close()
+        loop.close()
+
+
+def test_async_symbolize_inlined(res_path, driver):
+    from symsynd.aio import AsyncSymbolizer
+    from symsynd.exceptions import SymbolicationError
+
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    args = (dsym_path, 16384, 749568, 782745, 'armv7')
+    invalid_args = (dsym_path, 16384, 749568, 782745, 'invalid')
+
+    loop = asyncio.new_event_loop()
+    asym = AsyncSymbolizer(driver, loop=loop)
+    try:
+        futures = [asym.symbolize(*args, symbolize_inlined=True),
+                   asym.symbolize(*args)]
+        futures += [asym.symbolize(*invalid_args, symbolize_inlined=True)
+                    for x in range(2)]
+        results = loop.run_until_complete(asyncio.gather(
+            *futures, return_exceptions=True))
+    finally:
+        asym.close()
+        loop.close()
+
+    assert results[0] == driver.symbolize(*args, symbolize_inlined=True)
+    assert results[0][0]['symbol'] == results[1]['symbol']
+    # Every caller gets its own error
+    assert isinstance(results[2], SymbolicationError)
+    assert isinstance(results[3], SymbolicationError)
+    assert results[2] is not results[3]
@@ -0,0 +1,50 @@
+import os
+import json
+import time
+
+from symsynd.batch import symbolize_reports
+
+
+def test_symbolize_reports(res_path, driver, make_report_sym):
+    with open(os.path.join(res_path, 'crash-report.json')) as f:
+        report = json.load(f)
+
+    dsym_paths = [os.path.join(res_path, 'Crash-Tester.app.dSYM')]
+    backtraces = [thread['backtrace']['contents']
+                  for thread in report['crash']['threads']
+                  if 'backtrace' in thread]
+    reports = [{
+        'id': idx,
+        'binary_images': report['binary_images'],
+        'backtraces': backtraces[idx:],
+    } for idx in range(3)]
+
+    rv = list(symbolize_reports(driver, dsym_paths, iter(reports),
+                                window=2))
+    assert [x['id'] for x in rv] == [0, 1, 2]
+
+    rep = make_report_sym(dsym_paths, report['binary_images'])
+    expected = rep.symbolize_backtraces(backtraces)
+    for idx, result in enumerate(rv):
+        assert result['backtraces'] == expected[idx:]
+
+
+def test_symbolize_reports_timeout():
+    class Symbolizer(object):
+        def __init__(self):
+            self.remaining = []
+
+        def symbolize_frames(self, frames, symbolize_inlined=False,
+                             deadline=None):
+            self.remaining.append(deadline - time.time())
+            time.sleep(0.05)
+            return []
+
+    symbolizer = Symbolizer()
+    reports = [{'id': idx} for idx in range(4)]
+    rv = list(symbolize_reports(symbolizer, [], reports, window=1,
+                                timeout=0.08))
+    assert [x['id'] for x in rv] == [0, 1, 2, 3]
+    # Every window gets its own deadline
+    assert len(symbolizer.remaining) == 4
+    assert all(x > 0.05 for x in symbolizer.remaining)
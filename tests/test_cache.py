@@ -0,0 +1,133 @@
+import os
+import time
+from symsynd.cache import LRUCache, TTLCache, SqliteCache, TieredCache
+from symsynd.symbolizer import Symbolizer
+
+
+def test_lru_cache_limits():
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.evictions == 1
+
+    cache = LRUCache(max_bytes=100)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    assert len(cache) == 1
+    assert cache.total_bytes == 60
+    assert cache.get('b') == 2
+
+
+def test_lru_cache_hit_rate():
+    cache = LRUCache()
+    assert cache.hit_rate == 0.0
+    cache.set('a', None)
+    assert cache.get('a', 42) is None
+    assert cache.get('b', 42) == 42
+    assert cache.hit_rate == 0.5
+
+
+def test_ttl_cache():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=-1)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    cache.set('b', 2, ttl=30)
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.get('c') == 3
+
+
+def test_ttl_cache_sweep(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = TTLCache(ttl=60)
+    cache.set('a', 1, ttl=120)
+    for idx in range(10):
+        cache.set(idx, idx, ttl=1)
+    now[0] += 2
+    # The short lived entries behind the long lived one stay until the
+    # next sweep
+    cache.set('b', 2, ttl=120)
+    assert len(cache) == 12
+    now[0] += 60
+    cache.set('c', 3)
+    assert len(cache) == 3
+
+
+def test_sqlite_cache(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    cache = SqliteCache(path, max_bytes=1000, prune_interval=0)
+    key = ('8094558b-3641-36f7-ba80-a1aaabcf72da', 'armv7', 42, False)
+    cache.set(key, {'symbol': 'main', 'lineno': 17})
+    assert SqliteCache(path).get(key) == {'symbol': 'main', 'lineno': 17}
+
+    for addr in range(100):
+        cache.set(key[:2] + (addr, True), [{'symbol': 'x' * 20}])
+    cache.prune()
+    stats = cache.get_stats()
+    assert stats['bytes'] <= 1000
+    assert cache.get(key[:2] + (99, True)) == [{'symbol': 'x' * 20}]
+    assert cache.get(key[:2] + (0, True)) is None
+
+
+def test_tiered_cache(tmpdir):
+    memory = LRUCache()
+    cache = TieredCache([memory, SqliteCache(str(tmpdir.join('cache.db')))])
+    cache.caches[1].set(('image', 'arm64', 1, False), None)
+    assert cache.get(('image', 'arm64', 1, False), 42) is None
+    assert ('image', 'arm64', 1, False) in memory
+    assert cache.get(('image', 'arm64', 2, False), 42) == 42
+    assert cache.hit_rate == 0.5
+
+
+def test_tiered_cache_sizes(tmpdir):
+    memory = LRUCache(max_bytes=100)
+    cache = TieredCache([memory, SqliteCache(str(tmpdir.join('cache.db')))])
+    key = ('image', 'arm64', 1, False)
+    cache.caches[1].set(key, {'symbol': 'x' * 200})
+    # Promoted values keep their size and count towards the limits
+    assert cache.get(key) == {'symbol': 'x' * 200}
+    assert key not in memory
+    assert cache.get_item(key)[1] == len('{"symbol": "%s"}' % ('x' * 200))
+
+
+def test_symbolizer_cache(res_path):
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    args = (dsym_path, 16384, 749568, 782745, 'armv7')
+
+    with Symbolizer(cache=LRUCache(max_entries=100)) as sym:
+        rv = sym.symbolize(*args)
+        rv['symbol'] = 'modified'
+        assert sym.cache.misses == 1
+        cached = sym.symbolize(*args)
+        assert sym.cache.hits == 1
+        assert cached['symbol'] == '-[Crasher throwUncaughtNSException]'
+        assert cached['lineno'] == 96
+
+
+def test_lru_cache_on_remove():
+    removed = []
+    cache = LRUCache(max_entries=2,
+                     on_remove=lambda key, value: removed.append(key))
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('a', 3)
+    assert removed == ['a']
+    cache.set('c', 4)
+    assert removed == ['a', 'b']
+    cache.discard('a')
+    cache.discard('missing')
+    assert removed == ['a', 'b', 'a']
+    cache.clear()
+    assert removed == ['a', 'b', 'a', 'c']
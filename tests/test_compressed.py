@@ -0,0 +1,173 @@
+import os
+import gzip
+import shutil
+
+from symsynd.compressed import DecompressedCache, get_compression, \
+    _remove_stale
+from symsynd.images import find_debug_images
+
+
+def _gzip_file(src, dst):
+    with open(src, 'rb') as f_in:
+        with gzip.open(dst, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+
+def test_decompressed_cache(tmpdir):
+    data = b'x' * 1000
+    paths = []
+    for idx in range(3):
+        path = str(tmpdir.join('file-%d.gz' % idx))
+        with gzip.open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    plain = tmpdir.join('plain')
+    plain.write('plain')
+
+    cache = DecompressedCache(max_bytes=2500, directory=str(tmpdir))
+    assert get_compression(paths[0]) == 'gzip'
+    assert cache.get_path(str(plain)) == str(plain)
+
+    first = cache.get_path(paths[0])
+    assert os.path.basename(os.path.dirname(first)).startswith(
+        'symsynd-%d-' % os.getpid())
+    with open(first, 'rb') as f:
+        assert f.read() == data
+    assert cache.get_path(paths[0]) == first
+
+    cache.get_path(paths[1])
+    cache.get_path(paths[2])
+    assert len(cache) == 2
+    assert cache.total_bytes == 2000
+    assert not os.path.exists(first)
+
+    cache.clear()
+    assert len(cache) == 0
+    assert os.listdir(os.path.dirname(first)) == ['.lock']
+
+
+def test_decompressed_cache_in_use(tmpdir):
+    paths = []
+    for idx in range(3):
+        path = str(tmpdir.join('file-%d.gz' % idx))
+        with gzip.open(path, 'wb') as f:
+            f.write(b'x' * 1000)
+        paths.append(path)
+
+    cache = DecompressedCache(max_bytes=1500, directory=str(tmpdir))
+    first = cache.acquire(paths[0])
+    cache.get_path(paths[1])
+    cache.get_path(paths[2])
+
+    # Copies in use are kept and counted
+    assert os.path.isfile(first)
+    assert cache.get_stats() == {
+        'entries': 2,
+        'bytes': 2000,
+        'in_use_bytes': 1000,
+    }
+    cache.clear()
+    assert os.path.isfile(first)
+
+    cache.release(first)
+    cache.clear()
+    assert not os.path.exists(first)
+    assert len(cache) == 0
+
+
+def test_remove_stale_copies(tmpdir):
+    import fcntl
+    stale = tmpdir.mkdir('symsynd-1-stale')
+    stale.join('.lock').write('')
+    stale.join('1-file').write('x')
+    # Folders are only judged by their lock, not by the process ID
+    live = tmpdir.mkdir('symsynd-999999999-live')
+    live.join('.lock').write('')
+    creating = tmpdir.mkdir('symsynd-1-creating')
+
+    path = str(tmpdir.join('file.gz'))
+    with gzip.open(path, 'wb') as f:
+        f.write(b'x')
+    with live.join('.lock').open('r+') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        cache = DecompressedCache(directory=str(tmpdir))
+        copy = cache.get_path(path)
+
+    assert not stale.check()
+    assert live.check()
+    assert creating.check()
+
+    # The lock of the own folder is held as well
+    _remove_stale(str(tmpdir))
+    assert os.path.isfile(copy)
+    cache.clear()
+
+
+def test_removed_copy(tmpdir):
+    path = str(tmpdir.join('file.gz'))
+    with gzip.open(path, 'wb') as f:
+        f.write(b'x' * 1000)
+
+    cache = DecompressedCache(directory=str(tmpdir))
+    first = cache.acquire(path)
+    os.unlink(first)
+    # A copy that went away is decompressed again
+    second = cache.get_path(path)
+    assert second != first
+    with open(second, 'rb') as f:
+        assert f.read() == b'x' * 1000
+    assert cache.get_stats()['bytes'] == 1000
+    cache.release(first)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_shared_decompressed_cache(res_path, tmpdir):
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.cache import TTLCache
+    dwarf_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    paths = [str(tmpdir.join('%d.gz' % idx)) for idx in range(2)]
+    for path in paths:
+        _gzip_file(dwarf_path, path)
+
+    # The cache only has room for one copy
+    cache = DecompressedCache(max_bytes=1, directory=str(tmpdir))
+    first = Symbolizer(decompressed=cache, negative_cache=TTLCache(600))
+    second = Symbolizer(decompressed=cache)
+    try:
+        for idx in range(2):
+            rv = first.symbolize(paths[0], 16384, 749568, 782745, 'armv7')
+            assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+            rv = second.symbolize(paths[1], 16384, 749568, 782745, 'armv7')
+            assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+        assert len(first.negative_cache) == 0
+        assert cache.get_stats()['entries'] == 2
+    finally:
+        first.close()
+        second.close()
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_symbolize_compressed(res_path, tmpdir, driver):
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    dwarf_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    _gzip_file(dwarf_path, str(tmpdir.join(uuid + '.gz')))
+
+    images = find_debug_images([str(tmpdir)], [{
+        'cpu_subtype': 9,
+        'cpu_type': 12,
+        'image_addr': 749568,
+        'image_size': 262144,
+        'image_vmaddr': 16384,
+        'uuid': uuid.upper(),
+    }])
+    assert images == {749568: str(tmpdir.join(uuid + '.gz'))}
+
+    rv = driver.symbolize(images[749568], 16384, 749568, 782745, 'armv7')
+    assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+    assert rv['lineno'] == 96
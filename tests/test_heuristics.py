@@ -1,7 +1,27 @@
-from symsynd.heuristics import get_ip_register
+from symsynd.heuristics import get_ip_register, find_best_instruction, \
+    find_best_instructions
+from symsynd.utils import parse_addrs
 
 
 def test_ip_reg():
     assert get_ip_register({'pc': '0x42'}, 'arm7') == int('42', 16)
     assert get_ip_register({}, 'arm7') == None
     assert get_ip_register({}, 'x86') == None
+
+
+def test_find_best_instructions():
+    meta = {'signal': 11, 'registers': {'pc': '0x1000'}}
+    addrs = ['0x1000', '0x2002', 8195, '12288']
+    for cpu_name in 'arm64', 'armv7', 'x86_64':
+        for m in None, meta:
+            expected = [
+                find_best_instruction(addr, cpu_name, m and dict(
+                    m, frame_number=idx))
+                for idx, addr in enumerate(addrs)
+            ]
+            assert find_best_instructions(addrs, cpu_name, m) == expected
+
+
+def test_parse_addrs():
+    assert parse_addrs(['0x10', u'0x20', 48, '64', None]) == \
+        [16, 32, 48, 64, 0]
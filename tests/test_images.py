@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import pytest
+
+from symsynd import images
+from symsynd.images import find_debug_images
+
+
+def test_find_debug_images_index(res_path, tmpdir, monkeypatch):
+    with open(os.path.join(res_path, 'crash-report.json')) as f:
+        report = json.load(f)
+    dsym_paths = [os.path.join(res_path, 'Crash-Tester.app.dSYM')]
+    index_dir = str(tmpdir)
+
+    monkeypatch.setattr(images, '_bundle_indexes', {})
+    rv = find_debug_images(dsym_paths, report['binary_images'],
+                           index_dir=index_dir)
+    assert rv == {749568: os.path.join(
+        dsym_paths[0], 'Contents', 'Resources', 'DWARF', 'Crash-Tester')}
+    assert len(tmpdir.listdir()) == 1
+
+    # A fresh process must not open the debug files again.
+    def fail(path):
+        raise AssertionError('debug file was opened')
+    monkeypatch.setattr(images, '_bundle_indexes', {})
+    monkeypatch.setattr(images.DebugInfo, 'open_path', staticmethod(fail))
+    assert find_debug_images(dsym_paths, report['binary_images'],
+                             index_dir=index_dir) == rv
+
+
+def test_image_lookup(monkeypatch):
+    lookup = images.ImageLookup([
+        {'image_addr': 4096, 'image_size': 4096, 'uuid': 'a'},
+        {'image_addr': '0x3000', 'uuid': 'b'},
+        {'image_addr': 8192, 'image_size': 1024, 'uuid': 'c'},
+    ])
+    addrs = [0, 4096, '0x1fff', 8192, 9216, 12287, 12288, 2 ** 63]
+    expected = [None, 'a', 'a', 'c', None, None, 'b', 'b']
+
+    def uuids(imgs):
+        return [img and img['uuid'] for img in imgs]
+
+    assert uuids(lookup.find_image(x) for x in addrs) == expected
+    assert uuids(lookup.find_images(addrs)) == expected
+    monkeypatch.setattr(images, 'numpy', None)
+    assert uuids(lookup.find_images(addrs)) == expected
+
+
+def test_file_prober(tmpdir):
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    paths = [str(tmpdir.mkdir(x)) for x in ('a', 'b', 'c')]
+    for path in paths[1:]:
+        with open(os.path.join(path, uuid), 'w') as f:
+            f.write('x')
+    binary_images = [{
+        'cpu_name': 'armv7',
+        'uuid': uuid.upper(),
+        'image_addr': 749568,
+    }]
+
+    prober = images.FileProber(concurrency=4, negative_ttl=600)
+    try:
+        rv = find_debug_images(paths, binary_images, prober=prober)
+        assert rv == {749568: os.path.join(paths[1], uuid)}
+
+        # Negative results are cached so new files are picked up only
+        # once the entry expires.
+        with open(os.path.join(paths[0], uuid), 'w') as f:
+            f.write('x')
+        assert find_debug_images(paths, binary_images, prober=prober) == rv
+        prober.cache.clear()
+        assert find_debug_images(paths, binary_images, prober=prober) == {
+            749568: os.path.join(paths[0], uuid)}
+    finally:
+        prober.close()
+
+
+def test_find_debug_images_probe_count(tmpdir, monkeypatch):
+    uuids = ['8094558b-3641-36f7-ba80-a1aaabcf72da',
+             '8094558b-3641-36f7-ba80-a1aaabcf72db']
+    paths = [str(tmpdir.mkdir(x)) for x in ('a', 'b')]
+    tmpdir.join('b', uuids[0]).write('x')
+    tmpdir.join('b', uuids[1] + '.gz').write('x')
+    binary_images = [{
+        'cpu_name': 'armv7',
+        'uuid': uuid,
+        'image_addr': idx,
+    } for idx, uuid in enumerate(uuids)]
+
+    checked = []
+    isfile = os.path.isfile
+
+    def counting_isfile(path):
+        checked.append(path)
+        return isfile(path)
+    monkeypatch.setattr(os.path, 'isfile', counting_isfile)
+
+    # Uncompressed files take one check per path
+    assert find_debug_images(paths, binary_images[:1]) == {
+        0: os.path.join(paths[1], uuids[0])}
+    assert len(checked) == 2
+
+    del checked[:]
+    assert find_debug_images(paths, binary_images[1:]) == {
+        1: os.path.join(paths[1], uuids[1] + '.gz')}
+    assert len(checked) == 4
+
+    del checked[:]
+    assert find_debug_images(paths, binary_images[1:],
+                             compressed=False) == {}
+    assert len(checked) == 2
+
+    prober = images.FileProber(concurrency=1)
+    try:
+        probed = []
+        probe = prober.probe
+
+        def counting_probe(paths):
+            probed.extend(paths)
+            return probe(paths)
+        monkeypatch.setattr(prober, 'probe', counting_probe)
+        assert find_debug_images(paths, binary_images[:1],
+                                 prober=prober) == {
+            0: os.path.join(paths[1], uuids[0])}
+        assert len(probed) == 2
+    finally:
+        prober.close()
+
+
+def test_find_debug_images_negative_cache(tmpdir):
+    from symsynd.cache import TTLCache
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    paths = [str(tmpdir)]
+    binary_images = [{
+        'cpu_name': 'armv7',
+        'uuid': uuid,
+        'image_addr': 749568,
+    }]
+
+    negative_cache = TTLCache(600)
+    assert find_debug_images(paths, binary_images,
+                             negative_cache=negative_cache) == {}
+    assert len(negative_cache) == 1
+
+    # Missing images are not looked for again until the entry expires.
+    tmpdir.join(uuid).write('x')
+    assert find_debug_images(paths, binary_images,
+                             negative_cache=negative_cache) == {}
+    negative_cache.clear()
+    assert find_debug_images(paths, binary_images,
+                             negative_cache=negative_cache) == {
+        749568: os.path.join(paths[0], uuid)}
+
+
+def test_find_debug_images_static_index(tmpdir):
+    indexed = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    uploaded = 'c1b3a6c0-c8d5-3ba0-8d45-8a0c9f5ed2a2'
+    tmpdir.join(uploaded).write('x')
+    index = {indexed: '/indexed/Crash-Tester'}
+    binary_images = [{
+        'cpu_name': 'armv7',
+        'uuid': uuid,
+        'image_addr': addr,
+    } for addr, uuid in ((4096, indexed), (8192, uploaded))]
+
+    # Files added after the index was built are still found
+    assert find_debug_images([str(tmpdir)], binary_images, index=index) == {
+        4096: '/indexed/Crash-Tester',
+        8192: str(tmpdir.join(uploaded)),
+    }
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is only available on linux')
+def test_debug_file_index(res_path, tmpdir):
+    from symsynd.watcher import DebugFileIndex
+
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    bundle = os.path.join(res_path, 'Crash-Tester.app.dSYM')
+    dwarf_file = os.path.join(bundle, 'Contents', 'Resources', 'DWARF',
+                              'Crash-Tester')
+    upload_path = tmpdir.mkdir('uploads')
+
+    def wait_for(func, expected):
+        for _ in range(100):
+            if func() == expected:
+                break
+            time.sleep(0.01)
+        assert func() == expected
+
+    with DebugFileIndex([str(upload_path), bundle]) as index:
+        assert index.get(uuid.upper()) == dwarf_file
+
+        tmp_fn = upload_path.join('.upload')
+        tmp_fn.write('x')
+        tmp_fn.rename(upload_path.join(uuid))
+        wait_for(lambda: index.get(uuid), str(upload_path.join(uuid)))
+        assert find_debug_images([], [{
+            'cpu_name': 'armv7',
+            'uuid': uuid,
+            'image_addr': 4096,
+        }], index=index) == {4096: str(upload_path.join(uuid))}
+
+        upload_path.join(uuid).remove()
+        wait_for(lambda: index.get(uuid), dwarf_file)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is only available on linux')
+def test_debug_file_index_lost_path(tmpdir, monkeypatch):
+    from symsynd import watcher
+    monkeypatch.setattr(watcher, '_retry_interval', 0.01)
+
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    upload_path = tmpdir.mkdir('uploads')
+    upload_path.join(uuid).write('x')
+
+    def wait_for(func, expected):
+        for _ in range(100):
+            if func() == expected:
+                break
+            time.sleep(0.01)
+        assert func() == expected
+
+    with watcher.DebugFileIndex([str(upload_path)]) as index:
+        assert index.get(uuid) == str(upload_path.join(uuid))
+
+        # Moving the folder away drops its files until it is back
+        upload_path.move(tmpdir.join('moved'))
+        wait_for(lambda: index.get(uuid), None)
+        tmpdir.join('moved').move(upload_path)
+        wait_for(lambda: index.get(uuid), str(upload_path.join(uuid)))
+
+        upload_path.remove()
+        wait_for(lambda: index.get(uuid), None)
+        upload_path.ensure(uuid)
+        wait_for(lambda: index.get(uuid), str(upload_path.join(uuid)))
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is only available on linux')
+def test_debug_file_index_error(tmpdir, monkeypatch):
+    from symsynd import watcher
+    monkeypatch.setattr(watcher, '_retry_interval', 0.01)
+
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    upload_path = tmpdir.mkdir('uploads')
+    process_events = watcher.DebugFileIndex._process_events
+    failures = []
+
+    def fail_once(self):
+        if not failures:
+            failures.append(True)
+            raise RuntimeError('broken')
+        return process_events(self)
+
+    monkeypatch.setattr(watcher.DebugFileIndex, '_process_events',
+                        fail_once)
+    with watcher.DebugFileIndex([str(upload_path)]) as index:
+        # The event is lost but the rescan after the error finds the file
+        upload_path.join(uuid).write('x')
+        for _ in range(100):
+            if index.get(uuid) is not None:
+                break
+            time.sleep(0.01)
+        assert failures
+        assert index.get(uuid) == str(upload_path.join(uuid))
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is only available on linux')
+def test_debug_file_index_order(res_path, tmpdir):
+    import shutil
+    from symsynd.watcher import DebugFileIndex
+
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    dwarf_file = os.path.join(res_path, 'Crash-Tester.app.dSYM', 'Contents',
+                              'Resources', 'DWARF', 'Crash-Tester')
+    first = tmpdir.mkdir('first')
+    second = tmpdir.mkdir('second')
+    bundle = tmpdir.mkdir('New.dSYM')
+    first.join(uuid + '.gz').write('x')
+    second.join(uuid).write('x')
+
+    def wait_for(func, expected):
+        for _ in range(100):
+            if func() == expected:
+                break
+            time.sleep(0.01)
+        assert func() == expected
+
+    paths = [str(first), str(second), str(bundle)]
+    with DebugFileIndex(paths) as index:
+        # Uncompressed files in any path win like in find_debug_images
+        assert index.get(uuid) == str(second.join(uuid))
+        assert find_debug_images(paths, [{
+            'cpu_name': 'armv7',
+            'uuid': uuid,
+            'image_addr': 4096,
+        }]) == {4096: index.get(uuid)}
+
+        # A bundle created later is picked up
+        first.join(uuid + '.gz').remove()
+        second.join(uuid).remove()
+        dwarf_base = bundle.join('Contents', 'Resources', 'DWARF')
+        dwarf_base.ensure(dir=True)
+        shutil.copy(dwarf_file, str(dwarf_base.join('Crash-Tester')))
+        wait_for(lambda: index.get(uuid), str(dwarf_base.join('Crash-Tester')))
@@ -0,0 +1,21 @@
+import sys
+import subprocess
+
+
+def test_lazy_imports():
+    code = '\n'.join([
+        'import sys, symsynd',
+        'assert symsynd.parse_addr("0x10") == 16',
+        'assert "symsynd.libdebug" not in sys.modules',
+        'assert "symsynd.libsymbolizer" not in sys.modules',
+        'assert "symsynd.demangle" not in sys.modules',
+    ])
+    subprocess.check_call([sys.executable, '-c', code])
+
+
+def test_public_names():
+    import symsynd
+    from symsynd.symbolizer import Symbolizer
+    assert symsynd.Symbolizer is Symbolizer
+    for name in symsynd.__all__:
+        assert getattr(symsynd, name) is not None
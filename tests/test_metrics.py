@@ -0,0 +1,71 @@
+import pytest
+from symsynd import metrics
+
+
+@pytest.fixture
+def enabled_metrics(request):
+    exported = []
+    metrics.reset()
+    metrics.enable(exporter=exported.append, interval=None)
+
+    @request.addfinalizer
+    def cleanup():
+        metrics.disable()
+        metrics.reset()
+
+    return exported
+
+
+def test_disabled_metrics():
+    metrics.reset()
+    with metrics.timed('test'):
+        pass
+    metrics.incr('test')
+    assert metrics.get_stats() == {'counters': {}, 'sections': {}}
+
+
+def test_metrics_histogram(enabled_metrics):
+    for x in range(1, 101):
+        metrics.record('test', x / 1000.0)
+    metrics.incr('test', 2)
+    with metrics.timed('block'):
+        pass
+
+    stats = metrics.get_stats()
+    assert stats['counters'] == {'test': 2}
+    section = stats['sections']['test']
+    assert section['count'] == 100
+    assert section['max'] == 0.1
+    assert 0.049 <= section['p50'] <= 0.053
+    assert 0.098 <= section['p99'] <= 0.1
+    assert stats['sections']['block']['count'] == 1
+
+    metrics.flush()
+    assert enabled_metrics == [metrics.get_stats()]
+
+
+def test_metrics_export_once(request, monkeypatch):
+    import time
+    import threading
+    now = [1000.0]
+    monkeypatch.setattr(metrics, '_monotonic', lambda: now[0])
+    exported = []
+
+    def slow_exporter(stats):
+        time.sleep(0.05)
+        exported.append(stats)
+
+    metrics.reset()
+    metrics.enable(exporter=slow_exporter, interval=10)
+    request.addfinalizer(metrics.disable)
+    request.addfinalizer(metrics.reset)
+
+    now[0] += 11
+    threads = [threading.Thread(target=metrics.incr, args=('test',))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Only one of the threads exports once the interval passed
+    assert len(exported) == 1
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import threading
+
+import pytest
+
+from symsynd.symbolizer import Symbolizer
+from symsynd.cache import LRUCache
+from symsynd.prefork import Prefork, preload, after_fork
+
+
+def test_preload_and_fork(res_path, tmpdir):
+    dsym_path = os.path.join(res_path, 'Crash-Tester.app.dSYM')
+    symbolizer = Symbolizer(cache=LRUCache(max_entries=100))
+    index = preload(symbolizer, [dsym_path], cpu_names=['armv7'])
+    dwarf_path = index['8094558b-3641-36f7-ba80-a1aaabcf72da']
+    assert dwarf_path.endswith('/Crash-Tester')
+    assert symbolizer.stats()['images'] == 1
+
+    def work(worker_id):
+        rv = symbolizer.symbolize(dwarf_path, 16384, 749568, 782745,
+                                  'armv7')
+        tmpdir.join('worker-%d.json' % worker_id).write(json.dumps(rv))
+
+    pool = Prefork(work, workers=2, symbolizer=symbolizer)
+    pool.start()
+    pool.wait()
+
+    for worker_id in range(2):
+        rv = json.loads(tmpdir.join('worker-%d.json' % worker_id).read())
+        assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+        assert rv['lineno'] == 96
+    symbolizer.close()
+
+
+def test_after_fork_replaces_locks():
+    cache = LRUCache()
+    lock = cache._lock
+    lock.acquire()
+    after_fork(cache)
+    assert cache._lock is not lock
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+
+def test_respawn_backoff(tmpdir):
+    starts = tmpdir.join('starts')
+
+    def work(worker_id):
+        starts.write('x', mode='a')
+        os._exit(1)
+
+    pool = Prefork(work, workers=1)
+    pool.backoff = 0.05
+    pool.max_backoff = 0.2
+    pool.start()
+    timer = threading.Timer(1.0, pool.stop)
+    timer.start()
+    try:
+        pool.wait()
+    finally:
+        timer.cancel()
+
+    # Without the backoff the worker would be replaced in a tight loop
+    assert 3 <= len(starts.read()) <= 12
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is only available on linux')
+def test_debug_file_index_after_fork(tmpdir):
+    from symsynd.watcher import DebugFileIndex
+
+    uuid = '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    upload_path = tmpdir.mkdir('uploads')
+    found = tmpdir.join('found')
+
+    with DebugFileIndex([str(upload_path)]) as index:
+        def work(worker_id):
+            upload_path.join(uuid).write('x')
+            for _ in range(100):
+                if index.get(uuid) is not None:
+                    break
+                time.sleep(0.01)
+            found.write(str(index.get(uuid)))
+
+        pool = Prefork(work, workers=1, index=index)
+        pool.start()
+        pool.wait()
+
+    assert found.read() == str(upload_path.join(uuid))
@@ -1,5 +1,6 @@
 import os
 import json
+import time
 import pytest
 
 
@@ -145,3 +146,20 @@ def test_basic_report(res_path, make_report_sym):
          u'symbol_addr': 893569708,
          u'symbol_name': u'<redacted>'}
     ]
+
+
+def test_report_deadline(res_path, make_report_sym):
+    with open(os.path.join(res_path, 'crash-report.json')) as f:
+        report = json.load(f)
+
+    dsym_path = os.path.join(res_path, 'Crash-Tester.app.dSYM')
+    rep = make_report_sym([dsym_path], report['binary_images'])
+    for thread in report['crash']['threads']:
+        if thread['crashed']:
+            backtrace = thread['backtrace']['contents']
+
+    bt = rep.symbolize_backtrace(backtrace, deadline=time.time() - 1)
+    assert len(bt) == len(backtrace)
+    marked = [x for x in bt if x.get('deadline_exceeded')]
+    assert marked
+    assert all('line' not in x for x in marked)
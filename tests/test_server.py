@@ -0,0 +1,116 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from symsynd.server import Server, Client, RemoteError
+from symsynd.exceptions import SymbolicationError
+
+
+@pytest.fixture
+def client(request, tmpdir, driver, res_path):
+    path = str(tmpdir.join('symsynd.sock'))
+    server = Server(path, driver,
+                    [os.path.join(res_path, 'Crash-Tester.app.dSYM')])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    rv = Client(path)
+
+    def cleanup():
+        rv.close()
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(cleanup)
+    return rv
+
+
+def test_symbolize_frames(client, res_path):
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    frame = {
+        'dsym_path': dsym_path,
+        'image_vmaddr': 16384,
+        'image_addr': 749568,
+        'instruction_addr': 782745,
+        'cpu_name': 'armv7',
+    }
+    rv = client.symbolize_frames([frame, dict(frame, cpu_name='invalid')])
+    assert rv[0]['symbol'] == '-[Crasher throwUncaughtNSException]'
+    assert rv[0]['lineno'] == 96
+    assert isinstance(rv[1], SymbolicationError)
+
+
+def test_pipeline(client):
+    client.ping()
+    stats, frames = client.pipeline([
+        client.request('stats'),
+        client.request('symbolize_frames', frames=[]),
+    ])
+    assert stats['images'] == 0
+    assert frames == []
+    with pytest.raises(RemoteError):
+        client.pipeline([client.request('unknown')])
+
+
+def test_large_pipeline(client):
+    frames = [{
+        'dsym_path': '/missing/%d' % idx,
+        'image_addr': 4096,
+        'instruction_addr': 4096 + idx,
+        'cpu_name': 'armv7',
+    } for idx in range(2000)]
+    # Far more than fits into the socket buffers in either direction
+    responses = client.pipeline([
+        client.request('symbolize_frames', frames=frames)
+        for _ in range(20)])
+    assert len(responses) == 20
+    assert all(len(x) == 2000 for x in responses)
+    assert isinstance(responses[0][0], SymbolicationError)
+
+
+def test_socket_in_use(client, driver):
+    with pytest.raises(socket.error):
+        Server(client.path, driver)
+    client.ping()
+
+
+def test_stale_socket(tmpdir, driver):
+    path = str(tmpdir.join('symsynd.sock'))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+    server = Server(path, driver)
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+def test_outside_search_paths(client, tmpdir):
+    frame = {
+        'dsym_path': str(tmpdir.join('Crash-Tester')),
+        'image_addr': 4096,
+        'instruction_addr': 4096,
+        'cpu_name': 'armv7',
+    }
+    rv = client.symbolize_frames([frame])
+    assert isinstance(rv[0], SymbolicationError)
+    assert 'search paths' in rv[0].message
+    with pytest.raises(RemoteError):
+        client.symbolize_reports([], dsym_paths=[str(tmpdir)])
+    assert os.stat(client.path).st_mode & 0o777 == 0o600
+
+
+def test_invalid_request(client):
+    from symsynd.server import encode_frame, read_frame
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(client.path)
+        sock.sendall(encode_frame([]))
+        assert read_frame(sock)['type'] == 'ProtocolError'
+        # The connection stays usable
+        sock.sendall(encode_frame({'id': 1, 'op': 'ping'}))
+        assert read_frame(sock) == {'id': 1}
+    finally:
+        sock.close()
@@ -0,0 +1,49 @@
+import os
+import struct
+
+from symsynd.libdebug import DebugInfo
+from symsynd.slim import slim_debug_file, iter_slices
+
+
+def test_slim_debug_file(res_path, tmpdir, driver):
+    dwarf_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    rv = slim_debug_file(dwarf_path, str(tmpdir))
+    assert sorted(rv) == [
+        '8094558b-3641-36f7-ba80-a1aaabcf72da',
+        'f502dec3-e605-36fd-9b3d-7080a7c6f4fc',
+    ]
+
+    slim_path = rv['8094558b-3641-36f7-ba80-a1aaabcf72da']
+    assert os.path.getsize(slim_path) < os.path.getsize(dwarf_path) / 2
+
+    di = DebugInfo.open_path(slim_path)
+    variants = di.get_variants()
+    di.close()
+    assert len(variants) == 1
+    assert variants[0].cpu_name == 'armv7'
+    assert str(variants[0].uuid) == '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    assert variants[0].vmaddr == 16384
+
+    for addr in 782745, 801763:
+        expected = driver.symbolize(dwarf_path, 16384, 749568, addr,
+                                    'armv7', symbolize_inlined=True)
+        actual = driver.symbolize(slim_path, 16384, 749568, addr,
+                                  'armv7', symbolize_inlined=True)
+        assert actual == expected
+
+
+def test_slim_single_arch(res_path, tmpdir):
+    dwarf_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    rv = slim_debug_file(dwarf_path, str(tmpdir), cpu_names=['arm64'])
+    assert list(rv) == ['f502dec3-e605-36fd-9b3d-7080a7c6f4fc']
+
+
+def test_iter_slices_fat_64():
+    data = struct.pack('>II', 0xcafebabf, 2) + \
+        struct.pack('>iiQQII', 12, 9, 4096, 100, 14, 0) + \
+        struct.pack('>iiQQII', 0x100000c, 0, 8192, 200, 14, 0)
+    assert list(iter_slices(data)) == [(4096, 100), (8192, 200)]
@@ -0,0 +1,313 @@
+import os
+import time
+import pytest
+from symsynd.exceptions import SymbolicationError
+
+
+def test_symbolize_frames(res_path, driver):
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+
+    def make_frame(addr, cpu_name='armv7'):
+        return {
+            'dsym_path': dsym_path,
+            'image_vmaddr': 16384,
+            'image_addr': 749568,
+            'instruction_addr': addr,
+            'cpu_name': cpu_name,
+        }
+
+    frames = [make_frame(x) for x in (801763, 782745, 801763, 782745)]
+    frames.append(make_frame(782745, cpu_name='invalid'))
+    rv = driver.symbolize_frames(frames, symbolize_inlined=True)
+
+    assert len(rv) == 5
+    assert rv[0] == rv[2]
+    assert rv[0] is not rv[2]
+    assert rv[1] == rv[3]
+    assert rv[0][-1]['symbol'] == 'main'
+    assert rv[0][-1]['lineno'] == 17
+    assert rv[1][0]['symbol'] == '-[Crasher throwUncaughtNSException]'
+    assert rv[1][0]['lineno'] == 96
+    assert isinstance(rv[4], SymbolicationError)
+
+    for frame, result in zip(frames[:4], rv):
+        assert driver.symbolize(symbolize_inlined=True, **frame) == result
+
+
+def test_module_timings(res_path):
+    from symsynd.symbolizer import Symbolizer
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+
+    with Symbolizer(timing=True) as symbolizer:
+        assert symbolizer.get_module_timings() == []
+        for addr in 782745, 801763:
+            symbolizer.symbolize(dsym_path, 16384, 749568, addr, 'armv7')
+        timings = symbolizer.get_module_timings()
+
+    assert len(timings) == 1
+    timing = timings[0]
+    assert timing['dsym_path'] == dsym_path
+    assert timing['cpu_name'] == 'armv7'
+    assert timing['lookup_count'] == 2
+    assert timing['load'] > 0
+    assert timing['open'] > 0
+    assert timing['lookup'] >= timing['first_lookup']
+    assert timing['lookup'] >= timing['max_lookup']
+
+
+def test_stats(res_path):
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.cache import LRUCache
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+
+    with Symbolizer(cache=LRUCache(max_entries=10)) as symbolizer:
+        symbolizer.symbolize(dsym_path, 16384, 749568, 782745, 'armv7')
+        stats = symbolizer.stats()
+
+    assert stats['images'] == 1
+    assert stats['cache']['entries'] == 1
+    debug_info, = stats['debug_infos']
+    assert debug_info['dsym_path'] == dsym_path
+    assert debug_info['mapped_bytes'] == os.path.getsize(dsym_path)
+    module, = stats['modules']
+    assert module['dsym_path'] == dsym_path
+    assert module['mapped_bytes'] == os.path.getsize(dsym_path)
+    assert stats['mapped_bytes'] == 2 * os.path.getsize(dsym_path)
+    cpu, = module['cpus']
+    assert cpu['cpu_name'] == 'armv7'
+    assert cpu['uuid'] == '8094558b-3641-36f7-ba80-a1aaabcf72da'
+    # The heap is only sampled with timing enabled
+    assert cpu['heap_bytes'] is None
+
+
+def test_lazy_frames(res_path):
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.libsymbolizer import Frame
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+
+    with Symbolizer() as symbolizer:
+        expected = symbolizer.symbolize(dsym_path, 16384, 749568, 782745,
+                                        'armv7', symbolize_inlined=True)
+    with Symbolizer(lazy_frames=True) as symbolizer:
+        frames = symbolizer.symbolize(dsym_path, 16384, 749568, 782745,
+                                      'armv7', symbolize_inlined=True)
+        assert all(isinstance(x, Frame) for x in frames)
+        assert frames == expected
+        assert [dict(x) for x in frames] == expected
+        assert frames[0]['symbol'] == expected[0]['symbol']
+        assert frames[0].get('missing') is None
+        # Repeated paths are shared
+        assert frames[0]['abs_path'] is frames[0].abs_path
+
+        frame = symbolizer.symbolize(dsym_path, 16384, 749568, 801763,
+                                     'armv7', symbolize_inlined=True)[0]
+    # The symbolizer is closed, the filename can no longer be looked up
+    assert frame['filename'] is None
+    assert frame['abs_path'].endswith('main.m')
+
+
+def test_negative_cache(tmpdir):
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.cache import TTLCache
+    dsym_path = str(tmpdir.join('missing'))
+
+    with Symbolizer(negative_cache=TTLCache(600)) as symbolizer:
+        err = symbolizer.try_symbolize(dsym_path, 16384, 749568, 782745,
+                                       'armv7')
+        assert isinstance(err, IOError)
+        with pytest.raises(IOError):
+            symbolizer.symbolize(dsym_path, 16384, 749568, 782745, 'armv7')
+
+        # The error is remembered even if the file shows up
+        tmpdir.join('missing').write('x')
+        rv = symbolizer.try_symbolize(dsym_path, 16384, 749568, 782745,
+                                      'armv7')
+        assert rv is not err
+        assert rv.__class__ is err.__class__
+        assert rv.args == err.args
+        assert symbolizer.stats()['negative_cache']['hits'] == 2
+
+
+def test_deadline(res_path):
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.exceptions import DeadlineExceeded
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    frame = {
+        'dsym_path': dsym_path,
+        'image_vmaddr': 16384,
+        'image_addr': 749568,
+        'instruction_addr': 782745,
+        'cpu_name': 'armv7',
+    }
+
+    with Symbolizer() as symbolizer:
+        with pytest.raises(DeadlineExceeded):
+            symbolizer.symbolize(dsym_path, 16384, 749568, 782745, 'armv7',
+                                 deadline=time.time() - 1)
+
+        # The module keeps loading in the background
+        rv = symbolizer.symbolize_frames([frame], deadline=time.time() + 60)
+        assert rv[0]['symbol'] == '-[Crasher throwUncaughtNSException]'
+
+
+def test_deadline_slow_module(res_path, tmpdir, monkeypatch):
+    import shutil
+    import threading
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.libsymbolizer import Symbolizer as LowLevelSymbolizer
+    from symsynd.exceptions import DeadlineExceeded
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    slow_path = str(tmpdir.join('Slow'))
+    shutil.copy(dsym_path, slow_path)
+    args = (16384, 749568, 782745, 'armv7')
+
+    loading = threading.Event()
+    release = threading.Event()
+    preload = LowLevelSymbolizer.preload
+
+    def slow_preload(self, path, cpu_name):
+        if path == slow_path:
+            loading.set()
+            release.wait(10)
+        return preload(self, path, cpu_name)
+
+    monkeypatch.setattr(LowLevelSymbolizer, 'preload', slow_preload)
+
+    with Symbolizer() as symbolizer:
+        symbolizer.symbolize(dsym_path, *args)
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            symbolizer.try_symbolize(slow_path, *args,
+                                     deadline=time.time() + 30)))
+        thread.start()
+        try:
+            assert loading.wait(10)
+            # Lookups in a warm module do not wait for the slow one
+            rv = symbolizer.symbolize(dsym_path, *args,
+                                      deadline=time.time() + 5)
+            assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+            with pytest.raises(DeadlineExceeded):
+                symbolizer.symbolize(slow_path, *args,
+                                     deadline=time.time() + 0.1)
+        finally:
+            release.set()
+            thread.join()
+
+        assert results[0]['symbol'] == '-[Crasher throwUncaughtNSException]'
+
+
+def test_replaced_image(res_path, tmpdir):
+    import shutil
+    from symsynd.symbolizer import Symbolizer
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    path = tmpdir.join('Crash-Tester')
+    shutil.copy(dsym_path, str(path))
+    args = (16384, 749568, 782745, 'armv7')
+
+    with Symbolizer(max_images=1, check_interval=0) as symbolizer:
+        rv = symbolizer.symbolize(str(path), *args)
+        assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+        symbolizer.symbolize(dsym_path, *args)
+        assert symbolizer.stats()['images'] == 1
+
+        # A replaced debug file is loaded again
+        path.write('invalid')
+        path.setmtime(path.mtime() + 10)
+        with pytest.raises(SymbolicationError):
+            symbolizer.symbolize(str(path), *args)
+
+
+def test_image_check_interval(res_path, monkeypatch):
+    from symsynd import symbolizer as symbolizer_module
+    from symsynd.cache import LRUCache
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    args = (16384, 749568, 782745, 'armv7')
+
+    checked = []
+    get_file_stamp = symbolizer_module._get_file_stamp
+
+    def counting_get_file_stamp(path):
+        checked.append(path)
+        return get_file_stamp(path)
+
+    monkeypatch.setattr(symbolizer_module, '_get_file_stamp',
+                        counting_get_file_stamp)
+
+    with symbolizer_module.Symbolizer(cache=LRUCache(),
+                                      check_interval=600) as symbolizer:
+        rv = symbolizer.symbolize(dsym_path, *args)
+        loaded = len(checked)
+        # Repeated lookups and cache hits do not touch the file system
+        for _ in range(3):
+            assert symbolizer.symbolize(dsym_path, *args) == rv
+        assert len(checked) == loaded
+
+        symbolizer.check_interval = 0
+        assert symbolizer.symbolize(dsym_path, *args) == rv
+        assert len(checked) == loaded + 1
+
+
+def test_evicted_image_closes_module(res_path, tmpdir):
+    import shutil
+    from symsynd.symbolizer import Symbolizer
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    paths = []
+    for name in 'a', 'b':
+        paths.append(str(tmpdir.join(name)))
+        shutil.copy(dsym_path, paths[-1])
+    args = (16384, 749568, 782745, 'armv7')
+
+    with Symbolizer(max_images=1) as symbolizer:
+        for path in paths:
+            rv = symbolizer.symbolize(path, *args)
+            assert rv['symbol'] == '-[Crasher throwUncaughtNSException]'
+        stats = symbolizer.stats()
+        assert stats['images'] == 1
+        assert [x['dsym_path'] for x in stats['modules']] == paths[1:]
+        assert [x['dsym_path'] for x in stats['debug_infos']] == paths[1:]
+
+        # The module is loaded again when needed
+        assert symbolizer.symbolize(paths[0], *args) == rv
+
+
+def test_lazy_frames_shared(res_path):
+    from symsynd.symbolizer import Symbolizer
+    from symsynd.libsymbolizer import Frame
+    from symsynd.cache import LRUCache
+    dsym_path = os.path.join(
+        res_path, 'Crash-Tester.app.dSYM', 'Contents', 'Resources',
+        'DWARF', 'Crash-Tester')
+    frames = [{
+        'dsym_path': dsym_path,
+        'image_vmaddr': 16384,
+        'image_addr': 749568,
+        'instruction_addr': addr,
+        'cpu_name': 'armv7',
+    } for addr in (782745, 801763, 782745)]
+
+    with Symbolizer(lazy_frames=True, cache=LRUCache()) as symbolizer:
+        rv = symbolizer.symbolize_frames(frames)
+        assert all(isinstance(x, Frame) for x in rv)
+        # Read-only frames are shared rather than copied
+        assert rv[0] is rv[2]
+        assert symbolizer.symbolize_frames(frames[:1])[0] is rv[0]
+        assert rv[0]['symbol'] == '-[Crasher throwUncaughtNSException]'